@@ -70,23 +70,20 @@
 		json_input["energyEfficienciesSettings"]["calculateIdealYield"] = False
 		json_input["energyEfficienciesSettings"]["turbineFlowAndPerformanceMatrixOutputSettings"] = {}
 		
-		# Call API to compute blockages:
-		# BEET 
-		json_input['energyEfficienciesSettings']['blockageModel']['blockageModelType'] = "BEET" 
-		json_input['energyEfficienciesSettings']['blockageModel']['beet']['blockageCorrectionApplicationMethod'] = blockage_correction_application_method
+		# Build one payload per blockage model, so the three calls are independent and can run at the same time:
 		# BEET Stable conditions
-		json_input["energyEfficienciesSettings"]["blockageModel"]["beet"]["significantAtmosphericStability"] = True
-		beet_stable_results, beet_stable_correction_efficiency = self.post_request(baseUrl + "AnnualEnergyProduction", json_input, "BEET-stable", results_folder, client, blockage_correction_application_method)
+		beet_stable_input = self.get_beet_input(json_input, True, blockage_correction_application_method)
 		# BEET Unstable conditions
-		json_input["energyEfficienciesSettings"]["blockageModel"]["beet"]["significantAtmosphericStability"] = False
-		beet_unstable_results, beet_unstable_correction_efficiency = self.post_request(baseUrl + "AnnualEnergyProduction", json_input, "BEET-unstable-neutral", results_folder, client, blockage_correction_application_method)
+		beet_unstable_input = self.get_beet_input(json_input, False, blockage_correction_application_method)
+		# CFD.ML blockage
+		cfdml_input = self.get_cfdml_input(json_input, gnn_type, blockage_correction_application_method)
 		
-		# CFD.ML blockage 
-		json_input['energyEfficienciesSettings']['blockageModel']['blockageModelType'] = "CFDML" 
-		json_input['energyEfficienciesSettings']['blockageModel']['cfdml']['blockageCorrectionApplicationMethod'] = blockage_correction_application_method
-		json_input["energyEfficienciesSettings"]["blockageModel"]["cfdml"]["cfdmlBlockageWindSpeedDependency"] = "FromBlockageExtrapolationCurve" 
-		json_input["energyEfficienciesSettings"]["blockageModel"]["cfdml"]["cfdmlSettings"]["gnnType"] = gnn_type		
-		cfdml_results, cfdml_correction_efficiency = self.post_request(baseUrl + "AnnualEnergyProduction", json_input, "CFD.ML", results_folder, client, blockage_correction_application_method)
+		# Call API to compute blockages, all models concurrently - the total time is close to that of the slowest model
+		model_inputs = [("BEET-stable", beet_stable_input), ("BEET-unstable-neutral", beet_unstable_input), ("CFD.ML", cfdml_input)]
+		results = self.post_requests(baseUrl + "AnnualEnergyProduction", model_inputs, results_folder, client, blockage_correction_application_method)
+		beet_stable_results, beet_stable_correction_efficiency = results["BEET-stable"]
+		beet_unstable_results, beet_unstable_correction_efficiency = results["BEET-unstable-neutral"]
+		cfdml_results, cfdml_correction_efficiency = results["CFD.ML"]
 		
 		# Report results to word
 		table = "Model \tAtmospheric Stability \tOnshore\\Offshore \tBlockage Correction Efficiency [%]"
@@ -102,6 +99,25 @@
 		Toolbox.MeasurementCampaign.FlushReport( report_name )
 
 
+	def get_beet_input(self, json_input, significant_atmospheric_stability, blockage_correction_application_method):
+		import json
+		# copy via json so each payload owns its settings and the calls can't interfere with each other
+		beet_input = json.loads(json.dumps(json_input))
+		beet_input['energyEfficienciesSettings']['blockageModel']['blockageModelType'] = "BEET"
+		beet_input['energyEfficienciesSettings']['blockageModel']['beet']['blockageCorrectionApplicationMethod'] = blockage_correction_application_method
+		beet_input["energyEfficienciesSettings"]["blockageModel"]["beet"]["significantAtmosphericStability"] = significant_atmospheric_stability
+		return beet_input
+
+	def get_cfdml_input(self, json_input, gnn_type, blockage_correction_application_method):
+		import json
+		# copy via json so each payload owns its settings and the calls can't interfere with each other
+		cfdml_input = json.loads(json.dumps(json_input))
+		cfdml_input['energyEfficienciesSettings']['blockageModel']['blockageModelType'] = "CFDML"
+		cfdml_input['energyEfficienciesSettings']['blockageModel']['cfdml']['blockageCorrectionApplicationMethod'] = blockage_correction_application_method
+		cfdml_input["energyEfficienciesSettings"]["blockageModel"]["cfdml"]["cfdmlBlockageWindSpeedDependency"] = "FromBlockageExtrapolationCurve"
+		cfdml_input["energyEfficienciesSettings"]["blockageModel"]["cfdml"]["cfdmlSettings"]["gnnType"] = gnn_type
+		return cfdml_input
+
 	def get_blockage_efficiency(self, results_dict, blockage_correction_application_method):
 		if blockage_correction_application_method == "OnEnergy":
 			blockage_correction_efficiency = float(results_dict['weightedBlockageEfficiency'])
@@ -113,27 +129,59 @@
 			Toolbox.Log("blockage_correction_application_method not recognised", LogLevel.Error)
 		return blockage_correction_efficiency    
 
-	# Function to make a POST request and return the result as a dictionary
-	def post_request (self, url, json_input, model_name, results_folder, httpclient, blockage_correction_application_method):
+	# Function to make concurrent POST requests, streaming each response to a results file, and return the results as dictionaries
+	def post_requests (self, url, model_inputs, results_folder, httpclient, blockage_correction_application_method):
 		# imports
 		clr.AddReference('System.Net.Http')
-		from System.Net.Http import StringContent
-		from System import Uri
+		from System.Net.Http import StringContent, HttpRequestMessage, HttpMethod, HttpCompletionOption
+		from System.Threading.Tasks import Task, TaskStatus
+		from System.IO import File
+		from System import Uri, Array
 		from System.Text import Encoding
 		import os
 		import json
 		
-		payload =  StringContent(json.dumps(json_input), Encoding.UTF8, "application/json")
-		postResponse_task =  httpclient.PostAsync(Uri(url), payload)
-		postResponse_task.Wait()
-		postResponseContent_task =  postResponse_task.Result.Content.ReadAsStringAsync()
-		postResponseContent_task.Wait()
-		postResponseContent = postResponseContent_task.Result
-		results_json = json.loads(postResponseContent)
-		results_file_path = os.path.join(results_folder, "{0}BlockageResults.json".format(model_name) )
-		with open(results_file_path, "w") as f:
-			f.write(json.dumps(results_json, indent=1))
-		# compute the correction efficiency	
-		correction_efficiency = self.get_blockage_efficiency(results_json, blockage_correction_application_method)
-		Toolbox.Log("{0} Blockage correction efficiencies= {1:.3f}%\t results written to file:\t{2}".format(model_name, correction_efficiency*100, results_file_path))
-		return results_json, correction_efficiency
+		# start all requests without waiting, reading only the headers so the response bodies are not buffered in memory
+		post_tasks = []
+		file_streams = []
+		results_file_paths = []
+		try:
+			for model_name, json_input in model_inputs:
+				request = HttpRequestMessage(HttpMethod.Post, Uri(url))
+				request.Content = StringContent(json.dumps(json_input), Encoding.UTF8, "application/json")
+				post_tasks.append(httpclient.SendAsync(request, HttpCompletionOption.ResponseHeadersRead))
+			Task.WaitAll(Array[Task](post_tasks))
+
+			# stream every response body straight to its results file
+			copy_tasks = []
+			for (model_name, json_input), post_task in zip(model_inputs, post_tasks):
+				response = post_task.Result
+				if not response.IsSuccessStatusCode:
+					message = "{0} blockage calculation failed with response {1} - {2}".format(model_name, int(response.StatusCode), response.ReasonPhrase)
+					Toolbox.Log(message, LogLevel.Error)
+					raise Exception(message)
+				results_file_path = os.path.join(results_folder, "{0}BlockageResults.json".format(model_name) )
+				results_file_paths.append(results_file_path)
+				content_stream_task = response.Content.ReadAsStreamAsync()
+				content_stream_task.Wait()
+				file_stream = File.Create(results_file_path)
+				file_streams.append(file_stream)
+				copy_tasks.append(content_stream_task.Result.CopyToAsync(file_stream))
+			Task.WaitAll(Array[Task](copy_tasks))
+		finally:
+			# close the results files and responses whether or not every call succeeded
+			for file_stream in file_streams:
+				file_stream.Dispose()
+			for post_task in post_tasks:
+				if post_task.Status == TaskStatus.RanToCompletion:
+					post_task.Result.Dispose()
+
+		results = {}
+		for (model_name, json_input), results_file_path in zip(model_inputs, results_file_paths):
+			with open(results_file_path, "r") as f:
+				results_json = json.load(f)
+			# compute the correction efficiency
+			correction_efficiency = self.get_blockage_efficiency(results_json, blockage_correction_application_method)
+			Toolbox.Log("{0} Blockage correction efficiencies= {1:.3f}%\t results written to file:\t{2}".format(model_name, correction_efficiency*100, results_file_path))
+			results[model_name] = (results_json, correction_efficiency)
+		return results
\ No newline at end of file
@@ -30,21 +30,12 @@ def index3D(i, j, k, nx, ny):
 def index2D(i, j, nx):
     return i + nx*j
 
-def parse_noise_results_and_store(wfWorkbook, receptors, receptors_as_dict, turbines_as_dict, mode_idx, n_modes, n_turbines, noise_per_mode_from_turbine_for_receptors):
-    for result in wfWorkbook.CurrentScenario.Noise.Results.ReceptorResults:
-        if result.Name not in receptors:
-            continue
-                        
-        receptor_idx = receptors_as_dict[result.Name]								
-        
-        # Loop through noise 
-        for turb_contrib in result.TurbineSourceContibutions:
-            if turb_contrib.Name not in turbines_as_dict:
-                continue # neighbours
-            turbine_idx = turbines_as_dict[turb_contrib.Name]	
-            # Store result as Sound pressure				
-            sp = pow(10.0, 0.1* turb_contrib.NoiseContribution)            
-            noise_per_mode_from_turbine_for_receptors[index3D(mode_idx, turbine_idx, receptor_idx, n_modes, n_turbines)] = sp
+def parse_noise_results_and_store(wfWorkbook, receptors, turbines, mode_idx, n_modes, noise_per_mode_from_turbine_for_receptors):
+    from windfarmer.noise import get_noise_contribution_levels, to_sound_pressure, store_mode_sound_pressure
+    # Noise from each turbine at each receptor, receptors x turbines, neighbours are excluded by only reading the listed turbines
+    _, _, levels = get_noise_contribution_levels(wfWorkbook.CurrentScenario.Noise.Results, receptors, turbines)
+    # Store result as Sound pressure
+    store_mode_sound_pressure(noise_per_mode_from_turbine_for_receptors, to_sound_pressure(levels), mode_idx, n_modes)
 
 def run_energy_calculation(wfWorkbook, wfToolbox):
     wfWorkbook.ModelSettings.EnergySettings.CalculateEfficiencies = False
@@ -56,11 +47,12 @@ def run_energy_calculation(wfWorkbook, wfToolbox):
     scenario = wfToolbox.CalculateEnergy()
     return scenario
 
-def parse_energy_results_and_store(scenario, turbines, turbines_as_dict, mode_idx, n_modes, gross_per_mode_per_turbine):
-    for rot in iter([t for t in scenario.Turbines if t.Name in turbines]):
-        gross = scenario.TurbineTotalYields.GetVariantResult("Gross").GetValueForTurbine(rot).Value
-        turbine_idx = turbines_as_dict[rot.Name]
-        gross_per_mode_per_turbine[index2D(mode_idx, turbine_idx, n_modes)] = gross/1e6
+def parse_energy_results_and_store(wf, scenario, turbines, mode_idx, n_modes, gross_per_mode_per_turbine):
+    import numpy as np
+    # Gross of all the turbines in one pass, in MWh/yr and in the order of turbines
+    names, yields = wf.get_turbine_yields(scenario, variants=("Gross",), turbine_names=turbines, as_dataframe=False)
+    # index2D(mode_idx, turbine_idx, n_modes) over all turbines is the slice [mode_idx::n_modes]
+    gross_per_mode_per_turbine[mode_idx::n_modes] = np.nan_to_num(yields[:, 0]).tolist()
 
 def check_strategy_for_all_receptors(strategy, receptors, receptors_as_dict, n_turbines, modes_as_dict, n_modes, noise_per_mode_from_turbine_for_receptors, noise_limit):
     import math
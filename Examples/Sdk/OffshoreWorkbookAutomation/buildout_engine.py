@@ -0,0 +1,258 @@
+# Build-out engine for exploring neighbouring lease area combinations offshore
+#
+# The layout generated on a lease area doesn't depend on which other lease areas are built, so rather than regenerating
+# every layout for every build-out combination, as the notebook loop does, this:
+#  1. generates the close packed layout of each lease area once and caches its turbines (name, location and type)
+#  2. evaluates the combinations in parallel SDK worker processes, each with its own WindFarmer instance and copy of the
+#     workbook, rebuilding the neighbour farms from the cache; only the farms that change between consecutive cases are
+#     touched, and each worker's cases are taken in Gray code order so a single farm changes between them
+#  3. appends each result to a csv file as soon as it is ready, so an interrupted run can be resumed
+#
+# This module doesn't import the SDK at the top, as the worker processes start without it. Each worker initialises its
+# own windfarmer.sdk.Sdk, so each needs a WindFarmer licence seat; set n_workers accordingly.
+import os
+import json
+import itertools
+import multiprocessing
+import pandas as pd
+
+FULL_YIELD_COLUMN = "Full Yield [GWh/yr]"
+EXTERNAL_WAKE_EFFICIENCY_COLUMN = "External wake efficiency [%]"
+
+
+def generate_area_layouts(wf, lease_area_centres: dict, turbine_type_name: str, rating: float) -> dict:
+    """
+    Generate a close packed layout on each lease area once, and cache the turbines.
+
+    Parameters
+    ----------
+    wf : windfarmer.sdk.Sdk
+        SDK with the workbook open
+    lease_area_centres : dict
+        (x, y) centre point of each lease area, keyed by lease area name. Wind farm and inclusion region names must match.
+    turbine_type_name : str
+        Turbine type used on every lease area
+    rating : float
+        Cap on the installed capacity on each lease area, in MW
+
+    Returns
+    -------
+    dict
+        For each lease area, a list of (turbine name, x, y, turbine type name)
+    """
+    # the helper functions need the SDK to be initialised before they are imported
+    from helper_functions import check_neighbour_exists_and_delete_existing_turbines, get_and_remove_other_buildable_areas
+    turbine_type = wf.Workbook.TurbineTypes[turbine_type_name]
+    number_of_turbines = int(rating / (turbine_type.RatedPower / 1e6))
+    layouts = {}
+    for name, (x, y) in lease_area_centres.items():
+        print("Generating layout at:{}".format(name))
+        check_neighbour_exists_and_delete_existing_turbines(wf, name)
+        # When building we can only have the corresponding buildable area
+        list_other_regions = get_and_remove_other_buildable_areas(wf, name)
+        wf.Toolbox.GenerateClosePackedLayout(wf.Workbook.WindFarms[name], turbine_type, number_of_turbines,
+                                             wf.Scripting.Location(x, y), True)
+        for reg in list_other_regions:
+            wf.Workbook.InclusionRegions.Add(reg)
+        layouts[name] = [(t.Name, t.Location.X, t.Location.Y, t.TurbineType.Name) for t in wf.Workbook.WindFarms[name].Turbines]
+        print("\t{} turbines".format(len(layouts[name])))
+    return layouts
+
+
+def save_area_layouts(layouts: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(layouts, f, indent=1)
+
+
+def load_area_layouts(path: str) -> dict:
+    with open(path) as f:
+        return {name: [tuple(t) for t in turbines] for name, turbines in json.load(f).items()}
+
+
+def apply_buildout(wf, layouts: dict, include_farms: dict, current: dict = None) -> dict:
+    """
+    Set the neighbour farms of the workbook to a build-out combination, from the cached layouts.
+
+    Parameters
+    ----------
+    wf : windfarmer.sdk.Sdk
+        SDK with the workbook open
+    layouts : dict
+        Cached layouts from generate_area_layouts
+    include_farms : dict
+        True for each lease area to build
+    current : dict, optional
+        The combination currently in the workbook, as returned by the previous call. Only changed farms are rebuilt.
+
+    Returns
+    -------
+    dict
+        The combination now in the workbook
+    """
+    for name, turbines in layouts.items():
+        if current is not None and current.get(name) == include_farms[name]:
+            continue
+        farm = wf.Workbook.WindFarms[name]
+        if farm is None:
+            farm = wf.Scripting.WindFarm(name)
+            farm.IsNeighbour = True
+            farm.IsIncludedInBlockageCalculation = False
+            wf.Workbook.WindFarms.Add(farm)
+        farm.Turbines.Clear()
+        if include_farms[name]:
+            for turbine_name, x, y, turbine_type_name in turbines:
+                farm.Turbines.Add(wf.Scripting.Turbine(turbine_name, wf.Scripting.Location(x, y), wf.Workbook.TurbineTypes[turbine_type_name]))
+    return dict(include_farms)
+
+
+def gray_code_order(combinations: list) -> list:
+    """Sort boolean combinations so consecutive ones differ in as few areas as possible (one, for a full set)."""
+    def gray_rank(combination):
+        # inverse Gray code of the combination read as binary
+        rank = 0
+        bit = 0
+        for value in combination:
+            bit ^= int(value)
+            rank = (rank << 1) | bit
+        return rank
+    return sorted(combinations, key=gray_rank)
+
+
+def all_combinations(area_names: list) -> list:
+    return list(itertools.product([True, False], repeat=len(area_names)))
+
+
+# State of each worker process
+_worker = {}
+
+
+def _init_worker(windfarmer_installation_folder: str, workbook_path: str, layouts: dict, subject_farm: str):
+    import windfarmer.sdk
+    wf = windfarmer.sdk.Sdk(windfarmer_installation_folder)
+    wf.Toolbox.OpenWorkbook(workbook_path)
+    _worker.update({"wf": wf, "layouts": layouts, "subject_farm": subject_farm, "current": None})
+
+
+def _evaluate_combinations(chunk: list) -> list:
+    from helper_functions import get_full_yield_from_results, get_external_wake_efficiency
+    wf = _worker["wf"]
+    layouts = _worker["layouts"]
+    results = []
+    for combination in chunk:
+        include_farms = dict(zip(layouts, combination))
+        _worker["current"] = apply_buildout(wf, layouts, include_farms, _worker["current"])
+        scenario = wf.Toolbox.CalculateEnergy()
+        case_results = dict(include_farms)
+        case_results[FULL_YIELD_COLUMN] = get_full_yield_from_results(wf, scenario, _worker["subject_farm"])
+        case_results[EXTERNAL_WAKE_EFFICIENCY_COLUMN] = get_external_wake_efficiency(wf)
+        results.append(case_results)
+    return results
+
+
+def _read_completed(results_path: str, area_names: list) -> set:
+    if not os.path.exists(results_path):
+        return set()
+    done = pd.read_csv(results_path)
+    return set(tuple(bool(v) for v in row) for row in done[area_names].itertuples(index=False))
+
+
+def append_results(results: list, results_path: str, area_names: list) -> pd.DataFrame:
+    """Append result dictionaries to the results csv, creating it with a header if needed."""
+    results_df = pd.DataFrame(results, columns=area_names + [FULL_YIELD_COLUMN, EXTERNAL_WAKE_EFFICIENCY_COLUMN])
+    # with an index column, as written by the notebook loop and read by plot_cumulative_dist
+    results_df.to_csv(results_path, mode='a', header=not os.path.exists(results_path))
+    return results_df
+
+
+class BuildoutWorkers:
+    """
+    A pool of SDK worker processes, each with the workbook open, that evaluate build-out combinations from cached layouts.
+    Use as a context manager. The pool can be given several batches of combinations, e.g. when sampling adaptively,
+    so WindFarmer is only started once per worker.
+    """
+    def __init__(self, windfarmer_installation_folder: str, workbook_path: str, layouts: dict, n_workers: int = 4, subject_farm: str = "target"):
+        """
+        Parameters
+        ----------
+        windfarmer_installation_folder : str
+            Used to start the SDK in each worker
+        workbook_path : str
+            Workbook opened by each worker. Cases are built in memory, the workbook file isn't changed.
+        layouts : dict
+            Cached layouts from generate_area_layouts or load_area_layouts. Their order gives the order of each combination.
+        n_workers : int, optional
+            Number of worker processes, each running its own SDK instance, by default 4
+        subject_farm : str, optional
+            Farm whose full yield is reported, by default "target"
+        """
+        self.area_names = list(layouts)
+        self.n_workers = n_workers
+        self._initargs = (windfarmer_installation_folder, workbook_path, layouts, subject_farm)
+        self._pool = None
+
+    def __enter__(self):
+        # spawn, as on Windows, so each worker starts its own .NET runtime
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(self.n_workers, initializer=_init_worker, initargs=self._initargs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+    def evaluate(self, combinations: list, chunk_size: int = 4):
+        """
+        Evaluate combinations, yielding a list of result dictionaries for each chunk as it completes.
+        Each chunk is in Gray code order, so larger chunks rebuild fewer farms but balance less evenly between workers.
+        """
+        to_run = gray_code_order([tuple(c) for c in combinations])
+        chunks = [to_run[i:i + chunk_size] for i in range(0, len(to_run), chunk_size)]
+        for chunk_results in self._pool.imap_unordered(_evaluate_combinations, chunks):
+            yield chunk_results
+
+
+def run_buildout_exploration(windfarmer_installation_folder: str, workbook_path: str, layouts: dict, results_path: str,
+                             combinations: list = None, n_workers: int = 4, chunk_size: int = 4, subject_farm: str = "target") -> pd.DataFrame:
+    """
+    Calculate energy for each build-out combination in parallel SDK worker processes, from cached area layouts.
+
+    Parameters
+    ----------
+    windfarmer_installation_folder : str
+        Used to start the SDK in each worker
+    workbook_path : str
+        Workbook opened by each worker. Cases are built in memory, the workbook file isn't changed.
+    layouts : dict
+        Cached layouts from generate_area_layouts or load_area_layouts. Their order gives the order of each combination.
+    results_path : str
+        csv file the results are appended to. Combinations already in the file are skipped, so a run can be resumed.
+    combinations : list, optional
+        Tuples of booleans, one per lease area, by default all 2^N combinations
+    n_workers : int, optional
+        Number of worker processes, each running its own SDK instance, by default 4
+    chunk_size : int, optional
+        Combinations sent to a worker at a time. Each chunk is in Gray code order, so larger chunks rebuild fewer farms, by default 4
+    subject_farm : str, optional
+        Farm whose full yield is reported, by default "target"
+
+    Returns
+    -------
+    pd.DataFrame
+        All results in the results file
+    """
+    area_names = list(layouts)
+    combinations = all_combinations(area_names) if combinations is None else [tuple(c) for c in combinations]
+    done = _read_completed(results_path, area_names)
+    to_run = [c for c in combinations if tuple(c) not in done]
+    print("{} combinations, {} already in {}, {} to run on {} workers".format(len(combinations), len(combinations) - len(to_run), results_path, len(to_run), n_workers))
+
+    with BuildoutWorkers(windfarmer_installation_folder, workbook_path, layouts, n_workers, subject_farm) as workers:
+        for chunk_results in workers.evaluate(to_run, chunk_size):
+            chunk_df = append_results(chunk_results, results_path, area_names)
+            done.update(tuple(c) for c in chunk_df[area_names].itertuples(index=False))
+            print("{} of {} combinations complete".format(len(done), len(combinations)))
+    return pd.read_csv(results_path)
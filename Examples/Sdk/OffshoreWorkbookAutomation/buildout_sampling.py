@@ -0,0 +1,248 @@
+# Adaptive sampling of build-out combinations, for a P50 without evaluating all 2^N combinations
+#
+# Combinations are stratified by the number of lease areas built (0..N). Stratum k holds C(N, k) of the 2^N equally
+# likely combinations, so has weight C(N, k) / 2^N in the CDF. Each sample in a stratum stands for an equal share of the
+# stratum weight, so the weighted CDF of the samples estimates the CDF over all combinations, as plot_cumulative_dist
+# gives from an exhaustive results file.
+#
+# Batches of combinations are drawn as results arrive. Every stratum is sampled first, then samples are allocated
+# to the strata that contribute most to the uncertainty of the P50 (Neyman allocation on the proportion of the stratum
+# below the current P50). The confidence interval of the P50 is found from the stratified variance of the CDF at the
+# P50 (Woodruff's method), and sampling stops once its half width is within the tolerance.
+import itertools
+from math import comb, sqrt
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+import buildout_engine
+
+# Strata with at most this many combinations are enumerated and shuffled, larger ones are sampled at random
+ENUMERATE_STRATUM_LIMIT = 5000
+
+
+class StratifiedBuildoutSampler:
+    """
+    Draws build-out combinations stratified by the number of areas built, and estimates the P50 of a result, with its
+    confidence interval, from the results added so far.
+    """
+    def __init__(self, area_names: list, seed: int = None, min_per_stratum: int = 2, exploration_floor: float = 0.05):
+        """
+        Parameters
+        ----------
+        area_names : list
+            Lease area names, giving the order of each combination
+        seed : int, optional
+            Random seed, for repeatable sampling
+        min_per_stratum : int, optional
+            Samples taken from every stratum before adaptive allocation, by default 2 (needed for a variance estimate)
+        exploration_floor : float, optional
+            Minimum standard deviation used for Neyman allocation, so strata entirely on one side of the P50 are still
+            sampled now and again, by default 0.05
+        """
+        self.area_names = list(area_names)
+        n_areas = len(self.area_names)
+        self.stratum_sizes = np.array([comb(n_areas, k) for k in range(n_areas + 1)], dtype=float)
+        self.stratum_weights = self.stratum_sizes / 2 ** n_areas
+        self.min_per_stratum = min_per_stratum
+        self.exploration_floor = exploration_floor
+        self.rng = np.random.default_rng(seed)
+        self._issued = set()
+        self._issued_per_stratum = np.zeros(n_areas + 1, dtype=int)
+        self._shuffled = {}
+        self.values = [[] for _ in range(n_areas + 1)]
+        self.results = {}
+
+    @property
+    def n_results(self) -> int:
+        return len(self.results)
+
+    def is_exhausted(self) -> bool:
+        return len(self._issued) == 2 ** len(self.area_names)
+
+    def _draw(self, k: int) -> tuple:
+        n_areas = len(self.area_names)
+        if self.stratum_sizes[k] <= ENUMERATE_STRATUM_LIMIT:
+            if k not in self._shuffled:
+                members = [tuple(i in built for i in range(n_areas)) for built in itertools.combinations(range(n_areas), k)]
+                self._shuffled[k] = [members[i] for i in self.rng.permutation(len(members))]
+            while self._shuffled[k]:
+                combination = self._shuffled[k].pop()
+                if combination not in self._issued:
+                    return combination
+            return None
+        while True:
+            built = set(self.rng.choice(n_areas, size=k, replace=False).tolist())
+            combination = tuple(i in built for i in range(n_areas))
+            if combination not in self._issued:
+                return combination
+
+    def _stratum_spreads(self) -> np.ndarray:
+        """Standard deviation of the indicator of being below the current P50, in each stratum."""
+        spread = np.full(len(self.values), 0.5)
+        p50 = self.p50()
+        if not np.isnan(p50):
+            for k, values in enumerate(self.values):
+                if values:
+                    p = np.mean(np.asarray(values) <= p50)
+                    spread[k] = max(sqrt(p * (1 - p)), self.exploration_floor)
+        return spread
+
+    def _priorities(self, spread: np.ndarray) -> np.ndarray:
+        n = self._issued_per_stratum
+        remaining = n < self.stratum_sizes
+        minimum = np.minimum(self.min_per_stratum, self.stratum_sizes)
+        if np.any(remaining & (n < minimum)):
+            # first make sure every stratum is sampled
+            return np.where(remaining & (n < minimum), minimum - n, -np.inf)
+        # Neyman allocation: samples in proportion to weight x standard deviation, with the finite population correction
+        priority = self.stratum_weights * spread * np.sqrt(1 - n / self.stratum_sizes) / (n + 1)
+        return np.where(remaining, priority, -np.inf)
+
+    def next_batch(self, batch_size: int) -> list:
+        """Draw up to batch_size combinations not drawn before."""
+        spread = self._stratum_spreads()
+        batch = []
+        while len(batch) < batch_size and not self.is_exhausted():
+            k = int(np.argmax(self._priorities(spread)))
+            combination = self._draw(k)
+            self._issued.add(combination)
+            self._issued_per_stratum[k] += 1
+            batch.append(combination)
+        return batch
+
+    def add_result(self, combination, value: float):
+        """Add the result of a combination, drawn by next_batch or evaluated before, e.g. read from a results file."""
+        combination = tuple(bool(c) for c in combination)
+        if combination in self.results:
+            return
+        if combination not in self._issued:
+            self._issued.add(combination)
+            self._issued_per_stratum[sum(combination)] += 1
+        self.results[combination] = float(value)
+        self.values[sum(combination)].append(float(value))
+
+    def weighted_cdf(self) -> pd.DataFrame:
+        """The estimated CDF, one row per result sorted by value, with its weight and cumulative probability."""
+        n = np.array([len(v) for v in self.values])
+        sampled_weight = self.stratum_weights[n > 0].sum()
+        values = []
+        weights = []
+        for k, stratum_values in enumerate(self.values):
+            if not stratum_values:
+                continue
+            values.extend(stratum_values)
+            weights.extend([self.stratum_weights[k] / len(stratum_values) / sampled_weight] * len(stratum_values))
+        cdf = pd.DataFrame({"value": values, "weight": weights}).sort_values("value", kind="mergesort")
+        cdf["cumulative_probability"] = cdf["weight"].cumsum()
+        return cdf.reset_index(drop=True)
+
+    def quantile(self, q: float, cdf: pd.DataFrame = None) -> float:
+        cdf = self.weighted_cdf() if cdf is None else cdf
+        if len(cdf) == 0:
+            return float('nan')
+        i = np.searchsorted(cdf["cumulative_probability"].to_numpy(), min(max(q, 0.0), 1.0) - 1e-12)
+        return float(cdf["value"].iloc[min(i, len(cdf) - 1)])
+
+    def p50(self) -> float:
+        return self.quantile(0.5)
+
+    def p50_confidence_interval(self, confidence: float = 0.95) -> tuple:
+        """
+        Estimate the P50 and its confidence interval, from the stratified variance of the CDF at the P50 (Woodruff's method).
+
+        Returns
+        -------
+        tuple
+            (p50, lower, upper)
+        """
+        cdf = self.weighted_cdf()
+        p50 = self.quantile(0.5, cdf)
+        if np.isnan(p50):
+            return p50, float('nan'), float('nan')
+        n = np.array([len(v) for v in self.values], dtype=float)
+        sampled = n > 0
+        weights = self.stratum_weights / self.stratum_weights[sampled].sum()
+        variance = 0.0
+        for k, values in enumerate(self.values):
+            if not values or n[k] >= self.stratum_sizes[k]:
+                continue  # not sampled, or fully evaluated so without sampling error
+            # proportion of the stratum below the P50, shrunk towards a half (Jeffreys) so that a few samples all on
+            # one side of the P50 don't give a zero variance and a falsely narrow interval
+            p = (np.sum(np.asarray(values) <= p50) + 0.5) / (n[k] + 1)
+            variance += weights[k] ** 2 * (1 - n[k] / self.stratum_sizes[k]) * p * (1 - p) / n[k]
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * sqrt(variance)
+        return p50, self.quantile(0.5 - half_width, cdf), self.quantile(0.5 + half_width, cdf)
+
+
+def run_adaptive_sampling(evaluate, area_names: list, tolerance: float, batch_size: int = 8, confidence: float = 0.95,
+                          max_samples: int = None, min_samples: int = None, previous_results: list = None, seed: int = None):
+    """
+    Sample build-out combinations in batches until the P50 converges.
+
+    Parameters
+    ----------
+    evaluate : callable
+        Called with a list of combinations, returns or yields (combination, value) pairs, e.g. from engine_evaluator
+    area_names : list
+        Lease area names, giving the order of each combination
+    tolerance : float
+        Stop once the half width of the P50 confidence interval is within this, in the units of the value
+    batch_size : int, optional
+        Combinations per batch; a multiple of the number of workers keeps them busy, by default 8
+    confidence : float, optional
+        Confidence level of the interval, by default 0.95
+    max_samples : int, optional
+        Stop after this many results, by default no limit (at most 2^N)
+    min_samples : int, optional
+        Don't stop before this many results, by default two per stratum
+    previous_results : list, optional
+        (combination, value) pairs already evaluated, e.g. to resume from a results file
+    seed : int, optional
+        Random seed
+
+    Returns
+    -------
+    tuple
+        The sampler, with all results and the CDF, and a DataFrame with the P50 and its interval after each batch
+    """
+    sampler = StratifiedBuildoutSampler(area_names, seed)
+    for combination, value in previous_results or []:
+        sampler.add_result(combination, value)
+    min_samples = 2 * (len(area_names) + 1) if min_samples is None else min_samples
+    max_samples = 2 ** len(area_names) if max_samples is None else min(max_samples, 2 ** len(area_names))
+    history = []
+    while True:
+        if sampler.n_results > 0:
+            p50, lower, upper = sampler.p50_confidence_interval(confidence)
+            half_width = (upper - lower) / 2
+            history.append({"results": sampler.n_results, "P50": p50, "lower": lower, "upper": upper, "half_width": half_width})
+            print("{} results: P50 {:.4f} [{:.4f}, {:.4f}]".format(sampler.n_results, p50, lower, upper))
+            if sampler.n_results >= min_samples and half_width <= tolerance:
+                print("P50 converged to within {} after {} of {} combinations".format(tolerance, sampler.n_results, 2 ** len(area_names)))
+                break
+        if sampler.n_results >= max_samples or sampler.is_exhausted():
+            break
+        batch = sampler.next_batch(min(batch_size, max_samples - sampler.n_results))
+        for combination, value in evaluate(batch):
+            sampler.add_result(combination, value)
+    return sampler, pd.DataFrame(history)
+
+
+def read_previous_results(results_path: str, area_names: list, column: str = buildout_engine.EXTERNAL_WAKE_EFFICIENCY_COLUMN) -> list:
+    """Read (combination, value) pairs from a results csv, as written by the notebook loop or buildout_engine."""
+    results = pd.read_csv(results_path)
+    return [(tuple(bool(v) for v in row[:-1]), row[-1]) for row in results[area_names + [column]].itertuples(index=False)]
+
+
+def engine_evaluator(workers: buildout_engine.BuildoutWorkers, results_path: str = None, column: str = buildout_engine.EXTERNAL_WAKE_EFFICIENCY_COLUMN, chunk_size: int = 1):
+    """
+    An evaluate function for run_adaptive_sampling that runs batches on buildout_engine workers, optionally appending to a results csv.
+    """
+    def evaluate(combinations):
+        for chunk_results in workers.evaluate(combinations, chunk_size):
+            if results_path:
+                buildout_engine.append_results(chunk_results, results_path, workers.area_names)
+            for result in chunk_results:
+                yield tuple(result[a] for a in workers.area_names), result[column]
+    return evaluate
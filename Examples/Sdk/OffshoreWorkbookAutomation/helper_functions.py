@@ -13,8 +13,7 @@ def get_external_wake_efficiency(wf: windfarmer.sdk.Sdk):
     return external_eff.CalculatedMean		
                 
 def get_full_yield_from_results(wf: windfarmer.sdk.Sdk, scenario, subject_farm="target"):
-    farm = [f for f in scenario.WindFarms if f.Name == subject_farm][0]
-    return scenario.FarmTotalYields.GetVariantResult("Full").GetValueForFarm(farm).Value / 1e6
+    return wf.get_farm_yields(scenario, variants=("Full",), farm_names=[subject_farm]).loc[subject_farm, "Full"]
         
 def get_and_remove_other_buildable_areas(wf: windfarmer.sdk.Sdk, area_name):
     list_other_regions = []
@@ -0,0 +1,306 @@
+# Coarse-to-fine search of the south-north offset and separation ellipse bearing of a close packed offshore layout
+#
+# DemoData/OffshoreDemo/layout_opt_script/PackedFillOptimisation.cs sweeps every offset, then every bearing, calling
+# GenerateClosePackedLayout and CalculateEnergy for each (see south-north-exploration.txt and axis-bearing-exploration.txt).
+# This runs the same two explorations, with the same coarse model settings, but:
+#  1. evaluates a strided subset of each sweep, then refines around the best few of those with a discrete golden-section
+#     search of the bracket between their neighbouring coarse points; the sweeps have several local optima, so a few
+#     brackets are refined rather than just the best
+#  2. re-evaluates only the best few (offset, bearing) candidates with the detailed model settings
+#  3. runs the evaluations of each round in parallel SDK worker processes, each with its own WindFarmer instance and copy
+#     of the workbook; the brackets are refined side by side, so each round has one evaluation per bracket
+# Results are cached by grid step, so no layout is evaluated twice with the same settings.
+#
+# This module doesn't import the SDK at the top, as the worker processes start without it. Each worker initialises its
+# own windfarmer.sdk.Sdk, so each needs a WindFarmer licence seat; set n_workers accordingly.
+import math
+import multiprocessing
+import pandas as pd
+
+FARM_NAME = "OffshoreDemoSite"
+TURBINE_TYPE_NAME = "Bladed Concept Model 19-MW 265-D Offshore"
+LAYOUT_SCENARIO_NAME = "Best variant"
+# the grids of the exhaustive sweeps of PackedFillOptimisation.cs
+START_EASTING = 360000.0
+START_NORTHING = 5936000.0
+OFFSETS_M = [i * 1000.0 for i in range(20)]
+BEARINGS_DEG = [240.0 + j * 2.0 for j in range(20)]
+
+# energy settings of each step, as in PackedFillOptimisation.cs, and whether neighbouring farms are excluded
+COARSE_OFFSET_SETTINGS = {
+    "WakeModelType": "TurbOPark",
+    "ApplyLargeWindFarmCorrection": False,
+    "CalculateBlockageEfficiency": False,
+    "CalculateEfficiencies": False,
+    "UseAssociationMethod": True,
+    "MaximumWindSpeedForCalculation": 30,
+    "NumberOfDirectionSectors": 72,
+    "ApplyHysteresisAdjustment": False,
+    "exclude_neighbours": False,
+}
+COARSE_BEARING_SETTINGS = {
+    "WakeModelType": "EddyViscosity",
+    "ApplyLargeWindFarmCorrection": True,
+    "CalculateBlockageEfficiency": False,
+    "CalculateEfficiencies": False,
+    "UseAssociationMethod": True,
+    "MaximumWindSpeedForCalculation": 30,
+    "NumberOfDirectionSectors": 180,
+    "ApplyHysteresisAdjustment": False,
+    "exclude_neighbours": True,
+}
+DETAILED_SETTINGS = {
+    "WakeModelType": "EddyViscosity",
+    "ApplyLargeWindFarmCorrection": True,
+    "LargeWindFarmCorrectionSettings.BaseRoughness": 0.0002,
+    "LargeWindFarmCorrectionSettings.IncreasedRoughness": 0.192,
+    "LargeWindFarmCorrectionSettings.DistanceInDiametersToStartOfRecovery": 120,
+    "LargeWindFarmCorrectionSettings.DistanceInDiametersFromStartOfRecoveryToHalfRecovery": 60,
+    "CalculateBlockageEfficiency": True,
+    "CalculateEfficiencies": True,
+    "UseAssociationMethod": True,
+    "MaximumWindSpeedForCalculation": 70,
+    "NumberOfDirectionSectors": 180,
+    "ApplyHysteresisAdjustment": True,
+    "exclude_neighbours": False,
+}
+SETTINGS = {"coarse offset": COARSE_OFFSET_SETTINGS, "coarse bearing": COARSE_BEARING_SETTINGS, "detailed": DETAILED_SETTINGS}
+
+
+def apply_energy_settings(wf, settings: dict):
+    """Set the energy settings of the workbook, and the calculation of neighbouring farms, from a settings dict."""
+    energy_settings = wf.Workbook.ModelSettings.EnergySettings
+    for name, value in settings.items():
+        if name == "exclude_neighbours":
+            for farm in wf.Workbook.WindFarms:
+                if farm.IsNeighbour:
+                    farm.ExcludeFromCalculation = value
+            continue
+        if name == "WakeModelType":
+            value = getattr(wf.Scripting.WakeModelType, value)
+        target = energy_settings
+        *parents, attribute = name.split(".")
+        for parent in parents:
+            target = getattr(target, parent)
+        setattr(target, attribute, value)
+
+
+def generate_layout(wf, offset_m: float, bearing_deg: float, target_turbine_count: int) -> int:
+    """Generate the close packed layout at a south-north offset and ellipse bearing, as GenerateLayoutOnDemoSite does."""
+    wf.Workbook.ModelSettings.LayoutOptimisationSettings.TurbineConstraints.TurbineSeparationDistanceConstraints.EllipticalBearingOfLongAxis = bearing_deg
+    farm = wf.Workbook.WindFarms[FARM_NAME]
+    farm.Turbines.Clear()
+    wf.Toolbox.GenerateClosePackedLayout(farm, wf.Workbook.TurbineTypes[TURBINE_TYPE_NAME], target_turbine_count,
+                                         wf.Scripting.Location(START_EASTING, START_NORTHING - offset_m), True)
+    return farm.Turbines.Count
+
+
+def get_cost_benefit(result: dict, baseline: dict) -> float:
+    """The cost-benefit score of PackedFillOptimisation.cs, relative yield plus a third of the relative depth saving."""
+    return result["full_yield"] / baseline["full_yield"] + (1 - result["mean_depth"] / baseline["mean_depth"]) / 3
+
+
+# State of each worker process
+_worker = {}
+
+
+def _init_worker(windfarmer_installation_folder: str, workbook_path: str, target_turbine_count: int):
+    import windfarmer.sdk
+    wf = windfarmer.sdk.Sdk(windfarmer_installation_folder)
+    wf.Toolbox.OpenWorkbook(workbook_path)
+    wf.Toolbox.ActivateLayoutScenario(wf.Workbook.LayoutScenarios[LAYOUT_SCENARIO_NAME])
+    constraints = wf.Workbook.ModelSettings.LayoutOptimisationSettings.TurbineConstraints.TurbineSeparationDistanceConstraints
+    constraints.UseCircular = False
+    constraints.EllipticalLongAxisInDiameters = 10
+    constraints.EllipticalShortAxisInDiameters = 6
+    _worker.update({"wf": wf, "target_turbine_count": target_turbine_count, "settings": None})
+
+
+def _evaluate_layout(case: tuple) -> dict:
+    offset_m, bearing_deg, settings_name = case
+    wf = _worker["wf"]
+    if _worker["settings"] != settings_name:
+        apply_energy_settings(wf, SETTINGS[settings_name])
+        _worker["settings"] = settings_name
+    result = {"offset_m": offset_m, "bearing_deg": bearing_deg, "settings": settings_name}
+    result["turbines"] = generate_layout(wf, offset_m, bearing_deg, _worker["target_turbine_count"])
+    if result["turbines"] != _worker["target_turbine_count"]:
+        # the layout doesn't fit, skipped as in PackedFillOptimisation.cs
+        result.update({"mean_depth": math.nan, "full_yield": math.nan})
+        return result
+    turbines = list(wf.Workbook.WindFarms[FARM_NAME].Turbines)
+    result["mean_depth"] = abs(sum(wf.Toolbox.GetElevation(t.Location).Value for t in turbines) / len(turbines))
+    scenario = wf.Toolbox.CalculateEnergy()
+    farm = [f for f in scenario.WindFarms if f.Name == FARM_NAME][0]
+    result["full_yield"] = scenario.FarmTotalYields.GetVariantResult("Full").GetValueForFarm(farm).Value
+    return result
+
+
+class LayoutWorkers:
+    """
+    A pool of SDK worker processes, each with the workbook open, that generate and evaluate layouts. Use as a context manager.
+    """
+    def __init__(self, windfarmer_installation_folder: str, workbook_path: str, target_turbine_count: int = 50, n_workers: int = 4):
+        """
+        Parameters
+        ----------
+        windfarmer_installation_folder : str
+            Used to start the SDK in each worker
+        workbook_path : str
+            Workbook opened by each worker. Layouts are generated in memory, the workbook file isn't changed.
+        target_turbine_count : int, optional
+            Number of turbines of each layout, by default 50
+        n_workers : int, optional
+            Number of worker processes, each running its own SDK instance, by default 4
+        """
+        self.n_workers = n_workers
+        self._initargs = (windfarmer_installation_folder, workbook_path, target_turbine_count)
+        self._pool = None
+
+    def __enter__(self):
+        # spawn, as on Windows, so each worker starts its own .NET runtime
+        context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(self.n_workers, initializer=_init_worker, initargs=self._initargs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+    def evaluate(self, cases: list) -> list:
+        """Evaluate (offset_m, bearing_deg, settings name) cases, returning a result dictionary for each, in order."""
+        return self._pool.map(_evaluate_layout, cases, chunksize=1)
+
+
+def _get_golden_section_probe(lower: int, best: int, upper: int, scores: dict):
+    """The next step of a discrete golden-section search of a bracket, in its larger side of the best step, or None when done."""
+    for gap, direction in sorted([(upper - best, 1), (best - lower, -1)], reverse=True):
+        if gap > 0:
+            probe = best + direction * max(1, round(gap * (2 - (1 + 5 ** 0.5) / 2)))
+            if probe not in scores:
+                return probe
+    return None
+
+
+def search_grid(evaluate_batch, n_steps: int, coarse_stride: int = 4, n_brackets: int = 2) -> dict:
+    """
+    Find the best step of a grid with few evaluations: every coarse_stride-th step (and the last), then a discrete
+    golden-section search of the bracket around each of the n_brackets best coarse steps, all brackets refined together.
+
+    Parameters
+    ----------
+    evaluate_batch : callable
+        Called with a list of grid steps, returns their scores, to maximise, NaN where a step isn't valid.
+        Each call is one round of parallel evaluations.
+    n_steps : int
+        Number of grid steps, 0 to n_steps - 1
+    coarse_stride : int, optional
+        Spacing of the coarse steps, by default 4
+    n_brackets : int, optional
+        Number of the best coarse steps refined around, by default 2
+
+    Returns
+    -------
+    dict
+        Score of each step evaluated. The best is max(scores, key=scores.get).
+    """
+    scores = {}
+
+    def evaluate(steps):
+        steps = sorted(set(steps) - set(scores))
+        for step, score in zip(steps, evaluate_batch(steps)):
+            scores[step] = -math.inf if score is None or math.isnan(score) else score
+
+    evaluate(list(range(0, n_steps, coarse_stride)) + [n_steps - 1])
+    coarse = sorted(scores, key=scores.get, reverse=True)[:n_brackets]
+    # (lower, best, upper) of each bracket: its best step, and the nearest evaluated steps either side or the bracket ends
+    brackets = [(max(step - coarse_stride, 0), step, min(step + coarse_stride, n_steps - 1)) for step in coarse]
+    while True:
+        probes = [_get_golden_section_probe(lower, best, upper, scores) for lower, best, upper in brackets]
+        if all(probe is None for probe in probes):
+            break
+        evaluate([probe for probe in probes if probe is not None])
+        for i, (lower, best, upper) in enumerate(brackets):
+            inside = [step for step in scores if lower <= step <= upper]
+            best = max(inside, key=scores.get)
+            brackets[i] = (max([s for s in inside if s < best], default=lower), best,
+                           min([s for s in inside if s > best], default=upper))
+    return scores
+
+
+def run_packed_layout_search(windfarmer_installation_folder: str, workbook_path: str, target_turbine_count: int = 50,
+                             n_workers: int = 4, coarse_stride: int = 4, n_brackets: int = 2, n_detailed: int = 3,
+                             offsets_m: list = OFFSETS_M, bearings_deg: list = BEARINGS_DEG) -> tuple:
+    """
+    Find the best south-north offset, then the best ellipse bearing at it, with the coarse settings, then evaluate the
+    best n_detailed bearings at that offset with the detailed settings.
+
+    Parameters
+    ----------
+    windfarmer_installation_folder : str
+        Used to start the SDK in each worker
+    workbook_path : str
+        The offshore demo workbook, opened by each worker
+    target_turbine_count : int, optional
+        Number of turbines of each layout, by default 50
+    n_workers : int, optional
+        Number of worker processes, each running its own SDK instance, by default 4
+    coarse_stride, n_brackets : int, optional
+        As for search_grid, by default 4 and 2
+    n_detailed : int, optional
+        Number of candidates evaluated with the detailed settings, by default 3
+    offsets_m, bearings_deg : list, optional
+        Grids searched, by default those of PackedFillOptimisation.cs
+
+    Returns
+    -------
+    tuple
+        The best detailed result dictionary, and a DataFrame of all the evaluations with the step each was in
+    """
+    evaluations = []
+
+    def run(cases, step_name):
+        results = workers.evaluate(cases)
+        for result in results:
+            result["step"] = step_name
+        evaluations.extend(results)
+        return results
+
+    with LayoutWorkers(windfarmer_installation_folder, workbook_path, target_turbine_count, n_workers) as workers:
+        # the first offset is the cost-benefit baseline, as in PackedFillOptimisation.cs; it is always a coarse step
+        offset_results = {}
+
+        def evaluate_offsets(steps):
+            for step, result in zip(steps, run([(offsets_m[i], bearings_deg[0], "coarse offset") for i in steps], "offset")):
+                offset_results[step] = result
+            return [get_cost_benefit(offset_results[step], offset_results[0]) for step in steps]
+
+        offset_scores = search_grid(evaluate_offsets, len(offsets_m), coarse_stride, n_brackets)
+        best_offset = offsets_m[max(offset_scores, key=offset_scores.get)]
+
+        def evaluate_bearings(steps):
+            results = run([(best_offset, bearings_deg[j], "coarse bearing") for j in steps], "bearing")
+            return [result["full_yield"] for result in results]
+
+        bearing_scores = search_grid(evaluate_bearings, len(bearings_deg), coarse_stride, n_brackets)
+        candidates = sorted(bearing_scores, key=bearing_scores.get, reverse=True)[:n_detailed]
+        detailed = run([(best_offset, bearings_deg[j], "detailed") for j in candidates], "detailed")
+
+    best = max(detailed, key=lambda r: -math.inf if math.isnan(r["full_yield"]) else r["full_yield"])
+    print("{} layouts evaluated, of {} in the exhaustive sweeps".format(len(evaluations), len(offsets_m) + len(bearings_deg)))
+    print("Best: offset {offset_m} m, bearing {bearing_deg} deg, full yield {full_yield:.0f}".format(**best))
+    return best, pd.DataFrame(evaluations)
+
+
+if __name__ == "__main__":
+    # usage: python packed_layout_search.py <offshore demo workbook, .wwx>
+    import os
+    import sys
+    windfarmer_installation_folder = r'C:\Program Files\DNV\WindFarmer - Analyst 1.6.5.1'
+    workbook_path = os.path.abspath(sys.argv[1])
+    best, evaluations = run_packed_layout_search(windfarmer_installation_folder, workbook_path)
+    evaluations.to_csv(os.path.join(os.path.dirname(workbook_path), 'packed-layout-search.csv'), index=False)
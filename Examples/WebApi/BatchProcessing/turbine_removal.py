@@ -0,0 +1,438 @@
+# Turbine removal search: which k turbines to remove from a layout to keep the most full yield.
+#
+# batch_process.ipynb takes the 10 lowest yield turbines and calculates every combination of 3 of them, which grows as
+# C(n, k) and can't find a better choice outside those 10. This instead removes turbines one at a time with a beam search:
+#  1. a prior estimate of the yield lost by removing each turbine ranks the first calculations. By default it is from the
+#     local wake surrogate of CFDMLv2/script_lib, removing each turbine in turn, so the wake relief of the turbines
+#     behind it counts; a turbine's own yield alone misses that, and would rank a high yielding turbine that wakes many
+#     others last. --prior screen calculates every single removal with the API instead
+#  2. at each step the children of the beam (each kept removal set with one more turbine removed) are ranked by their
+#     estimated yield, and calculated in batches of concurrent AnnualEnergyProductionAsync jobs, best estimate first; the
+#     estimated loss of a turbine is updated from every calculation that removes it
+#  3. a step stops on measured gains only: once a batch adds no removal set to the beam by more than a tolerance
+# This is a heuristic: O(k x beam width) calculations in all rather than C(n, k), with no guarantee of the best removal
+# set. A wider beam calculates more removal sets, for more confidence.
+# Results are cached by the set of turbines removed, so a removal set reached in several orders is calculated once. The
+# cache can be kept in a json file between runs; it is saved after each batch, with a hash of the input it belongs to.
+#
+# Example, removing 3 turbines from The Bowl with a beam of 3:
+#   python turbine_removal.py --input ../../../DemoData/TheBowl/TheBowl.json --remove 3 --beam-width 3 --concurrency 10
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from copy import copy
+import aiohttp
+import pandas as pd
+
+script_dir_name = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir_name, '..', 'CFDMLv2'))
+
+from script_lib.wake_surrogate import WakeSurrogateModel
+
+API_URL = 'https://windfarmer.dnv.com/api/v3/'
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_POLL_ERRORS = 5
+PRIORS = ("surrogate", "screen", "own-yield")
+
+
+def remove_turbines(input_data: dict, turbine_names, farm_index: int = 0) -> dict:
+    """A copy of an AEP input without the named turbines of one wind farm, sharing the rest of the input."""
+    removed = set(turbine_names)
+    input_data = copy(input_data)
+    input_data["windFarms"] = list(input_data["windFarms"])
+    farm = copy(input_data["windFarms"][farm_index])
+    farm["turbines"] = [t for t in farm["turbines"] if t["name"] not in removed]
+    input_data["windFarms"][farm_index] = farm
+    return input_data
+
+
+def removal_key(removed) -> str:
+    return '|'.join(sorted(removed))
+
+
+def get_input_hash(input_data: dict, farm_index: int = 0) -> str:
+    """A sha256 hash of the AEP input and the index of the farm turbines are removed from, to tie cached results to them."""
+    text = json.dumps({"farmIndex": farm_index, "input": input_data}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_retry_wait(retry_after, attempt: int, retry_wait_seconds: float) -> float:
+    """Seconds to wait before a retry: the Retry-After header of the response if given in seconds, else exponential back off."""
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        return retry_wait_seconds * 2 ** attempt
+
+
+class RemovalResultsCache:
+    """
+    Full yield of each remaining turbine, keyed by the set of turbines removed, optionally persisted to a json file.
+
+    The file holds the hash of the input the results belong to (see get_input_hash), and a file of another input is
+    refused rather than mixed in. Only successful results are cached, so failed cases are retried on the next run.
+    """
+
+    def __init__(self, filename: str = None, input_hash: str = None):
+        self.filename = filename
+        self.input_hash = input_hash
+        self.results = {}
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                cached = json.load(f)
+            if not isinstance(cached, dict) or cached.get("inputHash") != input_hash:
+                raise ValueError(f"The cache file {filename} holds results of another input or farm, use another file")
+            self.results = cached["results"]
+
+    def get(self, removed):
+        return self.results.get(removal_key(removed))
+
+    def put(self, removed, turbine_yields: dict):
+        self.results[removal_key(removed)] = turbine_yields
+
+    def save(self):
+        if self.filename:
+            # write then replace, so an interrupted save keeps the previous file
+            temporary_filename = self.filename + '.tmp'
+            with open(temporary_filename, 'w') as f:
+                json.dump({"inputHash": self.input_hash, "results": self.results}, f)
+            os.replace(temporary_filename, self.filename)
+
+    def __len__(self):
+        return len(self.results)
+
+
+class AepRemovalEvaluator:
+    """
+    Calculates removal sets with concurrent AnnualEnergyProductionAsync jobs on one aiohttp session, through a cache.
+    """
+
+    def __init__(self, input_data: dict, auth_token: str, api_url: str = API_URL, concurrency: int = 10, farm_index: int = 0,
+                 cache: RemovalResultsCache = None, max_retries: int = 2, retry_wait_seconds: float = 1.0,
+                 polling_interval_seconds: float = None):
+        """
+        Parameters
+        ----------
+        input_data : dict
+            AEP input of the full layout, with the model settings to use
+        auth_token : str
+            WindFarmer API access key.
+        api_url : str, optional
+            Base url of the API.
+        concurrency : int, optional
+            Maximum number of jobs in flight, by default 10
+        farm_index : int, optional
+            Index of the wind farm turbines are removed from, in windFarms and in the windFarmAepOutputs, by default 0
+        cache : RemovalResultsCache, optional
+            Results cache; a new in-memory cache is used if not given. It is saved after each batch of calculations.
+        max_retries : int, optional
+            Retries of a submission that was throttled (429), got a server error or lost its connection, waiting for
+            the Retry-After of the response or else with exponential back off, by default 2
+        retry_wait_seconds : float, optional
+            First back off wait, by default 1.0
+        polling_interval_seconds : float, optional
+            Wait between polls of the status of a job, by default 1.2 s per 5 turbines as in WindFarmerAPI.call_aep_api
+        """
+        self.input_data = input_data
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.farm_index = farm_index
+        self.cache = cache if cache is not None else RemovalResultsCache(input_hash=get_input_hash(input_data, farm_index))
+        self.max_retries = max_retries
+        self.retry_wait_seconds = retry_wait_seconds
+        if polling_interval_seconds is None:
+            number_of_turbines = sum(len(farm["turbines"]) for farm in input_data["windFarms"])
+            polling_interval_seconds = number_of_turbines * 1.2 / 5
+        self.polling_interval_seconds = polling_interval_seconds
+        self.headers = {
+            'Authorization': f'Bearer {auth_token}',
+            'Content-Type': 'application/json'
+        }
+        self.submissions = 0
+
+    @property
+    def turbine_names(self) -> list:
+        return [t["name"] for t in self.input_data["windFarms"][self.farm_index]["turbines"]]
+
+    def _get_turbine_yields(self, results: dict) -> dict:
+        turbine_results = results["windFarmAepOutputs"][self.farm_index]["turbineResults"]
+        return {t["turbineName"]: t["fullAnnualYield_MWh_per_year"] for t in turbine_results}
+
+    async def _poll_job(self, session, job_id: str):
+        errors = 0
+        while True:
+            await asyncio.sleep(self.polling_interval_seconds + random.random())
+            try:
+                async with session.get(self.api_url + 'AnnualEnergyProductionAsync', headers=self.headers,
+                                       params={'jobId': job_id}) as resp:
+                    if resp.status == 200:
+                        job_status = await resp.json()
+                        if job_status['status'] == 'SUCCESS':
+                            return self._get_turbine_yields(job_status['results'])
+                        if job_status['status'] == 'FAILED':
+                            print(f"Job {job_id} has FAILED: {job_status.get('message', 'Unknown error')}")
+                            return None
+                        continue
+                    message = f'response {resp.status}: {(await resp.text())[:200]}'
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                message = repr(e)
+            errors += 1
+            if errors >= MAX_POLL_ERRORS:
+                print(f'Polling job {job_id} failed {errors} times, last with {message}')
+                return None
+
+    async def _call_aep(self, session, semaphore, removed):
+        input_data = remove_turbines(self.input_data, removed, self.farm_index)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            # hold a job slot while the job is submitted and polled, not while backing off
+            async with semaphore:
+                self.submissions += 1
+                try:
+                    async with session.post(self.api_url + 'AnnualEnergyProductionAsync', headers=self.headers,
+                                            json=input_data) as resp:
+                        status = resp.status
+                        if status == 202:
+                            job_id = (await resp.json())['jobId']
+                        else:
+                            message = (await resp.text())[:200]
+                            retry_after = resp.headers.get('Retry-After')
+                    if status == 202:
+                        return await self._poll_job(session, job_id)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # dropped connections and timeouts are retried like server errors, and fail only this case
+                    status, message = None, repr(e)
+            if status not in RETRY_STATUS_CODES + (None,) or attempt == self.max_retries:
+                print(f'AnnualEnergyProductionAsync failed with {"response " + str(status) if status else "error"}: {message}')
+                return None
+            await asyncio.sleep(get_retry_wait(retry_after, attempt, self.retry_wait_seconds))
+
+    async def evaluate(self, removal_sets: list) -> list:
+        """The full yield of each remaining turbine of each removal set, a dict, or None where the calculation failed."""
+        to_run = list(dict.fromkeys(frozenset(s) for s in removal_sets if self.cache.get(s) is None))
+        if to_run:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+            async def run_case(session, removed):
+                turbine_yields = await self._call_aep(session, semaphore, removed)
+                if turbine_yields is not None:
+                    self.cache.put(removed, turbine_yields)
+
+            try:
+                async with aiohttp.ClientSession(connector=connector) as session:
+                    await asyncio.gather(*[run_case(session, removed) for removed in to_run])
+            finally:
+                self.cache.save()
+        return [self.cache.get(s) for s in removal_sets]
+
+
+def get_surrogate_losses(input_data: dict, farm_index: int = 0, wake_model: str = "ModifiedPark",
+                         wake_directions_per_sector: int = 1) -> dict:
+    """
+    Estimate the yield lost by removing each turbine of a farm on its own, with the local wake surrogate.
+
+    The loss is the farm's waked yield less its waked yield without the turbine, so it includes the wake relief of the
+    turbines it wakes. Neighbour farms shed wakes but their yield doesn't count. It takes about 0.1 s per turbine for
+    The Bowl with the defaults; it only ranks the first calculations, so the coarse wake model is enough.
+
+    Parameters
+    ----------
+    input_data : dict
+        AEP input of the full layout
+    farm_index : int, optional
+        Index of the wind farm turbines are removed from, by default 0
+    wake_model : str, optional
+        "ModifiedPark" or "TurbOPark", see script_lib.wake_surrogate, by default ModifiedPark, the faster
+    wake_directions_per_sector : int, optional
+        Wake directions per sector of the wind climate, by default 1
+
+    Returns
+    -------
+    dict
+        Estimated yield lost by removing each turbine of the farm, MWh/year
+    """
+    model = WakeSurrogateModel(input_data, wake_model, wake_directions_per_sector)
+    turbines = model.get_turbines(include_neighbors=True)
+    farm_name = input_data["windFarms"][farm_index]["name"]
+
+    def get_farm_yield(layout):
+        results = model.get_turbine_yields(layout)
+        return results.loc[results["farm_name"] == farm_name, "wakedAnnualYield_MWh_per_year"].sum()
+
+    full_yield = get_farm_yield(turbines)
+    in_farm = turbines.index[turbines["farm_name"] == farm_name]
+    return {turbines.at[i, "turbineName"]: full_yield - get_farm_yield(turbines.drop(index=i)) for i in in_farm}
+
+
+async def get_screened_losses(evaluate, candidates: list) -> dict:
+    """
+    The yield lost by removing each candidate turbine on its own, calculated with evaluate, e.g. AepRemovalEvaluator.evaluate.
+
+    It takes a calculation per candidate, but these are the first step of the search, so only the later steps are saved.
+    Candidates whose calculation failed are left out.
+    """
+    full_layout = frozenset()
+    outcomes = await evaluate([full_layout] + [frozenset([name]) for name in candidates])
+    if outcomes[0] is None:
+        raise RuntimeError("The calculation of the full layout failed")
+    full_yield = sum(outcomes[0].values())
+    return {name: full_yield - sum(turbine_yields.values())
+            for name, turbine_yields in zip(candidates, outcomes[1:]) if turbine_yields is not None}
+
+
+async def beam_search_removal_async(evaluate, turbine_names: list, number_to_remove: int, beam_width: int = 3,
+                                    batch_size: int = 10, tolerance: float = 0.0, candidates: list = None,
+                                    max_evaluations_per_step: int = None, prior_losses: dict = None) -> tuple:
+    """
+    Find the turbines to remove to keep the most full yield, removing one at a time with a beam search.
+
+    This is a heuristic: the removal sets of each step are calculated in the order of their estimated yield, and a step
+    stops once a batch of them no longer improves the beam, so a removal set ranked low may not be calculated.
+
+    Parameters
+    ----------
+    evaluate : callable
+        Async, called with a list of removal sets (frozensets of turbine names), returns for each the full yield of
+        each remaining turbine, a dict, or None if it failed; e.g. AepRemovalEvaluator.evaluate
+    turbine_names : list
+        Turbines of the full layout
+    number_to_remove : int
+        Number of turbines to remove, k
+    beam_width : int, optional
+        Number of removal sets kept at each step, by default 3; 1 is a greedy search
+    batch_size : int, optional
+        Removal sets calculated at a time, at least the concurrency to keep the calls busy, by default 10
+    tolerance : float, optional
+        A step stops once a batch adds no removal set to the beam by more than this, MWh/year, by default 0
+    candidates : list, optional
+        Turbines that may be removed, by default all
+    max_evaluations_per_step : int, optional
+        Cap on the removal sets calculated at each step, by default no cap
+    prior_losses : dict, optional
+        Estimated yield lost by removing each turbine, MWh/year, ranking the calculations until one removing it is seen,
+        e.g. from get_surrogate_losses or get_screened_losses. By default its own yield in the full layout, which misses
+        the wake relief of the turbines it wakes.
+
+    Returns
+    -------
+    tuple
+        The best removal set, its full yield in MWh/year, and a DataFrame of each step with the best removal set, its yield,
+        the yield lost by the step and the number of removal sets calculated
+    """
+    candidates = list(turbine_names if candidates is None else candidates)
+    yields = {}
+
+    async def calculate(removal_sets):
+        new = [s for s in dict.fromkeys(removal_sets) if s not in yields]
+        for removed, turbine_yields in zip(new, await evaluate(new)):
+            yields[removed] = -math.inf if turbine_yields is None else sum(turbine_yields.values())
+        return len(new)
+
+    full_layout = frozenset()
+    own_yields = (await evaluate([full_layout]))[0]
+    if own_yields is None:
+        raise RuntimeError("The calculation of the full layout failed")
+    yields[full_layout] = sum(own_yields.values())
+    # estimated yield lost by removing each turbine: the prior until a calculation removing it is seen
+    prior_losses = {} if prior_losses is None else prior_losses
+    loss = {name: prior_losses.get(name, own_yields.get(name, 0.0)) for name in candidates}
+
+    beam = [full_layout]
+    history = []
+    for step in range(1, number_to_remove + 1):
+        # each child of the beam, with the parent and turbine giving it the best estimated yield
+        children = {}
+        for parent in beam:
+            for name in candidates:
+                if name not in parent:
+                    child = parent | {name}
+                    estimate = yields[parent] - loss[name]
+                    if child not in children or estimate > children[child][0]:
+                        children[child] = (estimate, parent, name)
+        evaluations = 0
+        while True:
+            remaining = sorted((c for c in children if c not in yields),
+                               key=lambda c: yields[children[c][1]] - loss[children[c][2]], reverse=True)
+            if not remaining or (max_evaluations_per_step is not None and evaluations >= max_evaluations_per_step):
+                break
+            calculated = sorted((c for c in children if c in yields), key=yields.get, reverse=True)
+            threshold = yields[calculated[beam_width - 1]] if len(calculated) >= beam_width else -math.inf
+            batch = remaining[:batch_size if max_evaluations_per_step is None else min(batch_size, max_evaluations_per_step - evaluations)]
+            evaluations += await calculate(batch)
+            for child in batch:
+                _, parent, name = children[child]
+                if yields[child] > -math.inf:
+                    loss[name] = yields[parent] - yields[child]
+            # stop on measured gains only, not on the estimates, which can be far off for a turbine not yet calculated
+            if not any(yields[child] > threshold + tolerance for child in batch):
+                break
+        beam = sorted((c for c in children if c in yields), key=yields.get, reverse=True)[:beam_width]
+        if not beam:
+            raise RuntimeError(f"No removal set of {step} turbines could be calculated")
+        previous_best = history[-1]["Full Yield [MWh/Annum]"] if history else yields[full_layout]
+        history.append({
+            "Turbines removed": step,
+            "Removal": sorted(beam[0]),
+            "Full Yield [MWh/Annum]": yields[beam[0]],
+            "Yield lost by step [MWh/Annum]": previous_best - yields[beam[0]],
+            "Removal sets calculated": evaluations,
+        })
+        print("{} removed: {} with {:.1f} MWh/annum, {} removal sets calculated".format(
+            step, ', '.join(sorted(beam[0])), yields[beam[0]], evaluations))
+    return set(beam[0]), yields[beam[0]], pd.DataFrame(history)
+
+
+def beam_search_removal(evaluate, turbine_names: list, number_to_remove: int, **kwargs) -> tuple:
+    """Blocking wrapper of beam_search_removal_async, for use from scripts. In a notebook await beam_search_removal_async instead."""
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(beam_search_removal_async(evaluate, turbine_names, number_to_remove, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the turbines to remove from a layout to keep the most full yield.')
+    parser.add_argument('--input', required=True, help='AEP input json of the full layout')
+    parser.add_argument('--remove', type=int, required=True, help='number of turbines to remove')
+    parser.add_argument('--beam-width', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--tolerance', type=float, default=0.0, help='MWh/year')
+    parser.add_argument('--farm-index', type=int, default=0)
+    parser.add_argument('--cache', default=None, help='json file to keep results between runs, of this input only')
+    parser.add_argument('--prior', choices=PRIORS, default='surrogate',
+                        help='estimate of the yield lost by removing each turbine, ranking the first calculations: the local '
+                             'wake surrogate, a calculation of every single removal, or the own yield of each turbine')
+    parser.add_argument('--polling-interval', type=float, default=None, help='seconds between polls of each job')
+    parser.add_argument('--url', default=API_URL)
+    args = parser.parse_args()
+
+    with open(args.input) as f:
+        input_data = json.load(f)
+    cache = RemovalResultsCache(args.cache, get_input_hash(input_data, args.farm_index))
+    evaluator = AepRemovalEvaluator(input_data, os.environ['WINDFARMER_ACCESS_KEY'], args.url, args.concurrency,
+                                    args.farm_index, cache, polling_interval_seconds=args.polling_interval)
+    start = time.time()
+    prior_losses = None
+    if args.prior == 'surrogate':
+        prior_losses = get_surrogate_losses(input_data, args.farm_index)
+        print(f'Surrogate estimate of the loss of each turbine in {time.time() - start:.2f}s')
+    elif args.prior == 'screen':
+        if sys.platform == 'win32':
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        prior_losses = asyncio.run(get_screened_losses(evaluator.evaluate, evaluator.turbine_names))
+    removed, full_yield, history = beam_search_removal(evaluator.evaluate, evaluator.turbine_names, args.remove,
+                                                       beam_width=args.beam_width, batch_size=args.concurrency,
+                                                       tolerance=args.tolerance, prior_losses=prior_losses)
+    n = len(evaluator.turbine_names)
+    print(f'{evaluator.submissions} calls to the API, rather than {math.comb(n, args.remove)} for all combinations, in {time.time() - start:.2f}s')
+    print(history.to_string(index=False))
+    print("best choice -> remove turbines: " + ','.join(sorted(removed)))
+
+
+if __name__ == '__main__':
+    main()
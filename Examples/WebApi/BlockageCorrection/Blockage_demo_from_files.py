@@ -14,8 +14,8 @@
 import requests
 import json
 import os
-import pandas as pd
 import matplotlib.pyplot as plt
+import blockage_payload
 
 # %% 
 # ## Get URL and API key
@@ -48,12 +48,12 @@ significant_atmospheric_stability = True
 # %% 
 # ## Show layout and power curve
 # 
-# Here we parse the tab-separated input files and show the data for visual checking.
-pc_df = pd.read_csv(pc_filename, sep='\t')
+# Here we parse the tab-separated input files, with typed columns that are checked for missing or invalid values, and show the data for visual checking.
+pc_df = blockage_payload.read_turbine_performance(pc_filename)
 print("The power curve, thrust curve, and frequency distribution")
 #display(pc_df)
 
-turbines_df = pd.read_csv(layout_filename, sep='\t')
+turbines_df = blockage_payload.read_layout(layout_filename)
 print("Layout")
 #display(turbines_df)
 
@@ -91,25 +91,16 @@ plt.show()
 # ## Convert DataFrames to lists for API
 # The json input to the API can be built very simply from data frames.
 # The data structure needed to serialise to json is formed of dictionaries and lists.
+# Each table is converted in one step, which stays fast for layouts with thousands of turbines.
+# To screen several layouts use blockage_payload.read_layouts and blockage_payload.build_blockage_inputs.
 
-pc_dict_list = []
-for index, row in pc_df.iterrows():
-    pc_dict_list.append(row.to_dict())
-pc_dict_list[0:3]
-
-
-turbines_dict_list = []
-for index, row in turbines_df.iterrows():
-    turbines_dict_list.append(row.to_dict())
-turbines_dict_list[0:3]
+input = blockage_payload.build_blockage_input(turbines_df, pc_df, significant_atmospheric_stability, validate=False)
+print(input["turbinePerformance"][0:3])
+print(input["turbines"][0:3])
 
 
 # %%
 # ## Calculate blockage
-input = {"turbines": turbines_dict_list,
-         "turbinePerformance": pc_dict_list,
-         "significantAtmosphericStability": significant_atmospheric_stability}
-
 response = requests.post(
     api_url + 'BlockageCorrection', 
     headers=headers,
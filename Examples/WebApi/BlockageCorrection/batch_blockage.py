@@ -0,0 +1,232 @@
+# Batch blockage screening: BlockageCorrection for many candidate layouts and both atmospheric stability options.
+#
+# Builds on Blockage_demo.py and Blockage_demo_from_files.py. Rather than one blocking call per case, all cases are sent
+# concurrently on one aiohttp session with a limited connection pool, so the wall clock time scales with
+# number of cases / concurrency rather than with the number of cases.
+# Results are cached by a hash of the canonical json input (layout + curves + stability flag), so repeated screening runs,
+# or duplicated cases within a run, don't call the API again. The cache can be kept in a json file between runs.
+#
+# Example, screening every layout file in a folder against one power curve:
+#   python batch_blockage.py --layouts "layouts/*.txt" --power-curve input/BlockageWebAppInputs/PowerCurve.txt --concurrency 10 --output blockage_screening.csv
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import aiohttp
+import pandas as pd
+
+script_dir_name = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir_name)
+import blockage_payload
+
+API_URL = 'https://windfarmer.dnv.com/api/v3/'
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def case_hash(input_data: dict) -> str:
+    """sha256 of the canonical json of a BlockageCorrection input, the same for inputs that differ only in key order."""
+    canonical = json.dumps(input_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class BlockageResultsCache:
+    """
+    BlockageCorrection results keyed by case_hash of the input, optionally persisted to a json file.
+
+    Only successful results are cached, so failed cases are retried on the next run.
+    """
+
+    def __init__(self, filename: str = None):
+        self.filename = filename
+        self.results = {}
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                self.results = json.load(f)
+
+    def get(self, key: str):
+        return self.results.get(key)
+
+    def put(self, key: str, result: dict):
+        self.results[key] = result
+
+    def save(self):
+        if self.filename:
+            with open(self.filename, 'w') as f:
+                json.dump(self.results, f)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def build_screening_cases(layouts: dict, pc_df: pd.DataFrame, stabilities=(True, False)) -> list:
+    """
+    Build one case per layout and stability option.
+
+    Parameters
+    ----------
+    layouts : dict
+        Layout data frames keyed by layout name, e.g. from blockage_payload.read_layouts.
+    pc_df : pd.DataFrame
+        Power curve, thrust curve and frequency distribution shared by every layout.
+    stabilities : tuple, optional
+        significantAtmosphericStability values to run, by default both (True, False)
+
+    Returns
+    -------
+    list
+        Dictionaries of layout, significantAtmosphericStability and the json input.
+    """
+    cases = []
+    for stability in stabilities:
+        inputs = blockage_payload.build_blockage_inputs(layouts, pc_df, stability)
+        for layout_name, input_data in inputs.items():
+            cases.append({"layout": layout_name, "significantAtmosphericStability": bool(stability), "input": input_data})
+    return cases
+
+
+def get_retry_wait(retry_after, attempt: int, retry_wait_seconds: float) -> float:
+    """Seconds to wait before a retry: the Retry-After header of the response if given in seconds, else exponential back off."""
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        return retry_wait_seconds * 2 ** attempt
+
+
+async def _call_blockage(session, semaphore, api_url, headers, input_data, max_retries, retry_wait_seconds):
+    start = time.time()
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        # hold a connection slot for the call only, not while backing off
+        async with semaphore:
+            try:
+                async with session.post(api_url + 'BlockageCorrection', headers=headers, json=input_data) as resp:
+                    if resp.status == 200:
+                        return await resp.json(), resp.status, time.time() - start, attempt
+                    status_code, message = resp.status, await resp.text()
+                    retry_after = resp.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # dropped connections and timeouts are retried like server errors, and fail only this case
+                status_code, message = None, f'{type(e).__name__}: {e}'
+        if (status_code is not None and status_code not in RETRY_STATUS_CODES) or attempt == max_retries:
+            return {"error": message}, status_code, time.time() - start, attempt
+        await asyncio.sleep(get_retry_wait(retry_after, attempt, retry_wait_seconds))
+
+
+async def run_blockage_cases_async(cases: list, auth_token: str, api_url: str = API_URL, concurrency: int = 10,
+                                   cache: BlockageResultsCache = None, max_retries: int = 2, retry_wait_seconds: float = 1.0) -> pd.DataFrame:
+    """
+    Call BlockageCorrection for every case concurrently, skipping cases already in the cache.
+
+    Parameters
+    ----------
+    cases : list
+        Cases from build_screening_cases, or any dictionaries with an "input" entry; the other entries are copied to the results table.
+    auth_token : str
+        WindFarmer API access key.
+    api_url : str, optional
+        Base url of the API.
+    concurrency : int, optional
+        Maximum number of requests in flight, by default 10
+    cache : BlockageResultsCache, optional
+        Results cache; a new in-memory cache is used if not given.
+    max_retries : int, optional
+        Retries for throttled (429) or server error responses and network errors, waiting the Retry-After of the
+        response or else backing off exponentially, by default 2
+    retry_wait_seconds : float, optional
+        First back off wait, by default 1.0
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per case, with the case entries, numberOfTurbines, blockageEffect, blockageLoss_pc, status_code, elapsed_s, retries, fromCache and inputHash.
+    """
+    cache = cache if cache is not None else BlockageResultsCache()
+    headers = {
+        'Authorization': f'Bearer {auth_token}',
+        'Content-Type': 'application/json'
+    }
+    hashes = [case_hash(case["input"]) for case in cases]
+    # identical inputs are only sent once
+    to_run = {}
+    for key, case in zip(hashes, cases):
+        if cache.get(key) is None and key not in to_run:
+            to_run[key] = case["input"]
+
+    responses = {}
+    if to_run:
+        semaphore = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+
+        async def run_case(key, input_data):
+            result, status_code, elapsed, retries = await _call_blockage(
+                session, semaphore, api_url, headers, input_data, max_retries, retry_wait_seconds)
+            # cache each result as it arrives, so it is kept whatever happens to the other cases
+            responses[key] = (status_code, elapsed, retries)
+            if status_code == 200:
+                cache.put(key, result)
+            else:
+                print(f'BlockageCorrection failed with response {status_code}: {result["error"][:200]}')
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*[run_case(key, input_data) for key, input_data in to_run.items()])
+
+    rows = []
+    for key, case in zip(hashes, cases):
+        result = cache.get(key)
+        status_code, elapsed, retries = responses.get(key, (200, 0.0, 0))
+        row = {k: v for k, v in case.items() if k != "input"}
+        blockage_effect = float(result['blockageEffect']) if result is not None else float('nan')
+        row.update({
+            "numberOfTurbines": len(case["input"]["turbines"]),
+            "blockageEffect": blockage_effect,
+            "blockageLoss_pc": (1.0 - blockage_effect) * 100,
+            "status_code": status_code,
+            "elapsed_s": elapsed,
+            "retries": retries,
+            "fromCache": key not in responses,
+            "inputHash": key,
+        })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_blockage_cases(cases: list, auth_token: str, api_url: str = API_URL, concurrency: int = 10,
+                       cache: BlockageResultsCache = None, max_retries: int = 2, retry_wait_seconds: float = 1.0) -> pd.DataFrame:
+    """Blocking wrapper of run_blockage_cases_async, for use from scripts. In a notebook await run_blockage_cases_async instead."""
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(run_blockage_cases_async(cases, auth_token, api_url, concurrency, cache, max_retries, retry_wait_seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Screen blockage for many layouts, for stable and unstable/neutral atmospheres.')
+    parser.add_argument('--layouts', nargs='+', required=True, help='tab separated layout files, or glob patterns')
+    parser.add_argument('--power-curve', required=True, help='tab separated power curve, thrust curve and frequency distribution file')
+    parser.add_argument('--stability', default='both', choices=['both', 'stable', 'unstable'])
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--cache', default=None, help='json file to keep results between runs')
+    parser.add_argument('--url', default=API_URL)
+    parser.add_argument('--output', default=None, help='csv file for the results table')
+    args = parser.parse_args()
+
+    layout_files = sorted(set(f for pattern in args.layouts for f in glob.glob(pattern)))
+    stabilities = {'both': (True, False), 'stable': (True,), 'unstable': (False,)}[args.stability]
+    cases = build_screening_cases(blockage_payload.read_layouts(layout_files),
+                                  blockage_payload.read_turbine_performance(args.power_curve), stabilities)
+
+    cache = BlockageResultsCache(args.cache)
+    start = time.time()
+    results_df = run_blockage_cases(cases, os.environ['WINDFARMER_ACCESS_KEY'], args.url, args.concurrency, cache)
+    cache.save()
+    print(f'{len(cases)} cases, {int((~results_df["fromCache"]).sum())} sent to the API, in {time.time() - start:.2f}s')
+    print(results_df.drop(columns=['inputHash']).to_string(index=False))
+    if args.output:
+        results_df.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# Build inputs for the WindFarmer API BlockageCorrection end point from tab separated files, as accepted by the blockage web app.
+#
+# Layout.txt holds one row per turbine, PowerCurve.txt one row per wind speed, e.g. see ./input/BlockageWebAppInputs.
+# The files are read with typed columns and checked, then converted to the json records in one step per table,
+# so large layouts (thousands of turbines) and finely binned curves don't need a python loop per row.
+# Many layouts can be built against one power curve for blockage screening, the curve records are then shared by every input.
+import os
+import numpy as np
+import pandas as pd
+
+LAYOUT_COLUMNS = {
+    'easting_m': np.float64,
+    'northing_m': np.float64,
+    'hubHeight_m': np.float64,
+    'rotorDiameter_m': np.float64,
+}
+
+TURBINE_PERFORMANCE_COLUMNS = {
+    'windSpeed_m_per_s': np.float64,
+    'powerOutput_kW': np.float64,
+    'thrustCoefficient': np.float64,
+    'frequency_pc': np.float64,
+}
+
+
+class BlockageInputError(ValueError):
+    """Raised when a layout or turbine performance table can't be used as a BlockageCorrection input."""
+
+
+def _read_table(filename: str, columns: dict) -> pd.DataFrame:
+    header = pd.read_csv(filename, sep='\t', nrows=0).columns
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise BlockageInputError(f'{filename} is missing columns: {", ".join(missing)}')
+    try:
+        return pd.read_csv(filename, sep='\t', usecols=list(columns), dtype=columns)[list(columns)]
+    except ValueError as e:
+        raise BlockageInputError(f'{filename} has non numeric values: {e}') from e
+
+
+def _check_columns(df: pd.DataFrame, columns: dict, table_name: str) -> list:
+    problems = []
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        return [f'{table_name} is missing columns: {", ".join(missing)}']
+    if len(df) == 0:
+        return [f'{table_name} has no rows']
+    values = df[list(columns)].to_numpy(dtype=np.float64)
+    bad_rows = np.flatnonzero(~np.isfinite(values).all(axis=1))
+    if len(bad_rows) > 0:
+        problems.append(f'{table_name} has missing or non finite values in rows: {bad_rows[:10].tolist()}')
+    return problems
+
+
+def validate_layout(turbines_df: pd.DataFrame) -> None:
+    """
+    Check a layout table has the columns and values needed by the BlockageCorrection end point.
+
+    Parameters
+    ----------
+    turbines_df : pd.DataFrame
+        One row per turbine, with the columns of LAYOUT_COLUMNS.
+
+    Raises
+    ------
+    BlockageInputError
+        Listing every problem found.
+    """
+    problems = _check_columns(turbines_df, LAYOUT_COLUMNS, 'Layout')
+    if not problems:
+        for column in ['hubHeight_m', 'rotorDiameter_m']:
+            bad_rows = np.flatnonzero(turbines_df[column].to_numpy() <= 0)
+            if len(bad_rows) > 0:
+                problems.append(f'Layout {column} must be positive, check rows: {bad_rows[:10].tolist()}')
+        duplicates = np.flatnonzero(turbines_df.duplicated(subset=['easting_m', 'northing_m']).to_numpy())
+        if len(duplicates) > 0:
+            problems.append(f'Layout has turbines at the same location, check rows: {duplicates[:10].tolist()}')
+    if problems:
+        raise BlockageInputError('\n'.join(problems))
+
+
+def validate_turbine_performance(pc_df: pd.DataFrame, frequency_tolerance_pc: float = 1.0) -> None:
+    """
+    Check a power curve, thrust curve and frequency distribution table for the BlockageCorrection end point.
+
+    Parameters
+    ----------
+    pc_df : pd.DataFrame
+        One row per wind speed, with the columns of TURBINE_PERFORMANCE_COLUMNS.
+    frequency_tolerance_pc : float, optional
+        Allowed relative difference of the summed frequencies from 100%, in percent, by default 1.0
+        Frequencies given as fractions, summing to 1, are also accepted, as in the web app example files.
+
+    Raises
+    ------
+    BlockageInputError
+        Listing every problem found.
+    """
+    problems = _check_columns(pc_df, TURBINE_PERFORMANCE_COLUMNS, 'Turbine performance')
+    if not problems:
+        wind_speeds = pc_df['windSpeed_m_per_s'].to_numpy()
+        if np.any(np.diff(wind_speeds) <= 0):
+            problems.append('Turbine performance wind speeds must be strictly increasing')
+        if np.any(pc_df['powerOutput_kW'].to_numpy() < 0):
+            problems.append('Turbine performance powerOutput_kW must not be negative')
+        if np.any(pc_df['thrustCoefficient'].to_numpy() < 0):
+            problems.append('Turbine performance thrustCoefficient must not be negative')
+        frequencies = pc_df['frequency_pc'].to_numpy()
+        if np.any(frequencies < 0):
+            problems.append('Turbine performance frequency_pc must not be negative')
+        else:
+            total = frequencies.sum()
+            if all(abs(total / expected - 1.0) * 100.0 > frequency_tolerance_pc for expected in [100.0, 1.0]):
+                problems.append(f'Turbine performance frequency_pc sums to {total:.3f}, expected 100 (or 1 as fractions)')
+    if problems:
+        raise BlockageInputError('\n'.join(problems))
+
+
+def read_layout(filename: str) -> pd.DataFrame:
+    """Read and check a tab separated layout file with columns easting_m, northing_m, hubHeight_m, rotorDiameter_m."""
+    turbines_df = _read_table(filename, LAYOUT_COLUMNS)
+    validate_layout(turbines_df)
+    return turbines_df
+
+
+def read_turbine_performance(filename: str) -> pd.DataFrame:
+    """Read and check a tab separated file with columns windSpeed_m_per_s, powerOutput_kW, thrustCoefficient, frequency_pc."""
+    pc_df = _read_table(filename, TURBINE_PERFORMANCE_COLUMNS)
+    validate_turbine_performance(pc_df)
+    return pc_df
+
+
+def read_layouts(filenames: list) -> dict:
+    """
+    Read several layout files, keyed by file name without extension, e.g. for screening layout options.
+
+    Raises BlockageInputError if two files have the same name, e.g. in different folders, rather than keep only one.
+    """
+    names = {}
+    for filename in filenames:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if name in names:
+            raise BlockageInputError(f'Layout files {names[name]} and {filename} have the same name, rename one of them')
+        names[name] = filename
+    return {name: read_layout(filename) for name, filename in names.items()}
+
+
+def to_records(df: pd.DataFrame, columns: dict) -> list:
+    """Convert the given columns of a data frame to a list of dictionaries of python floats, ready to serialise to json."""
+    return df[list(columns)].astype(np.float64).to_dict('records')
+
+
+def build_blockage_input(turbines_df: pd.DataFrame, pc_df: pd.DataFrame, significant_atmospheric_stability: bool,
+                         validate: bool = True) -> dict:
+    """
+    Build the input for one call to the BlockageCorrection end point.
+
+    Parameters
+    ----------
+    turbines_df : pd.DataFrame
+        Layout, one row per turbine.
+    pc_df : pd.DataFrame
+        Power curve, thrust curve and frequency distribution, one row per wind speed.
+    significant_atmospheric_stability : bool
+        True if the site has significant atmospheric stability.
+    validate : bool, optional
+        Check the tables before building the input, by default True.
+        Tables returned by read_layout and read_turbine_performance are already checked.
+
+    Returns
+    -------
+    dict
+        The json input for the end point.
+    """
+    if validate:
+        validate_layout(turbines_df)
+        validate_turbine_performance(pc_df)
+    return {"turbines": to_records(turbines_df, LAYOUT_COLUMNS),
+            "turbinePerformance": to_records(pc_df, TURBINE_PERFORMANCE_COLUMNS),
+            "significantAtmosphericStability": bool(significant_atmospheric_stability)}
+
+
+def build_blockage_inputs(layouts: dict, pc_df: pd.DataFrame, significant_atmospheric_stability: bool,
+                          validate: bool = True) -> dict:
+    """
+    Build BlockageCorrection inputs for many layouts that share one power curve and frequency distribution.
+
+    Parameters
+    ----------
+    layouts : dict
+        Layout data frames keyed by a name for each layout, e.g. from read_layouts.
+    pc_df : pd.DataFrame
+        Power curve, thrust curve and frequency distribution, one row per wind speed.
+    significant_atmospheric_stability : bool
+        True if the site has significant atmospheric stability.
+    validate : bool, optional
+        Check the tables before building the inputs, by default True.
+
+    Returns
+    -------
+    dict
+        The json inputs keyed by layout name. The turbinePerformance list is built once and shared by every input, so don't modify it in place.
+    """
+    if validate:
+        validate_turbine_performance(pc_df)
+    pc_records = to_records(pc_df, TURBINE_PERFORMANCE_COLUMNS)
+    inputs = {}
+    for name, turbines_df in layouts.items():
+        if validate:
+            try:
+                validate_layout(turbines_df)
+            except BlockageInputError as e:
+                raise BlockageInputError(f'Layout "{name}": {e}') from e
+        inputs[name] = {"turbines": to_records(turbines_df, LAYOUT_COLUMNS),
+                        "turbinePerformance": pc_records,
+                        "significantAtmosphericStability": bool(significant_atmospheric_stability)}
+    return inputs
@@ -12,14 +12,27 @@ class WindFarmerAPI:
     """
     def __init__(self, 
                  auth_token: str,
-                 api_url: str = 'https://windfarmer.dnv.com/api/v3/'):
+                 api_url: str = 'https://windfarmer.dnv.com/api/v3/',
+                 metrics = None,
+                 max_retries: int = 0,
+                 retry_wait_seconds: float = 5.0,
+                 validate_inputs: bool = False):
         """
         Initialize the WindFarmerAPI class
         :param api_url: The base URL for the WindFarmer API
         :param auth_token: The authentication token for the WindFarmer API.
+        :param metrics: Optional ApiMetrics object (see api_metrics.py) to record latencies, payload sizes, retries and job queue/run times.
+        :param max_retries: Number of times to retry a request that is throttled (429) or finds the service unavailable (503).
+        :param retry_wait_seconds: Wait before the first retry, doubled for each further retry, unless the response gives a Retry-After header.
+        :param validate_inputs: Validate AEP inputs locally (see input_validation.py) before submitting them, raising AepInputValidationError
+            for a malformed input rather than using a queue slot to find out.
         """
         self.api_url = api_url
         self.auth_token = auth_token
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.retry_wait_seconds = retry_wait_seconds
+        self.validate_inputs = validate_inputs
         self.get_status()
 
     def print_errors(self, response):
@@ -35,10 +48,10 @@ class WindFarmerAPI:
         Check the status of the WindFarmer API, confirming the validity of your access key and the API version.
         :return: None
         """
-        response = requests.get(self.api_url + 'Status', headers = self._get_call_header())
+        response = self._request('GET', 'Status')
         print(f'Response from Status: {response.status_code}')
         if response.status_code == 200:
-            text = json.loads(response.text)
+            text = self._decode('Status', response)
             print(f'{text["message"]} You are ready to run calculations!')
             print(f'  WindFarmer API version = {text["windFarmerServicesAPIVersion"]}')
             print(f'  Calculations version = {text["calculationLibraryVersion"]}')
@@ -51,13 +64,13 @@ class WindFarmerAPI:
         Performs site classification of atmospheric conditions for a given location, using the WindFarmer API.
         :return: Atmospheric Conditions classes and a stablity rose, with the proportion of conditions in each class for each 12 direction sectors
         """
-        response = requests.get(self.api_url + 'AtmosphericConditions', headers = self._get_call_header(), params={
+        response = self._request('GET', 'AtmosphericConditions', params={
             "lat": lat,
             "lon": lon,
             "radiusKm": radiusKm,
             "landFractionThreshold": landFractionThreshold
         })
-        site_classification = response.json()
+        site_classification = self._decode('AtmosphericConditions', response)
 
         print(f'Response from AtmosphericConditions: {response.status_code}')
         if response.status_code == 200:
@@ -94,9 +107,8 @@ class WindFarmerAPI:
         """
         params = {}
         params["jobId"] = job_id
-        result =  requests.get(self.api_url + 'AnnualEnergyProductionAsync', 
-                               headers=self._get_call_header(), params= params)
-        result_json = json.loads(result.content)
+        result = await self._request_async('GET', 'AnnualEnergyProductionAsync', params= params)
+        result_json = self._decode('AnnualEnergyProductionAsync', result)
         # Get the status details from the response, if present
         message = result_json['message'] if 'message' in result_json else None
         stage_message = result_json['stageMessage'] if 'stageMessage' in result_json else None
@@ -106,46 +118,70 @@ class WindFarmerAPI:
         progress_message = ' - '.join([x for x in [progress, stage_message, message] if x])
         return (result_json['status'], progress_message, result_json['results'] if 'results' in result_json else None)
 
-    async def poll_for_status(self, job_id: str, min_polling_interval_seconds = 5, start_time = None) -> Tuple[str, str, str]:
+    async def poll_for_status(self, job_id: str, min_polling_interval_seconds = 5, start_time = None,
+                              first_poll_delay_seconds: float = None, timings: dict = None) -> Tuple[str, str, str]:
             """Poll the WindFarmer API for the status of an asynchronous job.
             It will return PENDING, RUNNING, SUCCESS or FAILED.
             If success, it will return the results of the calculation.  
+            If metrics are recorded, the time queued (from the first poll until first seen RUNNING) and running are taken from the status
+            transitions seen here, so are only resolved to the polling interval. The wait before the first poll is recorded separately.
             :param job_id: The ID of the job to poll.   
             :param min_polling_interval_seconds: The interval between polling calls in seconds.
+            :param start_time: The time the job was submitted, defaults to now.
+            :param first_poll_delay_seconds: The wait before the first poll, defaults to 5 to 6 seconds.
+            :param timings: Optional dictionary filled with the jobId, final status, firstPollDelay_s, queueWait_s and run_s of the job,
+                with the same resolution as the metrics.
             """
             if start_time == None:
                 start_time = time.time()
             status = "PENDING"
-            await ( asyncio.sleep(random.random() + 5))
+            running_time = None
+            await ( asyncio.sleep(random.random() + 5 if first_poll_delay_seconds is None else first_poll_delay_seconds))
+            # the queue clock starts at the first poll, so the client's own wait above isn't counted as service queueing
+            first_poll_time = time.time()
             while(status == 'PENDING' or status == 'RUNNING'):
                 (status, message, results ) = await self.get_jobstatus(job_id)
                 if status == 'PENDING':
                     print("...Calculation queued and waiting to start")
                 else:
+                    if running_time is None:
+                        running_time = time.time()
                     print(f'...Calculation status @ {time.time() - start_time:.2f}s: {status} - {message}')
+                    if status != 'RUNNING':
+                        break
                 await ( asyncio.sleep(random.random() + min_polling_interval_seconds))
+            end_time = time.time()
+            if self.metrics is not None:
+                self.metrics.record_job(job_id, status, running_time - first_poll_time, end_time - running_time,
+                                        first_poll_time - start_time)
+            if timings is not None:
+                timings.update({"jobId": job_id, "status": status, "firstPollDelay_s": first_poll_time - start_time,
+                                "queueWait_s": running_time - first_poll_time, "run_s": end_time - running_time})
             return status, message, results
 
-    async def call_aep_api_async(self, input_data:dict, min_polling_interval_seconds: int = 20) -> dict:
+    async def call_aep_api_async(self, input_data:dict, min_polling_interval_seconds: int = 20,
+                                 first_poll_delay_seconds: float = None, timings: dict = None) -> dict:
         """
         Call the WindFarmer API asynchronously to get the annual energy production.
         Aynchronous calculations are slower, given startup overheads, but reliable for long running calculations as we implement a job queue.
+        :param first_poll_delay_seconds: The wait before the first status poll, as for poll_for_status.
+        :param timings: Optional dictionary filled with the job timings, as for poll_for_status.
         """
+        if self.validate_inputs:
+            self._validate_input(input_data)
         start = time.time()
-        job_id_response = requests.post(
-            self.api_url + 'AnnualEnergyProductionAsync', 
-            headers=self._get_call_header(),
-            json = input_data)    
+        job_id_response = await self._request_async('POST', 'AnnualEnergyProductionAsync', input_data = input_data)
         print(f'Response {job_id_response.status_code} - {job_id_response.reason} in {time.time() - start:.2f}s')
         # Print the error detail if we haven't receieved a 200 OK response
         if job_id_response.status_code != 202:
             self.print_errors(job_id_response)
             raise Exception("Failed to submit AEP job")
         else:
-            job_ID = json.loads (job_id_response.text)["jobId"]
+            job_ID = self._decode('AnnualEnergyProductionAsync', job_id_response)["jobId"]
             print ('...Job submitted with ID: ')
             print (job_ID)
-            status, message, results = await self.poll_for_status(job_ID, min_polling_interval_seconds )
+            status, message, results = await self.poll_for_status(job_ID, min_polling_interval_seconds, start,
+                                                                  first_poll_delay_seconds, timings)
             if status == 'FAILED':
                 print(f'Calculation failed: {message}')
                 raise Exception(f"Calculation failed: {message}")
@@ -156,21 +192,96 @@ class WindFarmerAPI:
         """
         Synchronous calculations are faster, but not supported for the largest wind farms:
         """
+        if self.validate_inputs:
+            self._validate_input(input_data)
         start = time.time()
-        response = requests.post(
-            self.api_url + 'AnnualEnergyProduction', 
-            headers=self._get_call_header(),
-            json = input_data)
+        response = self._request('POST', 'AnnualEnergyProduction', input_data = input_data)
         print(f'Response {response.status_code} - {response.reason} in {time.time() - start:.2f}s')
 
         if response.status_code == 200:
-            results = json.loads(response.content)
+            results = self._decode('AnnualEnergyProduction', response)
             return results
         else:
             # Print the error detail if we haven't receieved a 200 OK response 
             self.print_errors(response)
             return None
         
+    def _validate_input(self, input_data: dict):
+        """Validate an AEP input locally, raising AepInputValidationError if it is malformed. The validator is only imported when used."""
+        if __package__:
+            from .input_validation import get_validator
+        else:
+            # imported with the script_lib folder on the path
+            from input_validation import get_validator
+        get_validator().check(input_data)
+
+    def _request(self, method: str, endpoint: str, input_data: dict = None, params: dict = None) -> requests.Response:
+        """
+        Send a request to an API end point, retrying throttled or unavailable responses up to max_retries times.
+        The json body is encoded here rather than by requests, so the encoding time and size can be recorded in the metrics.
+        This waits between retries with time.sleep, so coroutines use _request_async instead.
+        :param method: GET or POST
+        :param endpoint: The end point name, relative to api_url
+        :param input_data: The json body for a POST
+        :param params: Query parameters
+        :return: The last response
+        """
+        body, encode_seconds = self._encode(input_data)
+        for attempt in range(self.max_retries + 1):
+            response, wait_seconds = self._send(method, endpoint, body, encode_seconds if attempt == 0 else 0.0, params, attempt)
+            if wait_seconds is None:
+                return response
+            time.sleep(wait_seconds)
+        return response
+
+    async def _request_async(self, method: str, endpoint: str, input_data: dict = None, params: dict = None) -> requests.Response:
+        """
+        As _request, but waiting between retries with asyncio.sleep, so a throttled call doesn't hold up the other jobs on the event loop.
+        """
+        body, encode_seconds = self._encode(input_data)
+        for attempt in range(self.max_retries + 1):
+            response, wait_seconds = self._send(method, endpoint, body, encode_seconds if attempt == 0 else 0.0, params, attempt)
+            if wait_seconds is None:
+                return response
+            await asyncio.sleep(wait_seconds)
+        return response
+
+    def _encode(self, input_data: dict) -> Tuple[bytes, float]:
+        if input_data is None:
+            return None, 0.0
+        encode_start = time.time()
+        body = json.dumps(input_data, allow_nan=False).encode('utf-8')
+        return body, time.time() - encode_start
+
+    def _send(self, method: str, endpoint: str, body: bytes, encode_seconds: float, params: dict, attempt: int) -> Tuple[requests.Response, float]:
+        """Send one attempt of a request, recording it in the metrics. Returns the response and the wait before retrying it, None if not retried."""
+        start = time.time()
+        try:
+            response = requests.request(method, self.api_url + endpoint, headers=self._get_call_header(), params=params, data=body)
+        except requests.RequestException as e:
+            if self.metrics is not None:
+                self.metrics.record_error(endpoint, method, type(e).__name__, time.time() - start)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_request(endpoint, method, response.status_code, time.time() - start,
+                                        len(body) if body else 0, len(response.content), encode_seconds)
+        if response.status_code not in (429, 503) or attempt == self.max_retries:
+            return response, None
+        retry_after = response.headers.get('Retry-After')
+        wait_seconds = float(retry_after) if retry_after and retry_after.isdigit() else self.retry_wait_seconds * 2 ** attempt
+        print(f'Response {response.status_code} - {response.reason}, retrying {endpoint} in {wait_seconds:.0f}s')
+        if self.metrics is not None:
+            self.metrics.record_retry(endpoint, response.status_code, wait_seconds)
+        return response, wait_seconds
+
+    def _decode(self, endpoint: str, response: requests.Response):
+        """Decode a json response, recording the decoding time in the metrics."""
+        start = time.time()
+        result = json.loads(response.content)
+        if self.metrics is not None:
+            self.metrics.record_decode(endpoint, time.time() - start)
+        return result
+
     def _get_call_header(self) -> dict:
         headers = {
             'Authorization': f'Bearer {self.auth_token}',
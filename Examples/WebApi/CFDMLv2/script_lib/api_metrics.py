@@ -0,0 +1,238 @@
+from typing import Callable, List, Optional
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds in seconds, from quick Status calls to long running asynchronous AEP jobs
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket upper bounds, as used by Prometheus, plus count, sum and max.
+    """
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> List[int]:
+        """Counts of observations less than or equal to each bucket bound, the last one is +Inf"""
+        cumulative = []
+        total = 0
+        for c in self.counts:
+            total += c
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation within the bucket, as Prometheus histogram_quantile does."""
+        if self.count == 0:
+            return float('nan')
+        rank = q * self.count
+        lower_bound = 0.0
+        lower_count = 0
+        for bound, cumulative in zip(self.buckets, self.cumulative_counts()):
+            if cumulative >= rank:
+                in_bucket = cumulative - lower_count
+                estimate = lower_bound + (bound - lower_bound) * (rank - lower_count) / in_bucket if in_bucket else bound
+                return min(estimate, self.max)
+            lower_bound, lower_count = bound, cumulative
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.5) if self.count else None,
+            "p95": self.quantile(0.95) if self.count else None,
+            "buckets": {str(b): c for b, c in zip(list(self.buckets) + ['+Inf'], self.cumulative_counts())},
+        }
+
+
+class ApiMetrics:
+    """
+    Collects telemetry from WindFarmerAPI calls, to show whether a run is bound by the service queue, the network or local work.
+
+    For each endpoint it records:
+    * request latency histograms, by endpoint and method, and request counts by response status code
+    * request and response body bytes
+    * local time spent encoding inputs to json and decoding responses
+    * retries, by response status code, and requests that got no response (connection errors, timeouts), by exception type
+    * for asynchronous AEP jobs, queue wait (first status poll until first seen RUNNING) and run time (RUNNING until SUCCESS
+      or FAILED) histograms. These come from the status transitions seen when polling, so are resolved to the polling
+      interval. The client's wait between submitting a job and its first poll is recorded separately as the first poll
+      delay, so it isn't mistaken for service queueing.
+
+    Export with to_json or to_prometheus. Hooks, if given, are called with a dictionary for every event, e.g. to forward to a logger.
+    One instance can be shared by several WindFarmerAPI objects and threads.
+    """
+    def __init__(self, hooks: Optional[List[Callable[[dict], None]]] = None, buckets=DEFAULT_LATENCY_BUCKETS, prefix: str = 'windfarmer_api'):
+        """
+        :param hooks: Functions called with each event dictionary
+        :param buckets: Latency histogram bucket upper bounds, in seconds
+        :param prefix: Prefix for Prometheus metric names
+        """
+        self.hooks = list(hooks) if hooks else []
+        self.buckets = buckets
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.latency = {}          # (endpoint, method) -> Histogram
+        self.requests = {}         # (endpoint, method, status_code) -> count
+        self.request_bytes = {}    # endpoint -> bytes
+        self.response_bytes = {}   # endpoint -> bytes
+        self.encode_seconds = {}   # endpoint -> seconds
+        self.decode_seconds = {}   # endpoint -> seconds
+        self.retries = {}          # (endpoint, status_code) -> count
+        self.errors = {}           # (endpoint, method, exception type) -> count
+        self.job_queue_wait = Histogram(buckets)
+        self.job_run = Histogram(buckets)
+        self.job_first_poll_delay = Histogram(buckets)
+        self.jobs = {}             # final status -> count
+        self.started = time.time()
+
+    def _emit(self, event: dict):
+        for hook in self.hooks:
+            hook(event)
+
+    def record_request(self, endpoint: str, method: str, status_code: int, latency_seconds: float,
+                       request_bytes: int = 0, response_bytes: int = 0, encode_seconds: float = 0.0):
+        """Record one HTTP request and response."""
+        with self._lock:
+            self.latency.setdefault((endpoint, method), Histogram(self.buckets)).observe(latency_seconds)
+            key = (endpoint, method, status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_bytes[endpoint] = self.request_bytes.get(endpoint, 0) + request_bytes
+            self.response_bytes[endpoint] = self.response_bytes.get(endpoint, 0) + response_bytes
+            self.encode_seconds[endpoint] = self.encode_seconds.get(endpoint, 0.0) + encode_seconds
+        self._emit({"event": "request", "endpoint": endpoint, "method": method, "status_code": status_code,
+                    "latency_s": latency_seconds, "request_bytes": request_bytes, "response_bytes": response_bytes,
+                    "encode_s": encode_seconds})
+
+    def record_decode(self, endpoint: str, decode_seconds: float):
+        """Record the local time to decode a json response."""
+        with self._lock:
+            self.decode_seconds[endpoint] = self.decode_seconds.get(endpoint, 0.0) + decode_seconds
+        self._emit({"event": "decode", "endpoint": endpoint, "decode_s": decode_seconds})
+
+    def record_retry(self, endpoint: str, status_code: int, wait_seconds: float):
+        """Record a request that will be retried after wait_seconds."""
+        with self._lock:
+            key = (endpoint, status_code)
+            self.retries[key] = self.retries.get(key, 0) + 1
+        self._emit({"event": "retry", "endpoint": endpoint, "status_code": status_code, "wait_s": wait_seconds})
+
+    def record_error(self, endpoint: str, method: str, error_type: str, latency_seconds: float):
+        """Record a request that got no response, e.g. a connection error or timeout."""
+        with self._lock:
+            key = (endpoint, method, error_type)
+            self.errors[key] = self.errors.get(key, 0) + 1
+        self._emit({"event": "error", "endpoint": endpoint, "method": method, "error": error_type, "latency_s": latency_seconds})
+
+    def record_job(self, job_id: str, status: str, queue_wait_seconds: float, run_seconds: float, first_poll_delay_seconds: float = 0.0):
+        """Record a finished asynchronous job, with the time spent queued and running, and the client's delay before its first poll."""
+        with self._lock:
+            self.job_queue_wait.observe(queue_wait_seconds)
+            self.job_run.observe(run_seconds)
+            self.job_first_poll_delay.observe(first_poll_delay_seconds)
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+        self._emit({"event": "job", "job_id": job_id, "status": status,
+                    "queue_wait_s": queue_wait_seconds, "run_s": run_seconds, "first_poll_delay_s": first_poll_delay_seconds})
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for (endpoint, method), histogram in self.latency.items():
+                endpoints.setdefault(endpoint, {})[method] = {
+                    "latency_s": histogram.to_dict(),
+                    "status_codes": {str(code): n for (e, m, code), n in self.requests.items() if e == endpoint and m == method},
+                }
+            for endpoint in endpoints:
+                endpoints[endpoint]["request_bytes"] = self.request_bytes.get(endpoint, 0)
+                endpoints[endpoint]["response_bytes"] = self.response_bytes.get(endpoint, 0)
+                endpoints[endpoint]["encode_s"] = self.encode_seconds.get(endpoint, 0.0)
+                endpoints[endpoint]["decode_s"] = self.decode_seconds.get(endpoint, 0.0)
+                endpoints[endpoint]["retries"] = {str(code): n for (e, code), n in self.retries.items() if e == endpoint}
+            for (endpoint, method, error_type), n in self.errors.items():
+                errors = endpoints.setdefault(endpoint, {}).setdefault(method, {}).setdefault("errors", {})
+                errors[error_type] = n
+            return {
+                "elapsed_s": time.time() - self.started,
+                "endpoints": endpoints,
+                "jobs": {
+                    "final_status": dict(self.jobs),
+                    "queue_wait_s": self.job_queue_wait.to_dict(),
+                    "run_s": self.job_run.to_dict(),
+                    "first_poll_delay_s": self.job_first_poll_delay.to_dict(),
+                },
+            }
+
+    def to_json(self, filename: str = None, indent: int = 2) -> str:
+        """Return the metrics as a json string, and write them to filename if given."""
+        text = json.dumps(self.to_dict(), indent=indent)
+        if filename:
+            with open(filename, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format, e.g. to write to a node exporter textfile collector."""
+        p = self.prefix
+        lines = []
+
+        def labels(**kwargs):
+            return '{' + ','.join(f'{k}="{v}"' for k, v in kwargs.items()) + '}' if kwargs else ''
+
+        def histogram(name, help_text, items):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} histogram')
+            for label_values, h in items:
+                for bound, cumulative in zip(list(h.buckets) + ['+Inf'], h.cumulative_counts()):
+                    lines.append(f'{p}_{name}_bucket{labels(**label_values, le=bound)} {cumulative}')
+                lines.append(f'{p}_{name}_sum{labels(**label_values)} {h.sum}')
+                lines.append(f'{p}_{name}_count{labels(**label_values)} {h.count}')
+
+        def counter(name, help_text, items):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} counter')
+            for label_values, value in items:
+                lines.append(f'{p}_{name}{labels(**label_values)} {value}')
+
+        with self._lock:
+            histogram('request_duration_seconds', 'Time from sending a request to receiving the response body.',
+                      [({"endpoint": e, "method": m}, h) for (e, m), h in sorted(self.latency.items())])
+            counter('requests_total', 'Requests by response status code.',
+                    [({"endpoint": e, "method": m, "code": c}, n) for (e, m, c), n in sorted(self.requests.items())])
+            counter('request_bytes_total', 'Request body bytes sent.',
+                    [({"endpoint": e}, n) for e, n in sorted(self.request_bytes.items())])
+            counter('response_bytes_total', 'Response body bytes received.',
+                    [({"endpoint": e}, n) for e, n in sorted(self.response_bytes.items())])
+            counter('encode_seconds_total', 'Local time encoding request bodies to json.',
+                    [({"endpoint": e}, s) for e, s in sorted(self.encode_seconds.items())])
+            counter('decode_seconds_total', 'Local time decoding json response bodies.',
+                    [({"endpoint": e}, s) for e, s in sorted(self.decode_seconds.items())])
+            counter('retries_total', 'Requests retried, by the response status code that caused the retry.',
+                    [({"endpoint": e, "code": c}, n) for (e, c), n in sorted(self.retries.items())])
+            counter('request_errors_total', 'Requests that got no response, by exception type, e.g. connection errors and timeouts.',
+                    [({"endpoint": e, "method": m, "error": t}, n) for (e, m, t), n in sorted(self.errors.items())])
+            histogram('job_queue_wait_seconds', 'Asynchronous job time from the first status poll until first seen RUNNING. '
+                      'Excludes the client delay before the first poll, see job_first_poll_delay_seconds.',
+                      [({}, self.job_queue_wait)])
+            histogram('job_first_poll_delay_seconds', 'Client wait between submitting an asynchronous job and its first status poll.',
+                      [({}, self.job_first_poll_delay)])
+            histogram('job_run_seconds', 'Asynchronous job time from first seen RUNNING until SUCCESS or FAILED.',
+                      [({}, self.job_run)])
+            counter('jobs_total', 'Finished asynchronous jobs by final status.',
+                    [({"status": s}, n) for s, n in sorted(self.jobs.items())])
+        return '\n'.join(lines) + '\n'
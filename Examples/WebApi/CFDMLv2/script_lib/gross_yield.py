@@ -0,0 +1,384 @@
+"""
+Local estimate of the gross (no wake, no blockage) annual energy yield of each turbine from AEP API inputs.
+
+Everything needed for a gross yield is already in the AEP input json: the frequency distribution of each wind climate,
+the speed-ups from the climate to each turbine location, the turbine performance data and the reference air density.
+The yield of every turbine is found at once from (turbines x direction sectors x speed bins) arrays, so thousands of
+layout variants can be screened locally in seconds before sending a shortlist to the API.
+
+The speed of each bin is taken at its centre, as the API does for freeMeanWindSpeed_m_per_s, and a year is 8766 hours.
+For TheBowl the free mean wind speeds match the API results and the gross yields are within about 0.1% of
+grossAnnualYield_MWh_per_year (see api_io/cfdmlv2api_per_turbine_results_TheBowl.csv).
+"""
+
+import numpy as np
+import pandas as pd
+
+HOURS_PER_YEAR = 8766.0
+
+
+def get_speed_bin_centres(wind_climate):
+    """
+    Get the centre wind speed of each speed bin of a wind climate.
+
+    Parameters:
+    -----------
+    wind_climate : dict
+        An entry of the windClimates list
+
+    Returns:
+    --------
+    numpy.ndarray
+        Bin centre wind speeds in m/s, the first bin starting at 0
+    """
+    upper_limits = np.asarray(wind_climate["windSpeedBinUpperLimits_m_per_s"], dtype=float)
+    lower_limits = np.concatenate(([0.0], upper_limits[:-1]))
+    return 0.5 * (lower_limits + upper_limits)
+
+
+def get_direction_sector_centres(wind_climate):
+    """
+    Get the centre direction of each direction sector of a wind climate, in degrees.
+    """
+    n_sectors = int(wind_climate["numberOfDirectionSectors"])
+    return (float(wind_climate["directionForFirstBinCentre_degrees"]) + 360.0 * np.arange(n_sectors) / n_sectors) % 360.0
+
+
+def interpolate_over_directions(directions, values, to_directions):
+    """
+    Interpolate values given at directions to other directions, periodically over 360 degrees.
+
+    Parameters:
+    -----------
+    directions : array-like
+        Directions of the values, in degrees
+    values : array-like
+        Values, with directions along the last axis
+    to_directions : array-like
+        Directions to interpolate to, in degrees
+
+    Returns:
+    --------
+    numpy.ndarray
+        Interpolated values, with to_directions along the last axis
+    """
+    directions = np.asarray(directions, dtype=float) % 360.0
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(directions)
+    directions = directions[order]
+    values = values[..., order]
+    # wrap the first and last directions around so every direction lies between two
+    directions = np.concatenate(([directions[-1] - 360.0], directions, [directions[0] + 360.0]))
+    values = np.concatenate((values[..., -1:], values, values[..., :1]), axis=-1)
+    to_directions = np.asarray(to_directions, dtype=float) % 360.0
+    upper = np.searchsorted(directions, to_directions, side='right').clip(1, len(directions) - 1)
+    weight = (to_directions - directions[upper - 1]) / (directions[upper] - directions[upper - 1])
+    return values[..., upper - 1] * (1.0 - weight) + values[..., upper] * weight
+
+
+def get_air_density(input_json, heights_above_sea_level_m):
+    """
+    Get the air density at heights above sea level from the referenceAirDensity and its lapse rate.
+    """
+    reference = input_json["referenceAirDensity"]
+    heights = np.asarray(heights_above_sea_level_m, dtype=float)
+    return reference["airDensity_kg_per_m3"] + reference["lapseRate_kg_per_m3_per_m"] * (heights - reference["elevation_m"])
+
+
+def get_performance_curve(turbine_model, air_density, operational_mode="normal"):
+    """
+    Get the power and thrust curves of a turbine model at an air density.
+
+    The curves are interpolated linearly in air density between the performance data either side. Outside the air
+    densities of the performance data, the nearest curves are adjusted by scaling wind speeds by
+    (air density of the curve / air density) ^ (1/3), as for pitch regulated turbines in IEC 61400-12-1.
+
+    Parameters:
+    -----------
+    turbine_model : dict
+        An entry of the turbineModels list
+    air_density : float
+        Air density in kg/m3
+    operational_mode : str, optional
+        turbineOperationalMode of the performance data to use (default: "normal")
+
+    Returns:
+    --------
+    tuple
+        Wind speeds in m/s, power outputs in W and thrust coefficients
+    """
+    performance_data = [p for p in turbine_model["performanceData"] if p.get("turbineOperationalMode", operational_mode) == operational_mode]
+    if len(performance_data) == 0:
+        raise ValueError(f"Turbine model {turbine_model['id']} has no performance data for operational mode {operational_mode}")
+    performance_data = sorted(performance_data, key=lambda p: p["airDensity_kg_per_m3"])
+    densities = np.array([p["airDensity_kg_per_m3"] for p in performance_data], dtype=float)
+
+    def curve(p):
+        points = p["performanceDataPoints"]
+        return (np.array([x["windSpeed_m_per_s"] for x in points], dtype=float),
+                np.array([x["powerOutput_W"] for x in points], dtype=float),
+                np.array([x.get("thrustCoefficient", 0.0) for x in points], dtype=float))
+
+    if air_density <= densities[0] or air_density >= densities[-1]:
+        i = 0 if air_density <= densities[0] else len(densities) - 1
+        speeds, power, thrust = curve(performance_data[i])
+        return speeds * (densities[i] / air_density) ** (1.0 / 3.0), power, thrust
+    upper = int(np.searchsorted(densities, air_density))
+    lower_speeds, lower_power, lower_thrust = curve(performance_data[upper - 1])
+    upper_speeds, upper_power, upper_thrust = curve(performance_data[upper])
+    speeds = np.union1d(lower_speeds, upper_speeds)
+    weight = (air_density - densities[upper - 1]) / (densities[upper] - densities[upper - 1])
+
+    def blend(lower_values, upper_values):
+        return (1.0 - weight) * np.interp(speeds, lower_speeds, lower_values, left=0.0, right=0.0) + \
+            weight * np.interp(speeds, upper_speeds, upper_values, left=0.0, right=0.0)
+    return speeds, blend(lower_power, upper_power), blend(lower_thrust, upper_thrust)
+
+
+def get_power_curve(turbine_model, air_density, operational_mode="normal"):
+    """
+    Get the power curve of a turbine model at an air density, see get_performance_curve.
+
+    Returns:
+    --------
+    tuple
+        Wind speeds in m/s and power outputs in W
+    """
+    speeds, power, _ = get_performance_curve(turbine_model, air_density, operational_mode)
+    return speeds, power
+
+
+def interpolate_performance_curves(speeds, performance_curves, curve_index, column=1):
+    """
+    Interpolate the performance curve of each turbine, with zero outside the curve (below cut-in and above cut-out).
+
+    Parameters:
+    -----------
+    speeds : numpy.ndarray
+        Wind speeds, with turbines along the first axis
+    performance_curves : list
+        (wind speeds, power outputs, thrust coefficients) of each performance curve, from get_performance_curve
+    curve_index : numpy.ndarray
+        Performance curve of each turbine
+    column : int, optional
+        1 for power output, 2 for thrust coefficient (default: 1)
+
+    Returns:
+    --------
+    numpy.ndarray
+        Power output or thrust coefficient for each speed
+    """
+    values = np.zeros_like(speeds)
+    # one np.interp call for all the turbines sharing a performance curve
+    for i in np.unique(curve_index):
+        turbines = curve_index == i
+        curve = performance_curves[i]
+        values[turbines] = np.interp(speeds[turbines], curve[0], curve[column], left=0.0, right=0.0)
+    return values
+
+
+class GrossYieldModel:
+    """
+    A class to estimate the gross annual energy yield of each turbine from an AEP API input json,
+    and of layout variants of it, without calling the API.
+    """
+    def __init__(self, input_json: dict, operational_mode: str = "normal"):
+        """
+        Initialize the GrossYieldModel class.
+        :param input_json: AEP API input json, e.g. as prepared for cfdml_v2_calculator.ipynb
+        :param operational_mode: turbineOperationalMode of the performance data to use
+        """
+        self.input_json = input_json
+        self.operational_mode = operational_mode
+        self.turbine_models = {m["id"]: m for m in input_json["turbineModels"]}
+        self.wind_climates = {}
+        for wind_climate in input_json["windClimates"]:
+            probability = np.asarray(wind_climate["probabilityDistribution"], dtype=float)
+            self.wind_climates[wind_climate["id"]] = {
+                "probability": probability / probability.sum(),
+                "speeds": get_speed_bin_centres(wind_climate),
+                "directions": get_direction_sector_centres(wind_climate),
+            }
+        flow_model = input_json.get("flowModel") or {}
+        speed_ups = flow_model.get("speedsUps") or []
+        self.reference_directions = np.asarray(flow_model.get("referenceDirections_degrees") or [], dtype=float)
+        self.speed_up_ids = {s["id"]: i for i, s in enumerate(speed_ups)}
+        self.speed_up_locations = np.array([[s["easting_m"], s["northing_m"]] for s in speed_ups], dtype=float).reshape(-1, 2)
+        self.speed_ups = np.array([s["speedUps"] for s in speed_ups], dtype=float).reshape(len(speed_ups), -1)
+        self._performance_curves = {}
+
+    def get_turbines(self, include_neighbors: bool = False) -> pd.DataFrame:
+        """Get the turbines of the input json as a dataframe, one row per turbine."""
+        rows = []
+        for wind_farm in self.input_json["windFarms"]:
+            if wind_farm.get("isNeighbor", False) and not include_neighbors:
+                continue
+            for turbine in wind_farm["turbines"]:
+                rows.append({
+                    "farm_name": wind_farm["name"],
+                    "turbineName": turbine["name"],
+                    "isNeighbor": bool(wind_farm.get("isNeighbor", False)),
+                    "easting": turbine["location"]["easting_m"],
+                    "northing": turbine["location"]["northing_m"],
+                    "terrainHeightAboveSeaLevel_m": turbine["location"].get("terrainHeightAboveSeaLevel_m", 0.0),
+                    "associatedWindClimateId": turbine["associatedWindClimateId"],
+                    "turbineModelId": turbine["turbineModelId"],
+                })
+        return pd.DataFrame(rows)
+
+    def _get_speed_up_rows(self, turbines: pd.DataFrame) -> np.ndarray:
+        # speed-ups are matched by id, "<farm name> <turbine name>", or else taken from the nearest speed-up location,
+        # e.g. for a turbine moved in a layout variant
+        rows = np.array([self.speed_up_ids.get(f"{f} {t}", -1) for f, t in zip(turbines["farm_name"], turbines["turbineName"])], dtype=int)
+        missing = rows < 0
+        if missing.any() and len(self.speed_up_locations) > 0:
+            locations = turbines.loc[missing, ["easting", "northing"]].to_numpy(dtype=float)
+            distances = ((locations[:, None, :] - self.speed_up_locations[None, :, :]) ** 2).sum(axis=2)
+            rows[missing] = distances.argmin(axis=1)
+        return rows
+
+    def _get_performance_curve_index(self, turbine_model_ids, air_densities):
+        # performance curves are shared by turbines of the same model at the same air density (to 0.0001 kg/m3)
+        keys = [(m, round(float(rho), 4)) for m, rho in zip(turbine_model_ids, air_densities)]
+        for key in set(keys) - set(self._performance_curves):
+            self._performance_curves[key] = get_performance_curve(self.turbine_models[key[0]], key[1], self.operational_mode)
+        unique_keys = sorted(set(keys))
+        index = {key: i for i, key in enumerate(unique_keys)}
+        return [self._performance_curves[key] for key in unique_keys], np.array([index[key] for key in keys], dtype=int)
+
+    def _prepare_turbines(self, turbines: pd.DataFrame) -> dict:
+        # what is needed to evaluate each turbine: rotor, air density, performance curve and speed-ups
+        hub_heights = np.array([self.turbine_models[m]["hubHeight_m"] for m in turbines["turbineModelId"]], dtype=float)
+        air_densities = get_air_density(self.input_json, turbines["terrainHeightAboveSeaLevel_m"].to_numpy(dtype=float) + hub_heights)
+        performance_curves, curve_index = self._get_performance_curve_index(turbines["turbineModelId"], air_densities)
+        return {
+            "hub_heights": hub_heights,
+            "rotor_diameters": np.array([self.turbine_models[m]["rotorDiameter_m"] for m in turbines["turbineModelId"]], dtype=float),
+            "air_densities": air_densities,
+            "performance_curves": performance_curves,
+            "curve_index": curve_index,
+            "speed_up_rows": self._get_speed_up_rows(turbines),
+        }
+
+    def _get_speed_ups(self, speed_up_rows: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        # turbines x directions, 1 if the input has no speed-ups
+        if len(self.speed_ups) == 0:
+            return np.ones((len(speed_up_rows), len(directions)))
+        return interpolate_over_directions(self.reference_directions, self.speed_ups, directions)[speed_up_rows]
+
+    def get_turbine_yields(self, turbines: pd.DataFrame = None, include_neighbors: bool = False, chunk_size: int = 2000) -> pd.DataFrame:
+        """
+        Estimate the gross annual energy yield of each turbine.
+
+        Parameters:
+        -----------
+        turbines : pandas.DataFrame, optional
+            Turbines as returned by get_turbines, e.g. with changed locations or rows removed.
+            The turbines of the input json if None.
+        include_neighbors : bool, optional
+            Include the turbines of neighbour farms, when turbines is None (default: False)
+        chunk_size : int, optional
+            Number of turbines evaluated at once, to bound the memory of the (turbines x sectors x speed bins) arrays
+
+        Returns:
+        --------
+        pandas.DataFrame
+            The turbines with airDensityAtHubHeight_kg_per_m3, freeMeanWindSpeed_m_per_s and grossAnnualYield_MWh_per_year,
+            named as in the turbineResults of the API
+        """
+        turbines = self.get_turbines(include_neighbors) if turbines is None else turbines.reset_index(drop=True)
+        prepared = self._prepare_turbines(turbines)
+
+        mean_wind_speed = np.empty(len(turbines))
+        gross_yield = np.empty(len(turbines))
+        climate_ids = turbines["associatedWindClimateId"].to_numpy()
+        for climate_id in np.unique(climate_ids):
+            wind_climate = self.wind_climates[climate_id]
+            in_climate = np.flatnonzero(climate_ids == climate_id)
+            for start in range(0, len(in_climate), chunk_size):
+                chunk = in_climate[start:start + chunk_size]
+                turbine_speed_ups = self._get_speed_ups(prepared["speed_up_rows"][chunk], wind_climate["directions"])
+                # turbines x sectors x speed bins
+                speeds = turbine_speed_ups[:, :, None] * wind_climate["speeds"][None, None, :]
+                power = interpolate_performance_curves(speeds, prepared["performance_curves"], prepared["curve_index"][chunk])
+                probability = wind_climate["probability"][None, :, :]
+                mean_wind_speed[chunk] = (probability * speeds).sum(axis=(1, 2))
+                gross_yield[chunk] = (probability * power).sum(axis=(1, 2)) * HOURS_PER_YEAR / 1e6
+
+        results = turbines.copy()
+        results["airDensityAtHubHeight_kg_per_m3"] = prepared["air_densities"]
+        results["freeMeanWindSpeed_m_per_s"] = mean_wind_speed
+        results["grossAnnualYield_MWh_per_year"] = gross_yield
+        return results
+
+    def get_layout_yields(self, layouts: dict, farm_name: str = None, turbine_model_id: str = None, chunk_size: int = 2000) -> pd.DataFrame:
+        """
+        Estimate the gross annual energy yield of many layout variants of a farm, in one vectorised pass.
+
+        Parameters:
+        -----------
+        layouts : dict
+            Layouts keyed by name, each a dataframe with easting and northing columns,
+            and optionally turbineName, turbineModelId and terrainHeightAboveSeaLevel_m
+        farm_name : str, optional
+            Farm whose turbines are replaced by each layout, the first subject farm if None
+        turbine_model_id : str, optional
+            Turbine model of turbines without a turbineModelId, the model of the farm's first turbine if None
+        chunk_size : int, optional
+            Number of turbines evaluated at once
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per layout with numberOfTurbines, grossAnnualYield_MWh_per_year and meanGrossAnnualYield_MWh_per_year
+        """
+        subject_farms = [w for w in self.input_json["windFarms"] if not w.get("isNeighbor", False)]
+        wind_farm = subject_farms[0] if farm_name is None else next(w for w in self.input_json["windFarms"] if w["name"] == farm_name)
+        first_turbine = wind_farm["turbines"][0]
+        defaults = {
+            "farm_name": wind_farm["name"],
+            "isNeighbor": bool(wind_farm.get("isNeighbor", False)),
+            "terrainHeightAboveSeaLevel_m": first_turbine["location"].get("terrainHeightAboveSeaLevel_m", 0.0),
+            "associatedWindClimateId": first_turbine["associatedWindClimateId"],
+            "turbineModelId": turbine_model_id or first_turbine["turbineModelId"],
+        }
+        frames = []
+        for layout_name, layout in layouts.items():
+            frame = layout.reset_index(drop=True).copy()
+            for column, value in defaults.items():
+                if column not in frame:
+                    frame[column] = value
+            if "turbineName" not in frame:
+                # unmatched names, so speed-ups come from the nearest speed-up location
+                frame["turbineName"] = [f"{layout_name} {i + 1}" for i in range(len(frame))]
+            frame["layout"] = layout_name
+            frames.append(frame)
+        results = self.get_turbine_yields(pd.concat(frames, ignore_index=True), chunk_size=chunk_size)
+        summary = results.groupby("layout", sort=False)["grossAnnualYield_MWh_per_year"].agg(["count", "sum", "mean"])
+        summary.columns = ["numberOfTurbines", "grossAnnualYield_MWh_per_year", "meanGrossAnnualYield_MWh_per_year"]
+        return summary.reset_index()
+
+
+def compare_with_api_results(estimated: pd.DataFrame, api_results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compare estimated gross yields with per turbine API results, e.g. api_io/cfdmlv2api_per_turbine_results_<projectId>.csv.
+
+    Parameters:
+    -----------
+    estimated : pandas.DataFrame
+        Results of GrossYieldModel.get_turbine_yields
+    api_results : pandas.DataFrame
+        Per turbine API results with turbineName and grossAnnualYield_MWh_per_year columns, and farm_name if several farms
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Estimated and API gross yield and free mean wind speed of each turbine, with the relative differences
+    """
+    keys = ["farm_name", "turbineName"] if "farm_name" in api_results else ["turbineName"]
+    columns = ["grossAnnualYield_MWh_per_year", "freeMeanWindSpeed_m_per_s"]
+    api_columns = [c for c in columns if c in api_results]
+    comparison = estimated[keys + columns].merge(api_results[keys + api_columns], on=keys, suffixes=("_estimated", "_api"))
+    for column in api_columns:
+        comparison[column.split("_")[0] + "_relative_difference"] = comparison[column + "_estimated"] / comparison[column + "_api"] - 1.0
+    return comparison
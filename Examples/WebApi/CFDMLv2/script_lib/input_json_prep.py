@@ -6,6 +6,7 @@ via the WindFarmer API, including model settings, atmospheric conditions,
 and various calculation configurations.
 """
 
+import json
 import numpy as np
 
 # Large wind farm correction parameters (default offshore settings)
@@ -317,4 +318,59 @@ def set_model_settings_for_blockage_only_runs(input_json):
     input_json["energyEfficienciesSettings"]["includeHysteresisEffect"] = False
     input_json["energyEfficienciesSettings"]["includeCurtailmentRules"] = False
     input_json["energyEfficienciesSettings"]["calculateIdealYield"] = False
-    switch_off_fpm_export(input_json)
\ No newline at end of file
+    switch_off_fpm_export(input_json)
+
+def prune_unreferenced_inputs(input_json):
+    """
+    Remove wind climates, turbine models and speed-ups that no turbine refers to, e.g. after removing farms
+    or turbines from a payload (as generate_no_neighbours_inputs does), to reduce the size of the request body.
+
+    References are walked from windFarms[*].turbines:
+    - windClimates and weibullWindClimates are kept if a turbine's associatedWindClimateId refers to them
+    - turbineModels are kept if a turbine's turbineModelId refers to them
+    - flowModel.speedsUps are kept if their id is "<farm name> <turbine name>" of a turbine, or they are at a
+      turbine's location, or their id is a kept wind climate id (the speed-up at the wind climate location)
+
+    Parameters:
+    -----------
+    input_json : dict
+        The input JSON configuration dictionary, modified in place
+
+    Returns:
+    --------
+    dict
+        The removed ids under "removed", and the size of the compact JSON body before and after, and saved, in bytes
+    """
+    def body_bytes():
+        return len(json.dumps(input_json, separators=(',', ':')).encode('utf-8'))
+
+    bytes_before = body_bytes()
+    turbines = [(wind_farm["name"], turbine) for wind_farm in input_json["windFarms"] for turbine in wind_farm["turbines"]]
+    wind_climate_ids = set(turbine["associatedWindClimateId"] for _, turbine in turbines)
+    turbine_model_ids = set(turbine["turbineModelId"] for _, turbine in turbines)
+    speed_up_ids = set(f'{wind_farm_name} {turbine["name"]}' for wind_farm_name, turbine in turbines) | wind_climate_ids
+    turbine_locations = set((round(turbine["location"]["easting_m"], 2), round(turbine["location"]["northing_m"], 2)) for _, turbine in turbines)
+
+    removed = {}
+    for key in ["windClimates", "weibullWindClimates"]:
+        if input_json.get(key):
+            removed[key] = [w["id"] for w in input_json[key] if w["id"] not in wind_climate_ids]
+            input_json[key] = [w for w in input_json[key] if w["id"] in wind_climate_ids]
+    removed["turbineModels"] = [m["id"] for m in input_json["turbineModels"] if m["id"] not in turbine_model_ids]
+    input_json["turbineModels"] = [m for m in input_json["turbineModels"] if m["id"] in turbine_model_ids]
+
+    flow_model = input_json.get("flowModel")
+    if flow_model and flow_model.get("speedsUps"):
+        def is_referenced(speed_up):
+            return speed_up["id"] in speed_up_ids or \
+                (round(speed_up["easting_m"], 2), round(speed_up["northing_m"], 2)) in turbine_locations
+        removed["speedsUps"] = [s["id"] for s in flow_model["speedsUps"] if not is_referenced(s)]
+        flow_model["speedsUps"] = [s for s in flow_model["speedsUps"] if is_referenced(s)]
+
+    bytes_after = body_bytes()
+    return {
+        "removed": removed,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after,
+    }
@@ -0,0 +1,365 @@
+"""
+Local pre-flight validation of AEP API inputs, to catch malformed payloads before they are submitted.
+
+The schema below is compiled once into nested check functions, so validating a payload is a single pass of plain
+function calls, without interpreting the schema again. Numeric arrays (frequency distributions, turbulence
+intensities, speed bin limits) are checked as NumPy arrays. After the structure, the references between turbines,
+turbine models and wind climates, and the consistency of the numbers are checked.
+
+Validate a batch of payloads, or json files, in a process pool with validate_many.
+"""
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+class AepInputValidationError(ValueError):
+    """An AEP input failed validation. The messages are in errors."""
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__(f'{len(self.errors)} AEP input validation errors:\n' + '\n'.join(self.errors[:20]))
+
+
+class OptionalField:
+    """Marks a schema entry that may be missing or null."""
+    def __init__(self, spec):
+        self.spec = spec
+
+
+class NumberArray:
+    """Marks a numeric array of ndim dimensions, checked as a NumPy array."""
+    def __init__(self, ndim=1):
+        self.ndim = ndim
+
+
+NUMBER = "number"
+
+_performance_data_point = {
+    "windSpeed_m_per_s": NUMBER,
+    "powerOutput_W": NUMBER,
+    "thrustCoefficient": NUMBER,
+}
+
+AEP_INPUT_SCHEMA = {
+    "windFarms": [{
+        "name": str,
+        "isNeighbor": bool,
+        "turbines": [{
+            "name": str,
+            "associatedWindClimateId": str,
+            "turbineModelId": str,
+            "location": {
+                "easting_m": NUMBER,
+                "northing_m": NUMBER,
+                "terrainHeightAboveSeaLevel_m": OptionalField(NUMBER),
+            },
+        }],
+    }],
+    "turbineModels": [{
+        "id": str,
+        "rotorDiameter_m": NUMBER,
+        "hubHeight_m": NUMBER,
+        "performanceData": [{
+            "airDensity_kg_per_m3": NUMBER,
+            "performanceDataPoints": [_performance_data_point],
+        }],
+    }],
+    "windClimates": OptionalField([{
+        "id": str,
+        "numberOfDirectionSectors": int,
+        "directionForFirstBinCentre_degrees": NUMBER,
+        "windSpeedBinUpperLimits_m_per_s": NumberArray(1),
+        "probabilityDistribution": NumberArray(2),
+        "turbulenceIntensity": OptionalField(NumberArray(2)),
+    }]),
+    "weibullWindClimates": OptionalField([{
+        "id": str,
+    }]),
+    "referenceAirDensity": OptionalField({
+        "airDensity_kg_per_m3": NUMBER,
+        "lapseRate_kg_per_m3_per_m": NUMBER,
+        "elevation_m": NUMBER,
+    }),
+    "flowModel": OptionalField({
+        "referenceDirections_degrees": NumberArray(1),
+        "speedsUps": [{
+            "id": str,
+            "easting_m": NUMBER,
+            "northing_m": NUMBER,
+            "speedUps": NumberArray(1),
+        }],
+    }),
+    "energyEfficienciesSettings": {
+        "numberOfDirectionSectorsForWakeCalculation": int,
+        "wakeModel": {"wakeModelType": str},
+        "blockageModel": OptionalField({"blockageModelType": str}),
+    },
+}
+
+
+def _format_path(path):
+    return ''.join(f'[{p}]' if isinstance(p, int) else f'.{p}' for p in path).lstrip('.') or '<root>'
+
+
+def compile_schema(spec):
+    """
+    Compile a schema into a check function, check(value, path, errors), that appends a message to errors for each
+    problem found. path is a tuple of keys and indices, only formatted when there is an error.
+
+    Parameters:
+    -----------
+    spec : dict, list, type, NUMBER, NumberArray or OptionalField
+        A dict for an object with the given keys, [item spec] for a list, a type, NUMBER for an int or float
+        (not bool), NumberArray for a numeric array, OptionalField for an entry that may be missing or null
+
+    Returns:
+    --------
+    callable
+        The check function
+    """
+    if isinstance(spec, OptionalField):
+        check = compile_schema(spec.spec)
+
+        def check_optional(value, path, errors):
+            if value is not None:
+                check(value, path, errors)
+        return check_optional
+
+    if isinstance(spec, dict):
+        fields = [(key, compile_schema(s), isinstance(s, OptionalField)) for key, s in spec.items()]
+
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(f'{_format_path(path)}: expected an object, got {type(value).__name__}')
+                return
+            for key, check, optional in fields:
+                if key in value:
+                    check(value[key], path + (key,), errors)
+                elif not optional:
+                    errors.append(f'{_format_path(path + (key,))}: missing')
+        return check_object
+
+    if isinstance(spec, list):
+        check_item = compile_schema(spec[0])
+
+        def check_list(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(f'{_format_path(path)}: expected a list, got {type(value).__name__}')
+                return
+            for i, item in enumerate(value):
+                check_item(item, path + (i,), errors)
+        return check_list
+
+    if isinstance(spec, NumberArray):
+        ndim = spec.ndim
+
+        def check_array(value, path, errors):
+            try:
+                array = np.asarray(value, dtype=float)
+            except (TypeError, ValueError):
+                errors.append(f'{_format_path(path)}: expected a {ndim}D array of numbers (ragged or not numeric)')
+                return
+            if array.ndim != ndim:
+                errors.append(f'{_format_path(path)}: expected a {ndim}D array of numbers, got {array.ndim}D')
+            elif not np.isfinite(array).all():
+                errors.append(f'{_format_path(path)}: contains NaN or infinite values')
+        return check_array
+
+    if spec == NUMBER:
+        def check_number(value, path, errors):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors.append(f'{_format_path(path)}: expected a number, got {type(value).__name__}')
+            elif value != value or value in (float('inf'), float('-inf')):
+                errors.append(f'{_format_path(path)}: not finite')
+        return check_number
+
+    if spec is int:
+        def check_int(value, path, errors):
+            if isinstance(value, bool) or not isinstance(value, int):
+                errors.append(f'{_format_path(path)}: expected an integer, got {type(value).__name__}')
+        return check_int
+
+    if isinstance(spec, type):
+        def check_type(value, path, errors):
+            if not isinstance(value, spec):
+                errors.append(f'{_format_path(path)}: expected {spec.__name__}, got {type(value).__name__}')
+        return check_type
+
+    raise TypeError(f'Unsupported schema entry {spec!r}')
+
+
+class AepInputValidator:
+    """
+    Validates AEP API inputs: the structure against a compiled schema, then referential integrity and numbers.
+    Create once and reuse, as the schema is compiled when created.
+    """
+    def __init__(self, schema: dict = AEP_INPUT_SCHEMA, probability_tolerance: float = 1e-3):
+        """
+        :param schema: Schema of the input, see compile_schema
+        :param probability_tolerance: Allowed difference of the sum of each probabilityDistribution from 1
+        """
+        self._check_structure = compile_schema(schema)
+        self.probability_tolerance = probability_tolerance
+
+    def validate(self, input_json: dict) -> list:
+        """
+        Validate an AEP input.
+        :param input_json: The input JSON configuration dictionary
+        :return: Error messages, empty if the input is valid
+        """
+        errors = []
+        self._check_structure(input_json, (), errors)
+        if errors:
+            # the consistency checks rely on the structure
+            return errors
+        self._check_references(input_json, errors)
+        self._check_wind_climates(input_json, errors)
+        self._check_turbine_models(input_json, errors)
+        self._check_flow_model(input_json, errors)
+        if input_json["energyEfficienciesSettings"]["numberOfDirectionSectorsForWakeCalculation"] <= 0:
+            errors.append('energyEfficienciesSettings.numberOfDirectionSectorsForWakeCalculation: must be positive')
+        return errors
+
+    def check(self, input_json: dict):
+        """Validate an AEP input, raising AepInputValidationError if it isn't valid."""
+        errors = self.validate(input_json)
+        if errors:
+            raise AepInputValidationError(errors)
+
+    @staticmethod
+    def _check_unique(items, key, path, errors):
+        seen = set()
+        for i, item in enumerate(items):
+            if item[key] in seen:
+                errors.append(f'{path}[{i}].{key}: duplicate {item[key]!r}')
+            seen.add(item[key])
+        return seen
+
+    def _check_references(self, input_json, errors):
+        wind_farms = input_json["windFarms"]
+        if not any(not w["isNeighbor"] for w in wind_farms):
+            errors.append('windFarms: no subject (isNeighbor false) wind farm')
+        self._check_unique(wind_farms, "name", 'windFarms', errors)
+        turbine_model_ids = self._check_unique(input_json["turbineModels"], "id", 'turbineModels', errors)
+        wind_climate_ids = set()
+        for key in ["windClimates", "weibullWindClimates"]:
+            if input_json.get(key):
+                wind_climate_ids |= self._check_unique(input_json[key], "id", key, errors)
+        for i, wind_farm in enumerate(wind_farms):
+            self._check_unique(wind_farm["turbines"], "name", f'windFarms[{i}].turbines', errors)
+            for j, turbine in enumerate(wind_farm["turbines"]):
+                if turbine["turbineModelId"] not in turbine_model_ids:
+                    errors.append(f'windFarms[{i}].turbines[{j}].turbineModelId: no turbine model {turbine["turbineModelId"]!r}')
+                if turbine["associatedWindClimateId"] not in wind_climate_ids:
+                    errors.append(f'windFarms[{i}].turbines[{j}].associatedWindClimateId: no wind climate {turbine["associatedWindClimateId"]!r}')
+
+    def _check_wind_climates(self, input_json, errors):
+        for i, wind_climate in enumerate(input_json.get("windClimates") or []):
+            path = f'windClimates[{i}]'
+            upper_limits = np.asarray(wind_climate["windSpeedBinUpperLimits_m_per_s"], dtype=float)
+            if len(upper_limits) == 0 or upper_limits[0] <= 0 or np.any(np.diff(upper_limits) <= 0):
+                errors.append(f'{path}.windSpeedBinUpperLimits_m_per_s: must be positive and strictly increasing')
+            if wind_climate["numberOfDirectionSectors"] <= 0:
+                errors.append(f'{path}.numberOfDirectionSectors: must be positive')
+            shape = (wind_climate["numberOfDirectionSectors"], len(upper_limits))
+            probability = np.asarray(wind_climate["probabilityDistribution"], dtype=float)
+            if probability.shape != shape:
+                errors.append(f'{path}.probabilityDistribution: shape {probability.shape}, expected (sectors, speed bins) {shape}')
+            if np.any(probability < 0):
+                errors.append(f'{path}.probabilityDistribution: negative probabilities')
+            total = probability.sum()
+            if abs(total - 1.0) > self.probability_tolerance:
+                errors.append(f'{path}.probabilityDistribution: sums to {total:.6f}, expected 1')
+            if wind_climate.get("turbulenceIntensity") is not None:
+                turbulence_intensity = np.asarray(wind_climate["turbulenceIntensity"], dtype=float)
+                if turbulence_intensity.shape != shape:
+                    errors.append(f'{path}.turbulenceIntensity: shape {turbulence_intensity.shape}, expected {shape}')
+                elif np.any(turbulence_intensity < 0):
+                    errors.append(f'{path}.turbulenceIntensity: negative values')
+
+    def _check_turbine_models(self, input_json, errors):
+        for i, turbine_model in enumerate(input_json["turbineModels"]):
+            path = f'turbineModels[{i}]'
+            if turbine_model["rotorDiameter_m"] <= 0 or turbine_model["hubHeight_m"] <= 0:
+                errors.append(f'{path}: rotorDiameter_m and hubHeight_m must be positive')
+            if len(turbine_model["performanceData"]) == 0:
+                errors.append(f'{path}.performanceData: empty')
+            for j, performance_data in enumerate(turbine_model["performanceData"]):
+                points = np.array([[p["windSpeed_m_per_s"], p["powerOutput_W"], p["thrustCoefficient"]]
+                                   for p in performance_data["performanceDataPoints"]], dtype=float).reshape(-1, 3)
+                point_path = f'{path}.performanceData[{j}].performanceDataPoints'
+                if len(points) < 2:
+                    errors.append(f'{point_path}: fewer than 2 points')
+                    continue
+                if np.any(np.diff(points[:, 0]) <= 0):
+                    errors.append(f'{point_path}: wind speeds must be strictly increasing')
+                if np.any(points[:, 1] < 0) or np.any(points[:, 2] < 0):
+                    errors.append(f'{point_path}: negative power output or thrust coefficient')
+
+    def _check_flow_model(self, input_json, errors):
+        flow_model = input_json.get("flowModel")
+        if not flow_model:
+            return
+        n_directions = len(flow_model["referenceDirections_degrees"])
+        for i, speed_up in enumerate(flow_model["speedsUps"]):
+            if len(speed_up["speedUps"]) != n_directions:
+                errors.append(f'flowModel.speedsUps[{i}].speedUps: {len(speed_up["speedUps"])} values, '
+                              f'expected one per reference direction ({n_directions})')
+
+
+_default_validator = None
+
+
+def get_validator() -> AepInputValidator:
+    """Get the validator for the default schema, compiled on first use and then shared."""
+    global _default_validator
+    if _default_validator is None:
+        _default_validator = AepInputValidator()
+    return _default_validator
+
+
+def validate_aep_input(input_json: dict) -> list:
+    """
+    Validate an AEP input with the default validator.
+    :param input_json: The input JSON configuration dictionary
+    :return: Error messages, empty if the input is valid
+    """
+    return get_validator().validate(input_json)
+
+
+def _validate_in_worker(payload):
+    if isinstance(payload, (str, os.PathLike)):
+        # read files in the worker, so only the file name is sent to it
+        try:
+            with open(payload) as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            return [f'<file>: could not be read as json: {e}']
+    return validate_aep_input(payload)
+
+
+def validate_many(payloads, processes: int = None, chunksize: int = 16) -> list:
+    """
+    Validate many AEP inputs in a process pool, each worker compiling the schema once.
+
+    Parameters:
+    -----------
+    payloads : iterable
+        Input JSON dictionaries, or paths of json files (cheaper to send to the workers)
+    processes : int, optional
+        Number of worker processes (default: the number of CPUs). 0 validates in this process.
+    chunksize : int, optional
+        Payloads sent to a worker at a time (default: 16)
+
+    Returns:
+    --------
+    list
+        Error messages for each payload, in order, empty lists for valid payloads
+    """
+    payloads = list(payloads)
+    if processes == 0:
+        return [_validate_in_worker(p) for p in payloads]
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(_validate_in_worker, payloads, chunksize=chunksize))
@@ -0,0 +1,219 @@
+"""
+Direction sector convergence study for numberOfDirectionSectorsForWakeCalculation.
+
+The wake calculation time grows roughly linearly with the number of direction sectors, and our scripts use 180 by
+default. This runs one AEP input at several sector counts concurrently through WindFarmerAPI, records the wall time,
+full yield and internal wake efficiency of each, and recommends the fewest sectors whose full yield is within a
+tolerance of the finest setting run (and stays within it for every finer setting).
+
+The calculation cost of each setting is the time its job was seen RUNNING on the service, from the job status
+transitions, polled every few seconds so the resolution is set by --polling-interval rather than the polling interval
+call_aep_api picks for the farm size. For inputs with neighbouring farms a subject farm only case is also run at each
+setting, as AEPResultsProcessor needs one to split internal and external effects for CFD.ML.
+
+Example:
+    python sector_convergence.py --input api_io/cfdmlv2apiinputs_TheBowl.json --sectors 36 72 120 180 360 --tolerance 0.1
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import pandas as pd
+
+if __package__:
+    from .api_calls import WindFarmerAPI
+    from .aep_results import AEPResultsProcessor
+    from .cfdml_v2 import check_if_neighbours, generate_no_neighbours_inputs
+else:
+    # run as a script from the script_lib folder
+    from api_calls import WindFarmerAPI
+    from aep_results import AEPResultsProcessor
+    from cfdml_v2 import check_if_neighbours, generate_no_neighbours_inputs
+
+DEFAULT_SECTOR_COUNTS = (36, 72, 120, 180, 360)
+DEFAULT_POLLING_INTERVAL_SECONDS = 2.0
+
+
+def set_number_of_direction_sectors(input_json, number_of_direction_sectors):
+    """
+    Get a copy of an AEP input with numberOfDirectionSectorsForWakeCalculation set.
+
+    Parameters:
+    -----------
+    input_json : dict
+        The input JSON configuration dictionary, not changed
+    number_of_direction_sectors : int
+        Number of direction sectors for the wake calculation
+
+    Returns:
+    --------
+    dict
+        The changed copy
+    """
+    case_json = copy.deepcopy(input_json)
+    case_json["energyEfficienciesSettings"]["numberOfDirectionSectorsForWakeCalculation"] = int(number_of_direction_sectors)
+    return case_json
+
+
+def summarise_aep_results(input_json, results, subject_farm_results=None):
+    """
+    Get the full and gross yield of the subject farms, in GWh/year, and their internal wake efficiency.
+    subject_farm_results, from a calculation of the subject farms only, are needed for CFD.ML inputs with neighbours.
+    """
+    processor = AEPResultsProcessor(input_json, results, subject_farm_results)
+    return {
+        "fullYield_GWh_per_year": processor.get_full_yield(),
+        "grossYield_GWh_per_year": processor.get_gross_yield(),
+        "internalWakeEfficiency": processor.get_internal_wake_efficiency(),
+    }
+
+
+async def _run_job(wf_api, case_json, polling_interval_seconds):
+    timings = {}
+    results = await wf_api.call_aep_api_async(case_json, polling_interval_seconds, polling_interval_seconds, timings)
+    return results, timings
+
+
+async def _run_case(wf_api, case_json, number_of_direction_sectors, semaphore, polling_interval_seconds):
+    async with semaphore:
+        print(f'{number_of_direction_sectors} direction sectors: submitting')
+        start = time.time()
+        jobs = [_run_job(wf_api, case_json, polling_interval_seconds)]
+        if check_if_neighbours(case_json):
+            jobs.append(_run_job(wf_api, generate_no_neighbours_inputs(case_json), polling_interval_seconds))
+        try:
+            outcomes = await asyncio.gather(*jobs)
+            error = None
+        except Exception as e:
+            outcomes = None
+            error = str(e)
+        wall_time = time.time() - start
+        print(f'{number_of_direction_sectors} direction sectors: {"done" if error is None else "failed"} in {wall_time:.1f}s')
+        return outcomes, wall_time, error
+
+
+async def run_sector_convergence_study(wf_api: WindFarmerAPI, input_json: dict, sector_counts=DEFAULT_SECTOR_COUNTS,
+                                       concurrency: int = None,
+                                       polling_interval_seconds: float = DEFAULT_POLLING_INTERVAL_SECONDS) -> pd.DataFrame:
+    """
+    Run an AEP input at several numbers of wake direction sectors, concurrently.
+
+    Parameters:
+    -----------
+    wf_api : WindFarmerAPI
+        API connection to run the calculations
+    input_json : dict
+        The input JSON configuration dictionary, not changed
+    sector_counts : iterable of int, optional
+        Numbers of direction sectors to run (default: 36, 72, 120, 180, 360)
+    concurrency : int, optional
+        Maximum number of sector counts submitted at once (default: all of them)
+    polling_interval_seconds : float, optional
+        Interval between job status polls, the resolution of the measured times (default: 2)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per sector count, ascending, with calculationTime_s (first seen RUNNING until finished, of the case with
+        all farms), queueWait_s, wallTime_s (including the subject farm only case if any), fullYield_GWh_per_year,
+        grossYield_GWh_per_year, internalWakeEfficiency, the differences from the finest setting that succeeded
+        (fullYieldDelta_pc, internalWakeEfficiencyDelta_pc) and error.
+    """
+    sector_counts = sorted(set(int(n) for n in sector_counts))
+    semaphore = asyncio.Semaphore(concurrency or len(sector_counts))
+    outcomes = await asyncio.gather(*[
+        _run_case(wf_api, set_number_of_direction_sectors(input_json, n), n, semaphore, polling_interval_seconds)
+        for n in sector_counts])
+
+    rows = []
+    for n, (jobs, wall_time, error) in zip(sector_counts, outcomes):
+        row = {"numberOfDirectionSectors": n, "wallTime_s": wall_time}
+        if jobs is not None:
+            (results, timings), subject_farm_results = jobs[0], jobs[1][0] if len(jobs) > 1 else None
+            row["calculationTime_s"] = timings["run_s"]
+            row["queueWait_s"] = timings["queueWait_s"]
+            row.update(summarise_aep_results(input_json, results, subject_farm_results))
+        row["error"] = error
+        rows.append(row)
+    study = pd.DataFrame(rows, columns=["numberOfDirectionSectors", "calculationTime_s", "queueWait_s", "wallTime_s",
+                                        "fullYield_GWh_per_year", "grossYield_GWh_per_year", "internalWakeEfficiency", "error"])
+
+    succeeded = study[study["error"].isna()]
+    if len(succeeded) > 0:
+        reference = succeeded.iloc[-1]
+        study["fullYieldDelta_pc"] = (study["fullYield_GWh_per_year"] / reference["fullYield_GWh_per_year"] - 1.0) * 100
+        study["internalWakeEfficiencyDelta_pc"] = (study["internalWakeEfficiency"] - reference["internalWakeEfficiency"]) * 100
+    else:
+        study["fullYieldDelta_pc"] = float('nan')
+        study["internalWakeEfficiencyDelta_pc"] = float('nan')
+    return study
+
+
+def recommend_number_of_direction_sectors(study: pd.DataFrame, tolerance_pc: float = 0.1) -> int:
+    """
+    Recommend the fewest direction sectors whose full yield is within tolerance_pc of the finest setting,
+    and stays within it for every finer setting, so a setting that only agrees by chance isn't picked.
+
+    Parameters:
+    -----------
+    study : pandas.DataFrame
+        Results of run_sector_convergence_study
+    tolerance_pc : float, optional
+        Allowed absolute difference in full yield, in % (default: 0.1)
+
+    Returns:
+    --------
+    int
+        The recommended numberOfDirectionSectorsForWakeCalculation, or None if no calculation succeeded
+    """
+    succeeded = study[study["error"].isna()].sort_values("numberOfDirectionSectors")
+    if len(succeeded) == 0:
+        return None
+    within = (succeeded["fullYieldDelta_pc"].abs() <= tolerance_pc).to_numpy()
+    # within tolerance for this and every finer setting
+    converged = within[::-1].cumprod()[::-1].astype(bool)
+    return int(succeeded["numberOfDirectionSectors"].to_numpy()[converged][0])
+
+
+def print_study(study: pd.DataFrame, tolerance_pc: float = 0.1):
+    recommended = recommend_number_of_direction_sectors(study, tolerance_pc)
+    print(study.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    if recommended is None:
+        print('No calculation succeeded')
+        return
+    finest = study.loc[study["error"].isna(), "numberOfDirectionSectors"].max()
+    calculation_times = study.set_index("numberOfDirectionSectors").loc[[recommended, finest], "calculationTime_s"]
+    print(f'Recommended numberOfDirectionSectorsForWakeCalculation: {recommended} '
+          f'(full yield within {tolerance_pc}% of {finest} sectors, '
+          f'{calculation_times.iloc[0]:.0f}s against {calculation_times.iloc[1]:.0f}s calculation time)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the fewest wake direction sectors giving a converged AEP.')
+    parser.add_argument('--input', required=True, help='AEP API input json file')
+    parser.add_argument('--sectors', type=int, nargs='+', default=list(DEFAULT_SECTOR_COUNTS))
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed full yield difference from the finest setting, in %%')
+    parser.add_argument('--concurrency', type=int, default=None)
+    parser.add_argument('--polling-interval', type=float, default=DEFAULT_POLLING_INTERVAL_SECONDS,
+                        help='seconds between job status polls, the resolution of the calculation times')
+    parser.add_argument('--url', default='https://windfarmer.dnv.com/api/v3/')
+    parser.add_argument('--output', default=None, help='csv file for the study table')
+    args = parser.parse_args()
+
+    with open(args.input) as f:
+        input_json = json.load(f)
+    wf_api = WindFarmerAPI(os.environ['WINDFARMER_ACCESS_KEY'], args.url)
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    study = asyncio.run(run_sector_convergence_study(wf_api, input_json, args.sectors, args.concurrency, args.polling_interval))
+    print_study(study, args.tolerance)
+    if args.output:
+        study.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Local engineering wake model surrogate for pre-screening layouts from AEP API inputs.
+
+A simplified ModifiedPark (top hat wake with the parkWakeDecayConstant of each turbine) or TurbOPark (Gaussian wake
+expanding with the ambient turbulence intensity and wakeExpansion) wake deficit, evaluated for every pair of turbines,
+every wake direction and every speed bin at once with NumPy broadcasting. Wake directions are processed in chunks to
+bound the memory of the (directions x upstream turbines x downstream turbines x speed bins) arrays. Deficits are
+combined as a root sum of squares, and the thrust coefficient of each upstream turbine is updated from its waked
+speed over a few iterations.
+
+This is a fast ranking filter, e.g. for turbine removal or layout searches, not a replacement for the API: there is no
+large wind farm correction, no added turbulence and no blockage. For TheBowl, against the stored CFD.ML results in
+api_io/cfdmlv2api_per_turbine_results_TheBowl.csv (internal wake efficiency 0.867), with 15 wake directions per sector:
+  ModifiedPark: internal wake efficiency 0.909, Spearman rank correlation of the turbine efficiencies 0.94, in 1 s
+  TurbOPark:    internal wake efficiency 0.831, Spearman rank correlation of the turbine efficiencies 0.99, in 11 s
+Fewer wake directions per sector are faster, at some cost to the ranking (0.93 and 0.96 with 5), see compare_with_api_results.
+"""
+
+import numpy as np
+import pandas as pd
+
+if __package__:
+    from .gross_yield import GrossYieldModel, HOURS_PER_YEAR, interpolate_performance_curves
+else:
+    # run as a script from the script_lib folder
+    from gross_yield import GrossYieldModel, HOURS_PER_YEAR, interpolate_performance_curves
+
+WAKE_MODELS = ("ModifiedPark", "TurbOPark")
+DEFAULT_WAKE_DECAY_CONSTANT = 0.04
+DEFAULT_WAKE_EXPANSION = 0.04
+DEFAULT_TURBULENCE_INTENSITY = 0.06
+# arrays of the size of one chunk alive at once at the peak, (directions x i x j) geometry and
+# (directions x i x downstream j x speed bins) deficits, measured with tracemalloc for TheBowl
+LIVE_GEOMETRY_ARRAYS = 8
+LIVE_DEFICIT_ARRAYS = {"ModifiedPark": 3, "TurbOPark": 9}
+
+
+def get_circle_overlap_fraction(wake_radius, rotor_radius, distance):
+    """
+    Get the fraction of a rotor's area inside a wake, for circles of wake_radius and rotor_radius distance apart.
+    """
+    wake_radius, rotor_radius, distance = np.broadcast_arrays(wake_radius, rotor_radius, distance)
+    fraction = np.zeros(distance.shape)
+    inside = distance <= np.abs(wake_radius - rotor_radius)
+    fraction[inside] = (np.minimum(wake_radius[inside], rotor_radius[inside]) / rotor_radius[inside]) ** 2
+    partial = ~inside & (distance < wake_radius + rotor_radius)
+    r = distance[partial]
+    rw = wake_radius[partial]
+    rr = rotor_radius[partial]
+    area = rw ** 2 * np.arccos(np.clip((r ** 2 + rw ** 2 - rr ** 2) / (2 * r * rw), -1.0, 1.0)) + \
+        rr ** 2 * np.arccos(np.clip((r ** 2 + rr ** 2 - rw ** 2) / (2 * r * rr), -1.0, 1.0)) - \
+        0.5 * np.sqrt(np.clip((-r + rw + rr) * (r + rw - rr) * (r - rw + rr) * (r + rw + rr), 0.0, None))
+    fraction[partial] = area / (np.pi * rr ** 2)
+    return fraction
+
+
+def get_turbopark_deficit(thrust_coefficient, downwind_distance, crosswind_distance, upstream_rotor_diameter,
+                          downstream_rotor_radius, turbulence_intensity, wake_expansion):
+    """
+    Get the rotor averaged wind speed deficit of a TurbOPark (Nygaard et al. 2022) Gaussian wake.
+
+    The wake width grows with the ambient turbulence intensity. The Gaussian profile is averaged over the downstream
+    rotor approximately, by widening it by the variance of a uniform disc (rotor radius^2 / 4).
+
+    Parameters:
+    -----------
+    thrust_coefficient : numpy.ndarray
+        Thrust coefficient of the upstream turbine
+    downwind_distance, crosswind_distance : numpy.ndarray
+        Distances from the upstream to the downstream turbine, along and across the wind direction, in m
+    upstream_rotor_diameter : numpy.ndarray
+        Rotor diameter of the upstream turbine in m
+    downstream_rotor_radius : numpy.ndarray
+        Rotor radius of the downstream turbine in m
+    turbulence_intensity : numpy.ndarray
+        Ambient turbulence intensity
+    wake_expansion : float
+        wakeExpansion (A) of the TurbOPark model
+
+    Returns:
+    --------
+    numpy.ndarray
+        Fractional wind speed deficit, 0 where the downstream turbine isn't downwind
+    """
+    c1 = 1.5
+    c2 = 0.8
+    downwind = downwind_distance > 0
+    ct = np.clip(thrust_coefficient, 1e-6, 0.99)
+    x = np.where(downwind, downwind_distance, 0.0) / upstream_rotor_diameter
+    alpha = c1 * turbulence_intensity
+    beta = c2 * turbulence_intensity / np.sqrt(ct)
+    epsilon = 0.25 * np.sqrt(0.5 * (1.0 + np.sqrt(1.0 - ct)) / np.sqrt(1.0 - ct))
+    root_x = np.sqrt((alpha + beta * x) ** 2 + 1.0)
+    root_0 = np.sqrt(1.0 + alpha ** 2)
+    sigma = upstream_rotor_diameter * (epsilon + wake_expansion * turbulence_intensity / beta * (
+        root_x - root_0 - np.log((root_x + 1.0) * alpha / ((root_0 + 1.0) * (alpha + beta * x)))))
+    centre_deficit = 1.0 - np.sqrt(np.clip(1.0 - ct / (8.0 * (sigma / upstream_rotor_diameter) ** 2), 0.0, None))
+    sigma_squared = sigma ** 2 + downstream_rotor_radius ** 2 / 4.0
+    deficit = centre_deficit * sigma ** 2 / sigma_squared * np.exp(-crosswind_distance ** 2 / (2.0 * sigma_squared))
+    return np.where(downwind, deficit, 0.0)
+
+
+class WakeSurrogateModel(GrossYieldModel):
+    """
+    A class to estimate the waked annual energy yield and wake efficiency of each turbine from an AEP API input json,
+    with a local ModifiedPark or TurbOPark style wake model.
+    """
+    def __init__(self, input_json: dict, wake_model: str = None, wake_directions_per_sector: int = None,
+                 iterations: int = 3, max_chunk_elements: int = 20_000_000, operational_mode: str = "normal"):
+        """
+        Initialize the WakeSurrogateModel class.
+        :param input_json: AEP API input json, e.g. as prepared for cfdml_v2_calculator.ipynb
+        :param wake_model: "ModifiedPark" or "TurbOPark", as in input_json_prep.get_wake_models. If None, the wake model of
+            the input if it is one of these, else ModifiedPark.
+        :param wake_directions_per_sector: Wake directions evaluated across each direction sector of the wind climate, with
+            equal shares of its frequency. If None, from numberOfDirectionSectorsForWakeCalculation of the input.
+        :param iterations: Passes updating the thrust coefficient of each turbine from its waked speed
+        :param max_chunk_elements: Upper limit on the elements of all the (directions x turbines x turbines) and
+            (directions x turbines x downstream turbines x speed bins) arrays alive at once, 8 bytes each, so about
+            160 MB by default
+        :param operational_mode: turbineOperationalMode of the performance data to use
+        """
+        super().__init__(input_json, operational_mode)
+        settings = input_json.get("energyEfficienciesSettings") or {}
+        wake_model_settings = settings.get("wakeModel") or {}
+        if wake_model is None:
+            wake_model_type = wake_model_settings.get("wakeModelType")
+            wake_model = wake_model_type if wake_model_type in WAKE_MODELS else "ModifiedPark"
+        if wake_model not in WAKE_MODELS:
+            raise ValueError(f"Wake model {wake_model} is not one of {WAKE_MODELS}")
+        self.wake_model = wake_model
+        self.wake_expansion = float((wake_model_settings.get("turbOPark") or {}).get("wakeExpansion", DEFAULT_WAKE_EXPANSION))
+        self.wake_directions = settings.get("numberOfDirectionSectorsForWakeCalculation") if wake_directions_per_sector is None else None
+        self.wake_directions_per_sector = wake_directions_per_sector
+        self.iterations = iterations
+        self.max_chunk_elements = max_chunk_elements
+        self.turbulence_intensities = {
+            w["id"]: np.asarray(w["turbulenceIntensity"], dtype=float) if w.get("turbulenceIntensity") is not None else None
+            for w in input_json["windClimates"]}
+
+    def get_turbines(self, include_neighbors: bool = False) -> pd.DataFrame:
+        """Get the turbines of the input json as a dataframe, one row per turbine, with their parkWakeDecayConstant."""
+        turbines = super().get_turbines(include_neighbors)
+        wake_decay_constants = {
+            (w["name"], t["name"]): t.get("parkWakeDecayConstant") or DEFAULT_WAKE_DECAY_CONSTANT
+            for w in self.input_json["windFarms"] for t in w["turbines"]}
+        turbines["parkWakeDecayConstant"] = [wake_decay_constants[(f, t)] for f, t in zip(turbines["farm_name"], turbines["turbineName"])]
+        return turbines
+
+    def _get_wake_directions(self, n_sectors: int, directions: np.ndarray) -> tuple:
+        # wake directions spread evenly across each sector, and the sector each belongs to
+        if self.wake_directions_per_sector is not None:
+            per_sector = self.wake_directions_per_sector
+        else:
+            per_sector = max(1, int(round((self.wake_directions or n_sectors) / n_sectors)))
+        width = 360.0 / n_sectors
+        offsets = (np.arange(per_sector) + 0.5) * width / per_sector - width / 2.0
+        wake_directions = (directions[:, None] + offsets[None, :]).ravel() % 360.0
+        return wake_directions, np.repeat(np.arange(n_sectors), per_sector), per_sector
+
+    def get_turbine_yields(self, turbines: pd.DataFrame = None, include_neighbors: bool = False, chunk_size: int = 2000) -> pd.DataFrame:
+        """
+        Estimate the gross and waked annual energy yield and the wake efficiency of each turbine.
+
+        Parameters:
+        -----------
+        turbines : pandas.DataFrame, optional
+            Turbines as returned by get_turbines, e.g. with changed locations or rows removed. All of them shed wakes.
+            The turbines of the input json if None.
+        include_neighbors : bool, optional
+            Include the turbines of neighbour farms, when turbines is None (default: False, for internal wakes only)
+        chunk_size : int, optional
+            Number of downstream turbines evaluated at once. With max_chunk_elements, this bounds the memory of the
+            (directions x upstream turbines x downstream turbines x speed bins) arrays of large farms.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            The turbines with airDensityAtHubHeight_kg_per_m3, freeMeanWindSpeed_m_per_s, grossAnnualYield_MWh_per_year,
+            wakedMeanWindSpeed_m_per_s, wakedAnnualYield_MWh_per_year and wakeEfficiency
+        """
+        turbines = self.get_turbines(include_neighbors) if turbines is None else turbines.reset_index(drop=True)
+        if "parkWakeDecayConstant" not in turbines:
+            turbines = turbines.assign(parkWakeDecayConstant=DEFAULT_WAKE_DECAY_CONSTANT)
+        prepared = self._prepare_turbines(turbines)
+        n_turbines = len(turbines)
+        locations = turbines[["easting", "northing"]].to_numpy(dtype=float)
+        # upstream (i) x downstream (j) separations
+        east = locations[None, :, 0] - locations[:, None, 0]
+        north = locations[None, :, 1] - locations[:, None, 1]
+        rotor_radii = prepared["rotor_diameters"] / 2.0
+        wake_decay_constants = turbines["parkWakeDecayConstant"].to_numpy(dtype=float)
+
+        gross_yield = np.zeros(n_turbines)
+        waked_yield = np.zeros(n_turbines)
+        free_mean_wind_speed = np.zeros(n_turbines)
+        waked_mean_wind_speed = np.zeros(n_turbines)
+        climate_ids = turbines["associatedWindClimateId"].to_numpy()
+        for climate_id in np.unique(climate_ids):
+            wind_climate = self.wind_climates[climate_id]
+            in_climate = climate_ids == climate_id
+            # speed bins above the last with any frequency don't contribute
+            n_bins = int(np.flatnonzero(wind_climate["probability"].sum(axis=0) > 0).max()) + 1
+            speeds = wind_climate["speeds"][:n_bins]
+            n_sectors = len(wind_climate["directions"])
+            wake_directions, sector_of_direction, per_sector = self._get_wake_directions(n_sectors, wind_climate["directions"])
+            probability = wind_climate["probability"][sector_of_direction, :n_bins] / per_sector
+            turbulence_intensity = self.turbulence_intensities.get(climate_id)
+            turbulence_intensity = np.full(probability.shape, DEFAULT_TURBULENCE_INTENSITY) if turbulence_intensity is None \
+                else turbulence_intensity[sector_of_direction, :n_bins]
+            speed_ups = self._get_speed_ups(prepared["speed_up_rows"], wake_directions)
+
+            n_downstream = max(1, min(chunk_size, n_turbines))
+            elements_per_direction = LIVE_GEOMETRY_ARRAYS * n_turbines * n_turbines + \
+                LIVE_DEFICIT_ARRAYS[self.wake_model] * n_turbines * n_downstream * n_bins
+            directions_per_chunk = max(1, self.max_chunk_elements // max(1, elements_per_direction))
+            for start in range(0, len(wake_directions), directions_per_chunk):
+                chunk = slice(start, start + directions_per_chunk)
+                theta = np.radians(wake_directions[chunk])[:, None, None]
+                # wind from theta blows towards theta + 180
+                downwind = -(east[None] * np.sin(theta) + north[None] * np.cos(theta))
+                crosswind = np.abs(east[None] * np.cos(theta) - north[None] * np.sin(theta))
+                # turbines x directions x speed bins
+                free_speeds = speed_ups[:, chunk, None] * speeds[None, None, :]
+                waked_speeds = free_speeds
+                if self.wake_model == "ModifiedPark":
+                    # the top hat overlap only depends on the geometry, directions x i x j
+                    wake_radius = rotor_radii[None, :, None] + wake_decay_constants[None, :, None] * np.clip(downwind, 0.0, None)
+                    overlap = np.where(downwind > 0, get_circle_overlap_fraction(wake_radius, rotor_radii[None, None, :], crosswind), 0.0)
+                    expansion = (rotor_radii[None, :, None] / wake_radius) ** 2
+                    geometry = overlap * expansion
+                for _ in range(max(1, self.iterations)):
+                    thrust = interpolate_performance_curves(waked_speeds, prepared["performance_curves"], prepared["curve_index"], column=2)
+                    # directions x i x speed bins, then broadcast over j
+                    thrust = np.moveaxis(thrust, 0, 1)[:, :, None, :]
+                    deficit = np.empty((thrust.shape[0], n_turbines, n_bins))  # directions x j x speed bins
+                    for downstream_start in range(0, n_turbines, n_downstream):
+                        j = slice(downstream_start, downstream_start + n_downstream)
+                        if self.wake_model == "ModifiedPark":
+                            deficits = (1.0 - np.sqrt(1.0 - np.clip(thrust, 0.0, 1.0))) * geometry[:, :, j, None]
+                        else:
+                            deficits = get_turbopark_deficit(
+                                thrust, downwind[:, :, j, None], crosswind[:, :, j, None], prepared["rotor_diameters"][None, :, None, None],
+                                rotor_radii[None, None, j, None], turbulence_intensity[chunk, None, None, :], self.wake_expansion)
+                        deficit[:, j] = np.sqrt((deficits ** 2).sum(axis=1))
+                    waked_speeds = free_speeds * (1.0 - np.moveaxis(deficit, 0, 1))
+
+                chunk_probability = probability[None, chunk, :]
+                free_power = interpolate_performance_curves(free_speeds, prepared["performance_curves"], prepared["curve_index"])
+                waked_power = interpolate_performance_curves(waked_speeds, prepared["performance_curves"], prepared["curve_index"])
+                gross_yield[in_climate] += (chunk_probability * free_power).sum(axis=(1, 2))[in_climate]
+                waked_yield[in_climate] += (chunk_probability * waked_power).sum(axis=(1, 2))[in_climate]
+                free_mean_wind_speed[in_climate] += (chunk_probability * free_speeds).sum(axis=(1, 2))[in_climate]
+                waked_mean_wind_speed[in_climate] += (chunk_probability * waked_speeds).sum(axis=(1, 2))[in_climate]
+
+        results = turbines.copy()
+        results["airDensityAtHubHeight_kg_per_m3"] = prepared["air_densities"]
+        results["freeMeanWindSpeed_m_per_s"] = free_mean_wind_speed
+        results["grossAnnualYield_MWh_per_year"] = gross_yield * HOURS_PER_YEAR / 1e6
+        results["wakedMeanWindSpeed_m_per_s"] = waked_mean_wind_speed
+        results["wakedAnnualYield_MWh_per_year"] = waked_yield * HOURS_PER_YEAR / 1e6
+        results["wakeEfficiency"] = results["wakedAnnualYield_MWh_per_year"] / results["grossAnnualYield_MWh_per_year"]
+        return results
+
+    def get_wake_efficiency(self, turbines: pd.DataFrame = None, include_neighbors: bool = False) -> float:
+        """Get the wake efficiency of the turbines (of the subject farms), waked / gross annual energy yield."""
+        results = self.get_turbine_yields(turbines, include_neighbors)
+        subject = ~results["isNeighbor"]
+        return results.loc[subject, "wakedAnnualYield_MWh_per_year"].sum() / results.loc[subject, "grossAnnualYield_MWh_per_year"].sum()
+
+    def get_layout_efficiencies(self, layouts: dict, farm_name: str = None, turbine_model_id: str = None) -> pd.DataFrame:
+        """
+        Estimate the gross and waked annual energy yield and the internal wake efficiency of layout variants of a farm.
+
+        Parameters:
+        -----------
+        layouts : dict
+            Layouts keyed by name, each a dataframe with easting and northing columns,
+            and optionally turbineName, turbineModelId, terrainHeightAboveSeaLevel_m and parkWakeDecayConstant
+        farm_name : str, optional
+            Farm whose turbines are replaced by each layout, the first subject farm if None
+        turbine_model_id : str, optional
+            Turbine model of turbines without a turbineModelId, the model of the farm's first turbine if None
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per layout with numberOfTurbines, grossAnnualYield_MWh_per_year, wakedAnnualYield_MWh_per_year
+            and wakeEfficiency, sorted by wakedAnnualYield_MWh_per_year, highest first
+        """
+        subject_farms = [w for w in self.input_json["windFarms"] if not w.get("isNeighbor", False)]
+        wind_farm = subject_farms[0] if farm_name is None else next(w for w in self.input_json["windFarms"] if w["name"] == farm_name)
+        first_turbine = wind_farm["turbines"][0]
+        defaults = {
+            "farm_name": wind_farm["name"],
+            "isNeighbor": False,
+            "terrainHeightAboveSeaLevel_m": first_turbine["location"].get("terrainHeightAboveSeaLevel_m", 0.0),
+            "associatedWindClimateId": first_turbine["associatedWindClimateId"],
+            "turbineModelId": turbine_model_id or first_turbine["turbineModelId"],
+            "parkWakeDecayConstant": first_turbine.get("parkWakeDecayConstant") or DEFAULT_WAKE_DECAY_CONSTANT,
+        }
+        rows = []
+        for layout_name, layout in layouts.items():
+            frame = layout.reset_index(drop=True).copy()
+            for column, value in defaults.items():
+                if column not in frame:
+                    frame[column] = value
+            if "turbineName" not in frame:
+                frame["turbineName"] = [f"{layout_name} {i + 1}" for i in range(len(frame))]
+            # each layout is a separate wake calculation, as every pair of its turbines interacts
+            results = self.get_turbine_yields(frame)
+            gross = results["grossAnnualYield_MWh_per_year"].sum()
+            waked = results["wakedAnnualYield_MWh_per_year"].sum()
+            rows.append({"layout": layout_name, "numberOfTurbines": len(frame), "grossAnnualYield_MWh_per_year": gross,
+                         "wakedAnnualYield_MWh_per_year": waked, "wakeEfficiency": waked / gross})
+        return pd.DataFrame(rows).sort_values("wakedAnnualYield_MWh_per_year", ascending=False).reset_index(drop=True)
+
+
+def compare_with_api_results(estimated: pd.DataFrame, api_results: pd.DataFrame) -> dict:
+    """
+    Compare surrogate internal wake efficiencies with per turbine API results,
+    e.g. api_io/cfdmlv2api_per_turbine_results_<projectId>.csv.
+
+    The API internal wake efficiency of each turbine is internalWakesOnAnnualYield_MWh_per_year over
+    blockageOnAnnualYield_MWh_per_year (or grossAnnualYield_MWh_per_year without blockage results).
+
+    Parameters:
+    -----------
+    estimated : pandas.DataFrame
+        Results of WakeSurrogateModel.get_turbine_yields for the subject farms
+    api_results : pandas.DataFrame
+        Per turbine API results
+
+    Returns:
+    --------
+    dict
+        Farm internal wake efficiency from each, the Spearman rank correlation of the turbine efficiencies,
+        and the per turbine comparison
+    """
+    keys = ["farm_name", "turbineName"] if "farm_name" in api_results else ["turbineName"]
+    reference_column = "blockageOnAnnualYield_MWh_per_year" if "blockageOnAnnualYield_MWh_per_year" in api_results else "grossAnnualYield_MWh_per_year"
+    api = api_results[keys].copy()
+    api["apiWakeEfficiency"] = api_results["internalWakesOnAnnualYield_MWh_per_year"] / api_results[reference_column]
+    api["apiReference_MWh_per_year"] = api_results[reference_column]
+    api["apiInternalWakesOn_MWh_per_year"] = api_results["internalWakesOnAnnualYield_MWh_per_year"]
+    comparison = estimated[keys + ["wakeEfficiency"]].merge(api, on=keys)
+    # Spearman correlation as the Pearson correlation of the ranks
+    rank_correlation = comparison["wakeEfficiency"].rank().corr(comparison["apiWakeEfficiency"].rank())
+    return {
+        "surrogateWakeEfficiency": float((estimated["wakedAnnualYield_MWh_per_year"].sum() / estimated["grossAnnualYield_MWh_per_year"].sum())),
+        "apiWakeEfficiency": float(comparison["apiInternalWakesOn_MWh_per_year"].sum() / comparison["apiReference_MWh_per_year"].sum()),
+        "turbineRankCorrelation": float(rank_correlation),
+        "turbines": comparison.drop(columns=["apiReference_MWh_per_year", "apiInternalWakesOn_MWh_per_year"]),
+    }
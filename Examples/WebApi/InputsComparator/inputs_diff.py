@@ -0,0 +1,298 @@
+"""
+Structural diff of WindFarmer API AEP input json files
+
+Rather than pulling one part of two inputs into data frames by hand, the whole of both inputs is walked together:
+ - lists of named objects are matched by key, not position: wind farms and turbines by name, turbine models, wind climates,
+   speed-ups and atmospheric condition classes by id, performance data by operational mode and air density. A key
+   repeated in a list, e.g. a duplicated turbine name, is reported as a duplicate and that list is compared by position
+ - numeric arrays (probabilityDistribution, turbulenceIntensity, speedUps, ...) and lists of numeric records
+   (performanceDataPoints) are compared as NumPy arrays, with a relative and absolute tolerance, and reported once per
+   array with the number of elements that differ and the largest difference
+so differences are reported by meaning, e.g. windFarms[Farm].turbines[T12].location.easting_m, even when turbines
+were reordered. Diff many exported scenarios against a baseline with diff_against_baseline, and summarise them,
+to explain the yield differences between runs, with summarise_diffs.
+"""
+
+import os
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# key of the objects in each list, by the name of the list
+LIST_KEYS = {
+    "windFarms": "name",
+    "turbines": "name",
+    "turbineModels": "id",
+    "windClimates": "id",
+    "weibullWindClimates": "id",
+    "speedsUps": "id",
+    "atmosphericConditionClasses": "id",
+    "performanceData": ("turbineOperationalMode", "airDensity_kg_per_m3"),
+}
+
+DIFF_COLUMNS = ["path", "section", "change", "baseline", "other", "differing_elements", "max_abs_difference"]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _as_numeric_array(values):
+    """The list as a float array if it is a (nested) list of numbers, else None."""
+    if len(values) == 0 or not (_is_number(values[0]) or isinstance(values[0], list)):
+        return None
+    try:
+        array = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    return array if array.dtype != object else None
+
+
+def _as_numeric_records(values):
+    """Field name -> float array if the list is of objects with the same numeric fields, e.g. performanceDataPoints."""
+    if len(values) == 0 or not isinstance(values[0], dict):
+        return None
+    fields = list(values[0])
+    if not all(_is_number(values[0][f]) for f in fields):
+        return None
+    try:
+        return {f: np.array([v[f] for v in values], dtype=float) for f in fields}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _format_key(key):
+    return ",".join(str(k) for k in key) if isinstance(key, tuple) else str(key)
+
+
+def _get_key(value, key):
+    return tuple(value.get(k) for k in key) if isinstance(key, tuple) else value.get(key)
+
+
+def _keyed(values, key):
+    return {_get_key(v, key): v for v in values}
+
+
+class _Differ:
+    def __init__(self, rtol, atol):
+        self.rtol = rtol
+        self.atol = atol
+        self.diffs = []
+
+    def add(self, path, change, baseline=None, other=None, differing_elements=None, max_abs_difference=None):
+        section = path.split(".")[0].split("[")[0]
+        self.diffs.append((path, section, change, baseline, other, differing_elements, max_abs_difference))
+
+    def compare_arrays(self, path, a, b):
+        if a.shape != b.shape:
+            self.add(path, "shape", str(a.shape), str(b.shape))
+            return
+        close = np.isclose(a, b, rtol=self.rtol, atol=self.atol)
+        if not close.all():
+            difference = np.abs(a - b)
+            self.add(path, "values", None, None, int((~close).sum()), float(difference.max()))
+
+    def diff(self, a, b, path):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for k in a:
+                child = f"{path}.{k}" if path else k
+                if k not in b:
+                    self.add(child, "removed", _summary(a[k]))
+                else:
+                    self.diff_value(a[k], b[k], child, k)
+            for k in b:
+                if k not in a:
+                    self.add(f"{path}.{k}" if path else k, "added", None, _summary(b[k]))
+        else:
+            self.diff_value(a, b, path, None)
+
+    def diff_value(self, a, b, path, name):
+        if isinstance(a, dict) and isinstance(b, dict):
+            self.diff(a, b, path)
+        elif isinstance(a, list) and isinstance(b, list):
+            self.diff_list(a, b, path, name)
+        elif _is_number(a) and _is_number(b):
+            if not np.isclose(a, b, rtol=self.rtol, atol=self.atol):
+                self.add(path, "changed", a, b, 1, abs(a - b))
+        elif a != b:
+            self.add(path, "changed", _summary(a), _summary(b))
+
+    def diff_keyed(self, a, b, path, key):
+        keyed_a = _keyed(a, key)
+        keyed_b = _keyed(b, key)
+        for k, value in keyed_a.items():
+            child = f"{path}[{_format_key(k)}]"
+            if k not in keyed_b:
+                self.add(child, "removed")
+            else:
+                self.diff(value, keyed_b[k], child)
+        for k in keyed_b:
+            if k not in keyed_a:
+                self.add(f"{path}[{_format_key(k)}]", "added")
+
+    def diff_list(self, a, b, path, name):
+        key = LIST_KEYS.get(name)
+        if key is not None and all(isinstance(v, dict) for v in a + b):
+            counts_a = Counter(_get_key(v, key) for v in a)
+            counts_b = Counter(_get_key(v, key) for v in b)
+            duplicates = [k for k in dict.fromkeys(list(counts_a) + list(counts_b)) if counts_a[k] > 1 or counts_b[k] > 1]
+            if not duplicates:
+                self.diff_keyed(a, b, path, key)
+                return
+            # matching by key would keep only the last of each repeat, so report them and compare the list by position
+            for k in duplicates:
+                self.add(f"{path}[{_format_key(k)}]", "duplicate", counts_a[k], counts_b[k])
+        array_a = _as_numeric_array(a)
+        array_b = _as_numeric_array(b)
+        if array_a is not None and array_b is not None:
+            self.compare_arrays(path, array_a, array_b)
+            return
+        records_a = _as_numeric_records(a)
+        records_b = _as_numeric_records(b)
+        if records_a is not None and records_b is not None and set(records_a) == set(records_b):
+            for field in records_a:
+                self.compare_arrays(f"{path}[*].{field}", records_a[field], records_b[field])
+            return
+        if len(a) != len(b):
+            self.add(path, "length", len(a), len(b))
+        for i, (x, y) in enumerate(zip(a, b)):
+            self.diff_value(x, y, f"{path}[{i}]", None)
+
+
+def _summary(value):
+    if isinstance(value, dict):
+        return f"<object with {len(value)} keys>"
+    if isinstance(value, list):
+        return f"<list of {len(value)}>"
+    return value
+
+
+def diff_inputs(baseline: dict, other: dict, rtol: float = 1e-6, atol: float = 1e-9) -> pd.DataFrame:
+    """
+    Structural diff of two AEP inputs.
+
+    Parameters:
+    -----------
+    baseline : dict
+        AEP input json
+    other : dict
+        AEP input json compared against the baseline
+    rtol : float, optional
+        Relative tolerance for numbers, by default 1e-6
+    atol : float, optional
+        Absolute tolerance for numbers, by default 1e-9
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per difference: path, section (top level key), change (added, removed, changed, duplicate, length, shape or
+        values), baseline and other values (or summaries; for a duplicate key its count in each), and for numbers the count of
+        differing elements and the largest difference
+    """
+    differ = _Differ(rtol, atol)
+    differ.diff(baseline, other, "")
+    return pd.DataFrame(differ.diffs, columns=DIFF_COLUMNS)
+
+
+def get_turbine_moves(baseline: dict, other: dict) -> pd.DataFrame:
+    """
+    Turbines added, removed or moved between two AEP inputs, matched by wind farm and turbine name.
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per turbine in either input with farm, turbine, change (added, removed, moved, unchanged, or duplicate for a
+        name repeated in a wind farm of either input, which can't be matched) and the distance moved in m
+    """
+    def locations(input_json):
+        return pd.DataFrame([(w["name"], t["name"], t["location"]["easting_m"], t["location"]["northing_m"])
+                             for w in input_json["windFarms"] for t in w["turbines"]],
+                            columns=["farm", "turbine", "easting", "northing"])
+    locations_baseline = locations(baseline)
+    locations_other = locations(other)
+    duplicated = pd.concat([locations_baseline[locations_baseline.duplicated(["farm", "turbine"])],
+                            locations_other[locations_other.duplicated(["farm", "turbine"])]])
+    merged = locations_baseline.merge(locations_other, on=["farm", "turbine"], how="outer", suffixes=("_baseline", "_other"), indicator=True)
+    merged["distance_m"] = np.hypot(merged["easting_other"] - merged["easting_baseline"], merged["northing_other"] - merged["northing_baseline"])
+    is_duplicate = pd.MultiIndex.from_frame(merged[["farm", "turbine"]]).isin(pd.MultiIndex.from_frame(duplicated[["farm", "turbine"]]))
+    merged["change"] = np.select([is_duplicate, merged["_merge"] == "left_only", merged["_merge"] == "right_only", merged["distance_m"] > 0.01],
+                                 ["duplicate", "removed", "added", "moved"], "unchanged")
+    return merged.drop(columns="_merge")
+
+
+def _load(input_json):
+    if isinstance(input_json, (str, os.PathLike)):
+        with open(input_json) as f:
+            return json.load(f)
+    return input_json
+
+
+def _diff_against_baseline_worker(args):
+    baseline, other, rtol, atol = args
+    baseline = _load(baseline)
+    other = _load(other)
+    diffs = diff_inputs(baseline, other, rtol, atol)
+    moves = get_turbine_moves(baseline, other)
+    return diffs, moves
+
+
+def diff_against_baseline(baseline, others: dict, rtol: float = 1e-6, atol: float = 1e-9, processes: int = 0):
+    """
+    Diff many AEP inputs against a baseline.
+
+    Parameters:
+    -----------
+    baseline : dict or str
+        AEP input json, or the path of a json file
+    others : dict
+        AEP inputs, or paths of json files, keyed by name, e.g. the scenario name
+    rtol : float, optional
+        Relative tolerance for numbers, by default 1e-6
+    atol : float, optional
+        Absolute tolerance for numbers, by default 1e-9
+    processes : int, optional
+        Worker processes, reading and diffing the files in parallel, by default 0 (in this process)
+
+    Returns:
+    --------
+    tuple
+        (differences, turbine moves) DataFrames, as from diff_inputs and get_turbine_moves, with an input column
+    """
+    names = list(others)
+    if processes == 0:
+        baseline = _load(baseline)
+        outcomes = [_diff_against_baseline_worker((baseline, others[name], rtol, atol)) for name in names]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            outcomes = list(executor.map(_diff_against_baseline_worker, [(baseline, others[name], rtol, atol) for name in names]))
+    diffs = pd.concat([d.assign(input=name) for name, (d, _) in zip(names, outcomes)], ignore_index=True)
+    moves = pd.concat([m.assign(input=name) for name, (_, m) in zip(names, outcomes)], ignore_index=True)
+    return diffs[["input"] + DIFF_COLUMNS], moves
+
+
+def summarise_diffs(diffs: pd.DataFrame, moves: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Count the differences of each input by section (windFarms, turbineModels, windClimates, flowModel,
+    energyEfficienciesSettings, ...), with the turbines added, removed and moved and the largest move if given.
+
+    Parameters:
+    -----------
+    diffs : pd.DataFrame
+        Differences from diff_against_baseline
+    moves : pd.DataFrame, optional
+        Turbine moves from diff_against_baseline
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per input
+    """
+    summary = diffs.pivot_table(index="input", columns="section", values="path", aggfunc="count", fill_value=0)
+    if moves is not None:
+        counts = moves.pivot_table(index="input", columns="change", values="turbine", aggfunc="count", fill_value=0)
+        counts = counts.reindex(columns=["added", "removed", "moved", "duplicate"], fill_value=0).add_prefix("turbines ")
+        largest_move = moves[moves["change"] == "moved"].groupby("input")["distance_m"].max().rename("largest move [m]")
+        summary = summary.join(counts, how="outer").join(largest_move, how="left").fillna(0)
+    return summary
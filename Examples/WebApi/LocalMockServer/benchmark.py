@@ -0,0 +1,258 @@
+# Benchmark harness for WindFarmer web API client pipelines, run against the local mock server.
+#
+# Three client flows from this repository are exercised:
+#  * wind_farmer_api - the WindFarmerAPI class from CFDMLv2/script_lib (sync and async AEP calls)
+#  * batch           - the submit-then-poll scheduler flow of BatchProcessing/batch_process.ipynb
+#  * async_examples  - the concurrent aiohttp calls of CalculateAepAsynchronously/02 and 03
+#
+# Example:
+#   python benchmark.py --scenario all --requests 20 --concurrency 5 --latency 0.2 --jitter 0.05 --output bench.json
+# Use --url to point the harness at an already running mock (or any compatible server) instead of starting one.
+#%%
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+import numpy as np
+import requests
+import aiohttp
+
+script_dir_name = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.abspath(os.path.join(script_dir_name, '..', '..', '..'))
+sys.path.append(script_dir_name)
+sys.path.append(os.path.join(script_dir_name, '..', 'CFDMLv2'))
+
+from mock_windfarmer_api import MockServerConfig, MockWindFarmerServer
+from script_lib.api_calls import WindFarmerAPI
+
+DEFAULT_INPUT_FILE = os.path.join(root_dir, 'DemoData', 'TheBowl', 'TheBowl.json')
+AUTH_TOKEN = os.environ.get('WINDFARMER_ACCESS_KEY', 'mock-access-key')
+MAX_POLL_ERRORS = 5
+
+
+def summarise_latencies(name: str, latencies: list, wall_time: float, errors: int) -> dict:
+    """Reduce a list of per-request latencies to throughput and tail-latency statistics."""
+    latencies = np.asarray(latencies, dtype=float)
+    completed = len(latencies)
+    summary = {
+        "scenario": name,
+        "completed": completed,
+        "errors": errors,
+        "wall_time_s": wall_time,
+        "throughput_per_s": completed / wall_time if wall_time > 0 else float('nan'),
+    }
+    if completed > 0:
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        summary.update({
+            "latency_mean_s": float(latencies.mean()),
+            "latency_p50_s": float(p50),
+            "latency_p90_s": float(p90),
+            "latency_p95_s": float(p95),
+            "latency_p99_s": float(p99),
+            "latency_max_s": float(latencies.max()),
+        })
+    return summary
+
+
+def generate_inputs(input_data: dict, number_of_requests: int) -> list:
+    """Make distinct inputs by removing one turbine per case, as in 03_compute_AEP_async_removing_1_turbine.py"""
+    inputs = []
+    turbines = input_data['windFarms'][0]['turbines']
+    for i in range(number_of_requests):
+        case = deepcopy(input_data)
+        if turbines:
+            del case['windFarms'][0]['turbines'][i % len(turbines)]
+        inputs.append(case)
+    return inputs
+
+
+def benchmark_wind_farmer_api(api_url: str, inputs: list, concurrency: int, polling_interval: float,
+                              first_poll_delay: float = None) -> list:
+    """
+    Drive the WindFarmerAPI class: synchronous AEP calls from a thread pool, then async submit-and-poll calls.
+    Async jobs wait first_poll_delay (the polling interval if None) before their first poll, rather than the 5 to 6 s
+    default of poll_for_status, which would otherwise dominate the measured latency.
+    """
+    if first_poll_delay is None:
+        first_poll_delay = polling_interval
+    wf_api = WindFarmerAPI(AUTH_TOKEN, api_url)
+
+    def timed_sync_call(input_data):
+        start = time.time()
+        results = wf_api.call_aep_api_sync(input_data)
+        return time.time() - start, results is not None
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed_sync_call, inputs))
+    sync_wall_time = time.time() - start
+    sync_summary = summarise_latencies("wind_farmer_api_sync",
+                                       [t for t, ok in outcomes if ok], sync_wall_time,
+                                       sum(1 for _, ok in outcomes if not ok))
+
+    async def timed_async_call(input_data, semaphore):
+        async with semaphore:
+            start = time.time()
+            try:
+                await wf_api.call_aep_api_async(input_data, polling_interval, first_poll_delay_seconds=first_poll_delay)
+                return time.time() - start, True
+            except Exception as e:
+                print(f'async call failed: {e}')
+                return time.time() - start, False
+
+    async def run_async_calls():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*[timed_async_call(x, semaphore) for x in inputs])
+
+    start = time.time()
+    outcomes = asyncio.run(run_async_calls())
+    async_wall_time = time.time() - start
+    async_summary = summarise_latencies("wind_farmer_api_async",
+                                        [t for t, ok in outcomes if ok], async_wall_time,
+                                        sum(1 for _, ok in outcomes if not ok))
+    return [sync_summary, async_summary]
+
+
+def benchmark_batch(api_url: str, inputs: list, polling_interval: float) -> list:
+    """Replicate the batch notebook: submit every job, then poll all outstanding jobs until each one completes."""
+    headers = {'Authorization': f'Bearer {AUTH_TOKEN}', 'Content-Type': 'application/json'}
+    start = time.time()
+    submit_latencies = []
+    submitted_at = {}
+    submit_errors = 0
+    for i, input_data in enumerate(inputs):
+        submit_start = time.time()
+        response = requests.post(api_url + 'AnnualEnergyProductionAsync', headers=headers, json=input_data)
+        if response.status_code == 202:
+            submit_latencies.append(time.time() - submit_start)
+            submitted_at[response.json()['jobId']] = submit_start
+        else:
+            submit_errors += 1
+    submit_wall_time = time.time() - start
+
+    completion_latencies = []
+    failed_jobs = 0
+    outstanding = set(submitted_at)
+    poll_errors = dict.fromkeys(outstanding, 0)
+    while outstanding:
+        for job_id in list(outstanding):
+            response = requests.get(api_url + 'AnnualEnergyProductionAsync', headers=headers, params={'jobId': job_id})
+            if response.status_code != 200:
+                # give up on a job whose status can't be read, e.g. a lost job id, rather than polling it forever
+                poll_errors[job_id] += 1
+                if poll_errors[job_id] > MAX_POLL_ERRORS:
+                    failed_jobs += 1
+                    outstanding.remove(job_id)
+                continue
+            poll_errors[job_id] = 0
+            status = response.json()['status']
+            if status == 'SUCCESS':
+                completion_latencies.append(time.time() - submitted_at[job_id])
+                outstanding.remove(job_id)
+            elif status == 'FAILED':
+                failed_jobs += 1
+                outstanding.remove(job_id)
+        if outstanding:
+            # back off while polls are failing
+            time.sleep(polling_interval * 2 ** max(poll_errors[job_id] for job_id in outstanding))
+    batch_wall_time = time.time() - start
+
+    return [summarise_latencies("batch_submit", submit_latencies, submit_wall_time, submit_errors),
+            summarise_latencies("batch_job_completion", completion_latencies, batch_wall_time, failed_jobs + submit_errors)]
+
+
+def benchmark_async_examples(api_url: str, inputs: list, concurrency: int) -> list:
+    """Replicate CalculateAepAsynchronously/02 and 03: gather concurrent AnnualEnergyProduction posts on one aiohttp session."""
+    headers = {'Authorization': f'Bearer {AUTH_TOKEN}', 'Content-Type': 'application/json'}
+
+    async def call_api(session, data):
+        start = time.time()
+        async with session.post(api_url + 'AnnualEnergyProduction', headers=headers, json=data) as resp:
+            await resp.read()
+            return time.time() - start, resp.status == 200
+
+    async def main():
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await asyncio.gather(*[call_api(session, x) for x in inputs])
+
+    start = time.time()
+    outcomes = asyncio.run(main())
+    wall_time = time.time() - start
+    return [summarise_latencies("async_examples", [t for t, ok in outcomes if ok], wall_time,
+                                sum(1 for _, ok in outcomes if not ok))]
+
+
+def run_benchmarks(api_url: str, scenarios: list, inputs: list, concurrency: int, polling_interval: float,
+                   first_poll_delay: float = None) -> list:
+    results = []
+    if 'wind_farmer_api' in scenarios:
+        results.extend(benchmark_wind_farmer_api(api_url, inputs, concurrency, polling_interval, first_poll_delay))
+    if 'batch' in scenarios:
+        results.extend(benchmark_batch(api_url, inputs, polling_interval))
+    if 'async_examples' in scenarios:
+        results.extend(benchmark_async_examples(api_url, inputs, concurrency))
+    return results
+
+
+def print_results_table(results: list):
+    columns = ["scenario", "completed", "errors", "wall_time_s", "throughput_per_s", "latency_p50_s", "latency_p95_s", "latency_p99_s", "latency_max_s"]
+    print('\t'.join(columns))
+    for result in results:
+        print('\t'.join(f'{result[c]:.3f}' if isinstance(result.get(c), float) else str(result.get(c, '')) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WindFarmer API client flows against a local mock server.')
+    parser.add_argument('--url', default=None, help='API base url of a running server; if omitted a mock server is started in-process')
+    parser.add_argument('--scenario', default='all', choices=['all', 'wind_farmer_api', 'batch', 'async_examples'])
+    parser.add_argument('--input', default=DEFAULT_INPUT_FILE, help='AEP input json used as the base case')
+    parser.add_argument('--requests', type=int, default=10, help='number of cases per scenario')
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--polling-interval', type=float, default=0.5, help='seconds between async job status polls')
+    parser.add_argument('--first-poll-delay', type=float, default=None,
+                        help='seconds before the first status poll of a WindFarmerAPI async job, by default the polling interval')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--job-queue-seconds', type=float, default=0.5)
+    parser.add_argument('--job-run-seconds', type=float, default=1.0)
+    parser.add_argument('--max-running-jobs', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write the results as json to this file, e.g. for CI regression tracking')
+    args = parser.parse_args()
+
+    scenarios = ['wind_farmer_api', 'batch', 'async_examples'] if args.scenario == 'all' else [args.scenario]
+    with open(args.input) as f:
+        inputs = generate_inputs(json.load(f), args.requests)
+
+    if args.url:
+        results = run_benchmarks(args.url, scenarios, inputs, args.concurrency, args.polling_interval,
+                                 args.first_poll_delay)
+    else:
+        config = MockServerConfig(
+            latency_seconds=args.latency,
+            latency_jitter_seconds=args.jitter,
+            failure_rate=args.failure_rate,
+            job_queue_seconds=args.job_queue_seconds,
+            job_run_seconds=args.job_run_seconds,
+            max_running_jobs=args.max_running_jobs,
+            max_in_flight_requests=args.max_in_flight,
+            seed=args.seed)
+        with MockWindFarmerServer(config) as server:
+            results = run_benchmarks(server.api_url, scenarios, inputs, args.concurrency, args.polling_interval,
+                                     args.first_poll_delay)
+
+    print_results_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
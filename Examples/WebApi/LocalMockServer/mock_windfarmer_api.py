@@ -0,0 +1,479 @@
+"""
+Local stand-in for the WindFarmer Services web API, for load and regression benchmarks.
+
+The mock implements the endpoints used by the examples in this repository
+(Status, AtmosphericConditions, AnnualEnergyProduction, AnnualEnergyProductionAsync
+and BlockageCorrection) and answers with the same JSON shapes that the example
+clients parse. Results are synthetic but deterministic for a given input.
+Latency, failure rate and throttling are configurable so client pipelines can be
+benchmarked offline and in CI.
+
+Run it standalone with:
+    python mock_windfarmer_api.py --port 8765 --latency 0.2 --failure-rate 0.01
+then point the examples at http://127.0.0.1:8765/api/v3/
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+API_PREFIX = '/api/v3/'
+HOURS_PER_YEAR = 8766.0
+
+
+class MockServerConfig:
+    """
+    Behaviour settings of the mock WindFarmer API server.
+    """
+    def __init__(self,
+                 latency_seconds: float = 0.05,
+                 latency_jitter_seconds: float = 0.0,
+                 seconds_per_turbine: float = 0.0,
+                 failure_rate: float = 0.0,
+                 job_failure_rate: float = 0.0,
+                 max_requests_per_second: float = None,
+                 max_in_flight_requests: int = None,
+                 job_queue_seconds: float = 1.0,
+                 job_run_seconds: float = 2.0,
+                 max_running_jobs: int = None,
+                 seed: int = None):
+        """
+        :param latency_seconds: Base response time added to every request.
+        :param latency_jitter_seconds: Standard deviation of a log-normal jitter added on top of the base latency, giving a realistic tail.
+        :param seconds_per_turbine: Extra latency per turbine for synchronous AEP calls, and extra run time per turbine for async jobs.
+        :param failure_rate: Probability [0-1] that a request fails with a 500 response.
+        :param job_failure_rate: Probability [0-1] that an accepted async job ends with status FAILED.
+        :param max_requests_per_second: If set, requests above this rate are throttled with a 429 response.
+        :param max_in_flight_requests: If set, requests above this concurrency are throttled with a 429 response.
+        :param job_queue_seconds: Time an async job stays PENDING before it can start running.
+        :param job_run_seconds: Time an async job stays RUNNING before it completes.
+        :param max_running_jobs: If set, the number of async jobs that may run at once; further jobs wait in the queue.
+        :param seed: Seed for the random latency and failure draws, for reproducible runs.
+        """
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.seconds_per_turbine = seconds_per_turbine
+        self.failure_rate = failure_rate
+        self.job_failure_rate = job_failure_rate
+        self.max_requests_per_second = max_requests_per_second
+        self.max_in_flight_requests = max_in_flight_requests
+        self.job_queue_seconds = job_queue_seconds
+        self.job_run_seconds = job_run_seconds
+        self.max_running_jobs = max_running_jobs
+        self.seed = seed
+
+
+class _Job:
+    def __init__(self, job_id, input_data, submitted_at, start_at, finish_at, will_fail):
+        self.job_id = job_id
+        self.input_data = input_data
+        self.submitted_at = submitted_at
+        self.start_at = start_at
+        self.finish_at = finish_at
+        self.will_fail = will_fail
+        self.results = None
+
+
+class MockWindFarmerState:
+    """
+    Shared state of the mock server: async job queue, throttling counters and request statistics.
+    """
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._random = random.Random(config.seed)
+        self._jobs = {}
+        self._running_slot_free_at = [0.0] * (config.max_running_jobs or 0)
+        self._request_times = []
+        self._in_flight = 0
+        self.request_counts = {}
+        self.throttled_count = 0
+        self.failed_count = 0
+
+    def draw(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def draw_latency(self, number_of_turbines: int = 0) -> float:
+        latency = self.config.latency_seconds + number_of_turbines * self.config.seconds_per_turbine
+        if self.config.latency_jitter_seconds:
+            with self._lock:
+                latency += self._random.lognormvariate(0.0, 1.0) * self.config.latency_jitter_seconds
+        return latency
+
+    def enter_request(self, endpoint: str) -> bool:
+        """Register an incoming request. Returns False if the request should be throttled."""
+        now = time.time()
+        with self._lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+            if self.config.max_requests_per_second:
+                self._request_times = [t for t in self._request_times if now - t < 1.0]
+                if len(self._request_times) >= self.config.max_requests_per_second:
+                    self.throttled_count += 1
+                    return False
+                self._request_times.append(now)
+            if self.config.max_in_flight_requests and self._in_flight >= self.config.max_in_flight_requests:
+                self.throttled_count += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def exit_request(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failed_count += 1
+
+    def submit_job(self, input_data: dict) -> str:
+        now = time.time()
+        run_seconds = self.config.job_run_seconds + count_turbines(input_data) * self.config.seconds_per_turbine
+        will_fail = self.draw() < self.config.job_failure_rate
+        with self._lock:
+            start_at = now + self.config.job_queue_seconds
+            if self._running_slot_free_at:
+                slot = min(range(len(self._running_slot_free_at)), key=lambda i: self._running_slot_free_at[i])
+                start_at = max(start_at, self._running_slot_free_at[slot])
+                self._running_slot_free_at[slot] = start_at + run_seconds
+            job = _Job(str(uuid.uuid4()), input_data, now, start_at, start_at + run_seconds, will_fail)
+            self._jobs[job.job_id] = job
+        return job.job_id
+
+    def get_job(self, job_id: str) -> _Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_statistics(self) -> dict:
+        with self._lock:
+            return {
+                "requestCounts": dict(self.request_counts),
+                "throttledCount": self.throttled_count,
+                "failedCount": self.failed_count,
+                "jobCount": len(self._jobs),
+            }
+
+
+def count_turbines(input_data: dict) -> int:
+    return sum(len(farm.get("turbines", [])) for farm in input_data.get("windFarms", []))
+
+
+def _stable_fraction(*keys) -> float:
+    """A deterministic pseudo-random number in [0, 1) derived from the given keys."""
+    digest = hashlib.sha1('|'.join(str(k) for k in keys).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) / 0xFFFFFFFF
+
+
+def validate_aep_input(input_data: dict) -> dict:
+    """Minimal checks mirroring the 400 response of the real service. Returns an errors dict, empty if valid."""
+    errors = {}
+    for key in ["windFarms", "turbineModels", "energyEfficienciesSettings"]:
+        if key not in input_data:
+            errors[key] = [f"The {key} field is required."]
+    if not errors:
+        model_ids = {m.get("id") for m in input_data["turbineModels"]}
+        for farm in input_data["windFarms"]:
+            for turbine in farm.get("turbines", []):
+                if turbine.get("turbineModelId") not in model_ids:
+                    errors.setdefault("turbineModelId", []).append(
+                        f"Turbine {turbine.get('name')} references unknown turbine model {turbine.get('turbineModelId')}.")
+    return errors
+
+
+def build_aep_results(input_data: dict) -> dict:
+    """
+    Build a synthetic AEP results dictionary with the shape of the real AnnualEnergyProduction response.
+    Yields are derived from the turbine model rated power and a deterministic, location-dependent capacity factor.
+    """
+    rated_power_W = {}
+    for model in input_data.get("turbineModels", []):
+        points = [p for data in model.get("performanceData", []) for p in data.get("performanceDataPoints", [])]
+        rated_power_W[model["id"]] = max([p.get("powerOutput_W", 0.0) for p in points], default=3.0e6)
+
+    efficiencies = input_data.get("energyEfficienciesSettings", {})
+    blockage_model = efficiencies.get("blockageModel", {})
+    blockage_model_type = str(blockage_model.get("blockageModelType", "BEET"))
+    blockage_settings = blockage_model.get(blockage_model_type.lower(), {}) or {}
+    significant_stability = bool(blockage_settings.get("significantAtmosphericStability", False))
+    has_wake_model = efficiencies.get("wakeModel", {}).get("wakeModelType", "EddyViscosity") != "NoWakeModel"
+    has_neighbours = any(f.get("isNeighbor", False) for f in input_data.get("windFarms", []))
+    number_of_turbines = count_turbines(input_data)
+    blockage_efficiency = 1.0 - (0.004 if significant_stability else 0.002) * math.sqrt(max(number_of_turbines, 1))
+
+    wind_farm_outputs = []
+    for farm in input_data.get("windFarms", []):
+        if farm.get("isNeighbor", False):
+            continue
+        turbine_results = []
+        for turbine in farm.get("turbines", []):
+            location = turbine.get("location", {})
+            variation = _stable_fraction(farm.get("name"), turbine.get("name"), location.get("easting_m"), location.get("northing_m"))
+            gross = rated_power_W.get(turbine.get("turbineModelId"), 3.0e6) / 1e6 * HOURS_PER_YEAR * (0.40 + 0.08 * variation)
+            blockage_on = gross * blockage_efficiency
+            internal_wakes_on = blockage_on * ((0.90 + 0.08 * variation) if has_wake_model else 1.0)
+            hysteresis_on = internal_wakes_on * 0.999
+            lwf_on = hysteresis_on * (0.99 if has_wake_model else 1.0)
+            neighbours_on = lwf_on * (0.98 if has_neighbours and has_wake_model else 1.0)
+            turbine_results.append({
+                "turbineName": turbine.get("name"),
+                "turbineLocation": location,
+                "grossAnnualYield_MWh_per_year": gross,
+                "blockageOnAnnualYield_MWh_per_year": blockage_on,
+                "internalWakesOnAnnualYield_MWh_per_year": internal_wakes_on,
+                "hysteresisAdjustmentOnAnnualYield_MWh_per_year": hysteresis_on,
+                "largeWindFarmCorrectionOnAnnualYield_MWh_per_year": lwf_on,
+                "neighborsWakesOnAnnualYield_MWh_per_year": neighbours_on,
+                "fullAnnualYield_MWh_per_year": neighbours_on,
+            })
+
+        def total(key):
+            return sum(t[key] for t in turbine_results)
+
+        wind_farm_outputs.append({
+            "windFarmName": farm.get("name"),
+            "grossAnnualEnergyYield_MWh_per_year": total("grossAnnualYield_MWh_per_year"),
+            "blockageOnAnnualEnergyYield_MWh_per_year": total("blockageOnAnnualYield_MWh_per_year"),
+            "internalWakesOnAnnualEnergyYield_MWh_per_year": total("internalWakesOnAnnualYield_MWh_per_year"),
+            "hysteresisAdjustmentOnAnnualEnergyYield_MWh_per_year": total("hysteresisAdjustmentOnAnnualYield_MWh_per_year"),
+            "largeWindFarmCorrectionOnAnnualEnergyYield_MWh_per_year": total("largeWindFarmCorrectionOnAnnualYield_MWh_per_year"),
+            "neighborsWakesOnAnnualEnergyYield_MWh_per_year": total("neighborsWakesOnAnnualYield_MWh_per_year"),
+            "fullAnnualEnergyYield_MWh_per_year": total("fullAnnualYield_MWh_per_year"),
+            "turbineResults": turbine_results,
+        })
+    return {"windFarmAepOutputs": wind_farm_outputs, "weightedBlockageEfficiency": blockage_efficiency}
+
+
+def build_blockage_result(input_data: dict) -> dict:
+    """Synthetic BlockageCorrection response: a correction factor between 0 and 1."""
+    number_of_turbines = len(input_data.get("turbines", []))
+    stable = bool(input_data.get("significantAtmosphericStability", False))
+    return {"blockageEffect": 1.0 - (0.004 if stable else 0.002) * math.sqrt(max(number_of_turbines, 1))}
+
+
+def build_atmospheric_conditions(lat: float, lon: float, number_of_sectors: int = 12) -> dict:
+    """Synthetic AtmosphericConditions response with a two-class stability rose."""
+    sector_width = 360.0 / number_of_sectors
+    probability_distribution = []
+    for i in range(number_of_sectors):
+        stable_weight = 0.2 + 0.3 * _stable_fraction(lat, lon, i)
+        probability_distribution.append({
+            "fromDirection_degrees": (i * sector_width - sector_width / 2) % 360,
+            "toDirection_degrees": (i * sector_width + sector_width / 2) % 360,
+            "probabilityForClasses": [stable_weight, 1.0 - stable_weight],
+            "atmosphericConditionClassIds": ["mock_stable", "mock_unstable_neutral"],
+        })
+    return {"atmosphericConditions": {
+        "atmosphericConditionClasses": [],
+        "atmosphericConditionProbabilityDistribution": probability_distribution,
+    }}
+
+
+class MockWindFarmerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler routing WindFarmer API paths to the synthetic implementations above.
+    """
+    protocol_version = 'HTTP/1.1'
+    state: MockWindFarmerState = None
+
+    def log_message(self, format, *args):
+        # keep benchmark output readable
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method: str):
+        parsed_url = urlparse(self.path)
+        endpoint = parsed_url.path[len(API_PREFIX):] if parsed_url.path.startswith(API_PREFIX) else parsed_url.path
+        body = self._read_body()
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self._send_json(401, {"detail": "Missing bearer token."})
+            return
+        if not self.state.enter_request(endpoint):
+            self._send_json(429, {"detail": "Too many requests, please retry later."}, {"Retry-After": "1"})
+            return
+        try:
+            self._route(method, endpoint, parse_qs(parsed_url.query), body)
+        finally:
+            self.state.exit_request()
+
+    def _route(self, method, endpoint, query, body):
+        # polling the async job status is a cheap call on the real service, so skip the simulated latency and failures
+        is_poll = method == 'GET' and endpoint == 'AnnualEnergyProductionAsync'
+        input_data = None
+        if method == 'POST':
+            try:
+                input_data = json.loads(body) if body else {}
+            except ValueError:
+                self._send_json(400, {"detail": "Request body is not valid JSON."})
+                return
+            if not isinstance(input_data, dict):
+                self._send_json(400, {"detail": "Request body must be a JSON object."})
+                return
+        if not is_poll:
+            time.sleep(self.state.draw_latency(count_turbines(input_data) if endpoint == 'AnnualEnergyProduction' and input_data else 0))
+            if self.state.draw() < self.state.config.failure_rate:
+                self.state.record_failure()
+                self._send_json(500, {"detail": "Simulated internal server error."})
+                return
+
+        if method == 'GET' and endpoint == 'Status':
+            self._send_json(200, {
+                "message": "WindFarmer mock API is running.",
+                "windFarmerServicesAPIVersion": "3.0.0-mock",
+                "calculationLibraryVersion": "0.0.0-mock",
+            })
+        elif method == 'GET' and endpoint == 'AtmosphericConditions':
+            lat = float(query.get('lat', [0.0])[0])
+            lon = float(query.get('lon', [0.0])[0])
+            self._send_json(200, build_atmospheric_conditions(lat, lon))
+        elif method == 'POST' and endpoint == 'AnnualEnergyProduction':
+            errors = validate_aep_input(input_data)
+            if errors:
+                self._send_json(400, {"detail": "One or more validation errors occurred.", "errors": errors})
+            else:
+                self._send_json(200, build_aep_results(input_data))
+        elif method == 'POST' and endpoint == 'AnnualEnergyProductionAsync':
+            errors = validate_aep_input(input_data)
+            if errors:
+                self._send_json(400, {"detail": "One or more validation errors occurred.", "errors": errors})
+            else:
+                self._send_json(202, {"jobId": self.state.submit_job(input_data)})
+        elif is_poll:
+            self._send_job_status(query.get('jobId', [None])[0])
+        elif method == 'POST' and endpoint == 'BlockageCorrection':
+            if not input_data.get("turbines") or not input_data.get("turbinePerformance"):
+                self._send_json(400, {"detail": "turbines and turbinePerformance are required."})
+            else:
+                self._send_json(200, build_blockage_result(input_data))
+        elif method == 'GET' and endpoint == 'MockStatistics':
+            self._send_json(200, self.state.get_statistics())
+        else:
+            self._send_json(404, {"detail": f"Unknown endpoint {method} {endpoint}"})
+
+    def _send_job_status(self, job_id):
+        job = self.state.get_job(job_id)
+        if job is None:
+            self._send_json(404, {"detail": f"Job {job_id} not found."})
+            return
+        now = time.time()
+        if now < job.start_at:
+            self._send_json(200, {"status": "PENDING", "message": "Job queued"})
+        elif now < job.finish_at:
+            progress = int(100 * (now - job.start_at) / max(job.finish_at - job.start_at, 1e-9))
+            self._send_json(200, {"status": "RUNNING", "progress": progress, "stageMessage": "Calculating energy"})
+        elif job.will_fail:
+            self._send_json(200, {"status": "FAILED", "message": "Simulated calculation failure"})
+        else:
+            if job.results is None:
+                job.results = build_aep_results(job.input_data)
+            self._send_json(200, {"status": "SUCCESS", "progress": 100, "results": job.results})
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status_code: int, payload: dict, extra_headers: dict = None):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class MockWindFarmerServer:
+    """
+    A mock WindFarmer API server running on a background thread.
+
+    Usage:
+        with MockWindFarmerServer(MockServerConfig(latency_seconds=0.1)) as server:
+            wf_api = WindFarmerAPI('any-token', server.api_url)
+    """
+    def __init__(self, config: MockServerConfig = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        :param config: Behaviour settings, defaults to a fast and reliable server.
+        :param host: Interface to bind to.
+        :param port: Port to listen on, 0 picks a free port.
+        """
+        self.config = config or MockServerConfig()
+        self.state = MockWindFarmerState(self.config)
+        handler = type('BoundMockWindFarmerRequestHandler', (MockWindFarmerRequestHandler,), {'state': self.state})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local mock of the WindFarmer web API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='base latency per request [s]')
+    parser.add_argument('--jitter', type=float, default=0.0, help='log-normal latency jitter scale [s]')
+    parser.add_argument('--seconds-per-turbine', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--job-failure-rate', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=float, default=None, help='throttle above this many requests per second')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='throttle above this many concurrent requests')
+    parser.add_argument('--job-queue-seconds', type=float, default=1.0)
+    parser.add_argument('--job-run-seconds', type=float, default=2.0)
+    parser.add_argument('--max-running-jobs', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockServerConfig(
+        latency_seconds=args.latency,
+        latency_jitter_seconds=args.jitter,
+        seconds_per_turbine=args.seconds_per_turbine,
+        failure_rate=args.failure_rate,
+        job_failure_rate=args.job_failure_rate,
+        max_requests_per_second=args.max_rps,
+        max_in_flight_requests=args.max_in_flight,
+        job_queue_seconds=args.job_queue_seconds,
+        job_run_seconds=args.job_run_seconds,
+        max_running_jobs=args.max_running_jobs,
+        seed=args.seed)
+    server = MockWindFarmerServer(config, args.host, args.port)
+    print(f'Mock WindFarmer API listening on {server.api_url} (Ctrl+C to stop)')
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import numpy as np
+import shapely
+
+
+def read_geometries(path, crs=None):
+    """ Read the geometries of a shapefile (or any file geopandas reads), e.g. a buildable area or exclusion zone
+    Args:
+    path: str
+        Path of the file
+    crs: str or pyproj CRS, default: None
+        Coordinate system to transform the geometries to, e.g. "EPSG:32605". Left in the file's if None.
+    Returns a numpy array of shapely geometries
+    Needs geopandas, installed by Source/environment.yml
+    """
+    import geopandas as gpd
+
+    frame = gpd.read_file(path)
+    if crs is not None and frame.crs is not None:
+        frame = frame.to_crs(crs)
+    return frame.geometry.to_numpy()
+
+
+def _prepare(geometries, setback=0.0):
+    """ One prepared geometry of the union of geometries, buffered by a setback, or None if it has no area """
+    geometries = np.asarray(geometries, dtype=object)
+    if setback:
+        geometries = shapely.buffer(geometries, setback)
+    union = shapely.union_all(geometries)
+    if union.is_empty or union.area == 0.0:
+        return None
+    shapely.prepare(union)
+    return union
+
+
+class Constraints:
+    def __init__(self, buildable_areas, exclusions=None):
+        """ Buildable areas and exclusion zones, each unioned into one prepared geometry, to test many candidate turbine
+        positions at once
+        Args:
+        buildable_areas: list of shapely geometries
+            Areas turbines can be in, e.g. the polygons of Boundary.shp
+        exclusions: dict, default: None
+            (geometries, setback) by exclusion name, e.g. {"road": (road lines, 150.0)}. A position is excluded within
+            the setback of a geometry, in the units of the coordinate system, so lines and points need a setback.
+            Raises ValueError for an exclusion with no area, e.g. lines with a setback of 0, rather than ignore it.
+        """
+        self._buildable_area = _prepare(buildable_areas)
+        if self._buildable_area is None:
+            raise ValueError("The buildable areas have no area")
+        self.bounds = self._buildable_area.bounds
+        self._exclusions = {}
+        for name, (geometries, setback) in (exclusions or {}).items():
+            exclusion = _prepare(geometries, setback)
+            if exclusion is None:
+                raise ValueError(f"Exclusion {name} has no area with a setback of {setback}, lines and points need a setback")
+            self._exclusions[name] = exclusion
+
+    @classmethod
+    def from_files(cls, buildable_area_files, exclusion_files=None, crs=None):
+        """ Constraints read from shapefiles, e.g. of the Hawaii "Buildable area" folder
+        Args:
+        buildable_area_files: list of str
+            Paths of the buildable area files
+        exclusion_files: dict, default: None
+            Setback of each exclusion file, by path, e.g. {"road.shp": 150.0, "exclusion.shp": 0.0}
+        crs: str or pyproj CRS, default: None
+            Coordinate system to read all the files in, which setbacks are in the units of. Left in each file's if None.
+        Returns the Constraints
+        """
+        buildable_areas = np.concatenate([read_geometries(path, crs) for path in buildable_area_files])
+        exclusions = {path: (read_geometries(path, crs), setback) for path, setback in (exclusion_files or {}).items()}
+        return cls(buildable_areas, exclusions)
+
+    @property
+    def exclusion_names(self):
+        return list(self._exclusions)
+
+    def get_excluded(self, x, y):
+        """ Masks of the positions in each exclusion zone, by exclusion name
+        Args:
+        x, y: array like
+            Coordinates of the positions
+        Returns a dict of numpy bool arrays, by exclusion name
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        excluded = {}
+        for name, exclusion in self._exclusions.items():
+            excluded[name] = self._intersects(exclusion, x, y, np.ones(x.shape, dtype=bool))
+        return excluded
+
+    @staticmethod
+    def _intersects(geometry, x, y, candidates):
+        """ Mask of the candidate positions in or on a prepared geometry, testing only those in its bounding box """
+        xmin, ymin, xmax, ymax = geometry.bounds
+        in_box = candidates & (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        result = np.zeros(x.shape, dtype=bool)
+        result[in_box] = shapely.intersects_xy(geometry, x[in_box], y[in_box])
+        return result
+
+    def is_allowed(self, x, y, chunk_size=1_000_000):
+        """ Mask of the positions in a buildable area and not in any exclusion zone or its setback
+        Positions outside the buildable areas aren't tested against the exclusions.
+        Args:
+        x, y: array like
+            Coordinates of the positions, e.g. a candidate grid
+        chunk_size: int, default: 1000000
+            Number of positions tested at a time, bounding the memory of intermediate arrays
+        Returns a numpy bool array of the shape of x
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        allowed = np.zeros(x.shape, dtype=bool)
+        flat_x = x.ravel()
+        flat_y = y.ravel()
+        flat_allowed = allowed.ravel()
+        for start in range(0, len(flat_x), chunk_size):
+            chunk_x = flat_x[start:start + chunk_size]
+            chunk_y = flat_y[start:start + chunk_size]
+            chunk = self._intersects(self._buildable_area, chunk_x, chunk_y, np.ones(chunk_x.shape, dtype=bool))
+            for exclusion in self._exclusions.values():
+                chunk &= ~self._intersects(exclusion, chunk_x, chunk_y, chunk)
+            flat_allowed[start:start + chunk_size] = chunk
+        return allowed
+
+    def get_candidate_grid(self, spacing_x, spacing_y=None, rotation_degrees=0.0, origin=None):
+        """ The positions of a regular grid, optionally rotated, over the buildable areas that are allowed
+        Args:
+        spacing_x, spacing_y: float
+            Grid spacing along the rotated x and y axes. spacing_y is spacing_x if None.
+        rotation_degrees: float, default: 0.0
+            Anticlockwise rotation of the grid
+        origin: (float, float), default: None
+            A grid point, the centre of the buildable area bounds if None
+        Returns (x, y), numpy arrays of the allowed grid positions
+        """
+        spacing_y = spacing_x if spacing_y is None else spacing_y
+        xmin, ymin, xmax, ymax = self.bounds
+        origin_x, origin_y = origin if origin is not None else (0.5 * (xmin + xmax), 0.5 * (ymin + ymax))
+        # grid wide enough to cover the bounds at any rotation
+        half_size = np.hypot(max(xmax - origin_x, origin_x - xmin), max(ymax - origin_y, origin_y - ymin))
+        u = np.arange(-np.ceil(half_size / spacing_x), np.ceil(half_size / spacing_x) + 1) * spacing_x
+        v = np.arange(-np.ceil(half_size / spacing_y), np.ceil(half_size / spacing_y) + 1) * spacing_y
+        u, v = np.meshgrid(u, v)
+        angle = np.radians(rotation_degrees)
+        x = origin_x + u.ravel() * np.cos(angle) - v.ravel() * np.sin(angle)
+        y = origin_y + u.ravel() * np.sin(angle) + v.ravel() * np.cos(angle)
+        in_bounds = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        x = x[in_bounds]
+        y = y[in_bounds]
+        allowed = self.is_allowed(x, y)
+        return x[allowed], y[allowed]
@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+import netCDF4
+from windfarmer.time_series import (DEFAULT_WIND_SPEED_BIN_UPPER_LIMITS, get_bin_indices, make_frequency_table)
+
+# coordinate variables of New European Wind Atlas (NEWA) mesoscale time series, for each point
+POINT_COORDINATES = {"XLAT": "latitude", "XLON": "longitude", "west_east": "x", "south_north": "y"}
+
+
+class MesoscaleTimeSeries:
+    def __init__(self, path, time_variable="time", height_variable="height"):
+        """ A NEWA style mesoscale time series NetCDF file, opened lazily: only the times, heights and point coordinates
+        are read here, and variables are read in time windows of the heights asked for.
+        Variables are (time, height, ...) or (time, ...), with any other dimensions, e.g. south_north and west_east of a
+        zone, flattened to points.
+        Args:
+        path: str
+            Path of the NetCDF file
+        time_variable: str, default: "time"
+            Name of the time variable, with CF units, e.g. minutes since 1989-01-01
+        height_variable: str, default: "height"
+            Name of the height variable, and dimension
+        """
+        self.path = path
+        self._dataset = netCDF4.Dataset(path)
+        self._time_variable = time_variable
+        self._height_variable = height_variable
+        time = self._dataset.variables[time_variable]
+        self._time_values = np.asarray(time[:])
+        self._time_units = time.units
+        self._calendar = getattr(time, "calendar", "standard")
+        if height_variable in self._dataset.variables:
+            self.heights = np.asarray(self._dataset.variables[height_variable][:], dtype=float)
+        else:
+            self.heights = np.empty(0)
+
+    def close(self):
+        self._dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def number_of_times(self):
+        return len(self._time_values)
+
+    @property
+    def variables(self):
+        return list(self._dataset.variables)
+
+    def _get_point_dimensions(self, variable):
+        return [d for d in self._dataset.variables[variable].dimensions if d not in (self._time_variable, self._height_variable)]
+
+    def get_number_of_points(self, variable="WS"):
+        return int(np.prod([len(self._dataset.dimensions[d]) for d in self._get_point_dimensions(variable)], dtype=np.int64))
+
+    def get_points(self, variable="WS"):
+        """ Coordinates of the points of a variable, in the flattened order of its point dimensions, as a DataFrame
+        """
+        dimensions = self._get_point_dimensions(variable)
+        shape = tuple(len(self._dataset.dimensions[d]) for d in dimensions)
+        points = pd.DataFrame(index=pd.RangeIndex(int(np.prod(shape, dtype=np.int64)), name="point"))
+        for name, column in POINT_COORDINATES.items():
+            if name not in self._dataset.variables:
+                continue
+            coordinate = self._dataset.variables[name]
+            values = np.asarray(coordinate[:], dtype=float)
+            if coordinate.dimensions == ():
+                points[column] = float(values)
+            elif set(coordinate.dimensions) <= set(dimensions):
+                # broadcast e.g. a west_east coordinate over the south_north x west_east points
+                expanded = values.reshape([len(self._dataset.dimensions[d]) if d in coordinate.dimensions else 1
+                                           for d in dimensions])
+                points[column] = np.broadcast_to(expanded, shape).ravel()
+        return points
+
+    def get_times(self, start_index=0, stop_index=None):
+        """ Times of a range of time indices, as numpy datetime64
+        """
+        values = self._time_values[start_index:stop_index]
+        times = netCDF4.num2date(values, self._time_units, self._calendar,
+                                 only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+        return np.asarray(times, dtype="datetime64[s]")
+
+    def get_time_indices(self, start=None, stop=None):
+        """ Range of time indices, start inclusive and stop exclusive, of a time window
+        Args:
+        start, stop: datetime, numpy datetime64 or str, default: None
+            Start (inclusive) and stop (exclusive) times, the start or end of the record if None
+        """
+        def to_value(time):
+            return netCDF4.date2num(pd.Timestamp(time).to_pydatetime(), self._time_units, self._calendar)
+        start_index = 0 if start is None else int(np.searchsorted(self._time_values, to_value(start), side="left"))
+        stop_index = self.number_of_times if stop is None else int(np.searchsorted(self._time_values, to_value(stop), side="left"))
+        return start_index, stop_index
+
+    def get_height_indices(self, heights=None):
+        """ Indices of heights in the file, all if None """
+        if heights is None:
+            return np.arange(len(self.heights))
+        indices = []
+        for height in np.atleast_1d(heights):
+            matches = np.flatnonzero(np.isclose(self.heights, height))
+            if len(matches) == 0:
+                raise ValueError(f"{self.path}: no height {height} m, heights are {self.heights.tolist()}")
+            indices.append(int(matches[0]))
+        return np.array(indices)
+
+    def read(self, variable, height_indices=None, start_index=0, stop_index=None):
+        """ Read a variable for a range of time indices and some heights
+        Args:
+        variable: str
+            Variable name, e.g. WS or WD
+        height_indices: array like, default: None
+            Indices of the heights to read, all if None. Ignored for variables without a height dimension.
+        start_index, stop_index: int
+            Range of time indices
+        Returns a float array of times x heights x points, with one height for variables without a height dimension
+        """
+        netcdf_variable = self._dataset.variables[variable]
+        stop_index = self.number_of_times if stop_index is None else stop_index
+        index = [slice(None)] * netcdf_variable.ndim
+        index[netcdf_variable.dimensions.index(self._time_variable)] = slice(start_index, stop_index)
+        has_heights = self._height_variable in netcdf_variable.dimensions
+        if has_heights:
+            height_indices = np.arange(len(self.heights)) if height_indices is None else np.asarray(height_indices)
+            # NetCDF reads increasing indices; put them back in the order asked for after
+            order = np.argsort(height_indices)
+            height_axis = netcdf_variable.dimensions.index(self._height_variable)
+            index[height_axis] = height_indices[order]
+        values = np.ma.filled(netcdf_variable[tuple(index)].astype(float), np.nan)
+        dimensions = [d for d in netcdf_variable.dimensions]
+        if has_heights:
+            values = np.take(values, np.argsort(order), axis=height_axis)
+            values = np.moveaxis(values, [dimensions.index(self._time_variable), height_axis], [0, 1])
+        else:
+            values = np.moveaxis(values, dimensions.index(self._time_variable), 0)[:, None]
+        return values.reshape(values.shape[0], values.shape[1], -1)
+
+    def iter_chunks(self, variables=("WS", "WD"), heights=None, start=None, stop=None, chunk_size=50_000):
+        """ Read variables in chunks of time, for some heights and a time window
+        Args:
+        variables: sequence of str, default: ("WS", "WD")
+            Variables to read
+        heights: array like, default: None
+            Heights to read, m, all if None
+        start, stop: datetime, numpy datetime64 or str, default: None
+            Time window, start inclusive and stop exclusive, the whole record if None
+        chunk_size: int, default: 50000
+            Number of times read at a time, of all points
+        Yields (times, dict of variable name: array of times x heights x points) for each chunk
+        """
+        height_indices = self.get_height_indices(heights)
+        start_index, stop_index = self.get_time_indices(start, stop)
+        for chunk_start in range(start_index, stop_index, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop_index)
+            yield (self.get_times(chunk_start, chunk_stop),
+                   {v: self.read(v, height_indices, chunk_start, chunk_stop) for v in variables})
+
+
+def get_nominal_height(variable):
+    """ Height in the name of a variable without a height dimension, e.g. 10.0 for WS10, or None """
+    match = re.search(r"(\d+(?:\.\d+)?)$", variable)
+    return float(match.group(1)) if match else None
+
+
+def build_frequency_tables(path, heights=None, start=None, stop=None, speed_variable="WS", direction_variable="WD",
+                           wind_speed_bin_upper_limits=DEFAULT_WIND_SPEED_BIN_UPPER_LIMITS, number_of_sectors=12,
+                           direction_for_first_bin_centre=0.0, chunk_size=50_000):
+    """ Count the records of a mesoscale time series file in direction sector x wind speed bins, for each height and point
+    The file is read in chunks of time, and each chunk binned for all heights and points with one bincount.
+    Args:
+    path: str
+        Path of the NetCDF file
+    heights: array like, default: None
+        Heights, m, all if None
+    start, stop: datetime, numpy datetime64 or str, default: None
+        Time window, start inclusive and stop exclusive, the whole record if None
+    speed_variable, direction_variable: str, default: "WS", "WD"
+        Wind speed and direction variables, e.g. WS10 and WD10 for 10 m
+    wind_speed_bin_upper_limits, number_of_sectors, direction_for_first_bin_centre:
+        Binning, as for windfarmer.time_series.build_frequency_tables
+    chunk_size: int, default: 50000
+        Number of times read at a time
+    Returns a dict of frequency tables, as from windfarmer.time_series.build_frequency_tables, by (height, point index),
+    for use with windfarmer.time_series.to_wind_climate. Points are in the order of MesoscaleTimeSeries.get_points.
+    For variables without a height dimension the height is the nominal height of the variable name, e.g. 10.0 for WS10,
+    or None.
+    """
+    upper_limits = np.asarray(wind_speed_bin_upper_limits, dtype=float)
+    with MesoscaleTimeSeries(path) as time_series:
+        if time_series._height_variable in time_series._dataset.variables[speed_variable].dimensions:
+            height_labels = [float(h) for h in time_series.heights[time_series.get_height_indices(heights)]]
+        else:
+            height_labels = [get_nominal_height(speed_variable)]
+        number_of_points = time_series.get_number_of_points(speed_variable)
+        number_of_series = len(height_labels) * number_of_points
+        bins = number_of_sectors * len(upper_limits)
+        counts = np.zeros(number_of_series * bins, dtype=np.int64)
+        records = 0
+        valid_records = np.zeros(number_of_series, dtype=np.int64)
+        for _, chunk in time_series.iter_chunks((speed_variable, direction_variable), heights, start, stop, chunk_size):
+            speeds = chunk[speed_variable]
+            directions = chunk[direction_variable]
+            flat, valid = get_bin_indices(speeds, directions, upper_limits, number_of_sectors, direction_for_first_bin_centre)
+            # series index, height x number of points + point, of each valid record, in the order of the valid mask
+            series = np.broadcast_to(np.arange(number_of_series).reshape(1, len(height_labels), number_of_points),
+                                     speeds.shape)[valid]
+            counts += np.bincount(series * bins + flat, minlength=counts.size)
+            valid_records += np.bincount(series, minlength=number_of_series)
+            records += speeds.shape[0]
+    counts = counts.reshape(len(height_labels), number_of_points, number_of_sectors, len(upper_limits))
+    valid_records = valid_records.reshape(len(height_labels), number_of_points)
+    return {(height, point): make_frequency_table(number_of_sectors, upper_limits, direction_for_first_bin_centre,
+                                                         counts=counts[h, point], records=records,
+                                                         valid_records=int(valid_records[h, point]))
+            for h, height in enumerate(height_labels) for point in range(number_of_points)}
+
+
+def write_columnar_store(path, store_folder, variables=("WS", "WD"), heights=None, start=None, stop=None,
+                         chunk_size=50_000, dtype=np.float32):
+    """ Copy some variables, heights and a time window of a mesoscale time series file into a compact columnar store:
+    a .npy file of each variable (times x heights x points), the times, the point coordinates and a json description.
+    The .npy files are written a chunk at a time through memory maps, and read back memory mapped by read_columnar_store.
+    Args:
+    path: str
+        Path of the NetCDF file
+    store_folder: str
+        Folder of the store, made if needed
+    variables: sequence of str, default: ("WS", "WD")
+        Variables to store
+    heights: array like, default: None
+        Heights, m, all if None
+    start, stop: datetime, numpy datetime64 or str, default: None
+        Time window, start inclusive and stop exclusive, the whole record if None
+    chunk_size: int, default: 50000
+        Number of times read at a time
+    dtype: numpy dtype, default: np.float32
+        Type of the stored values
+    Returns the store folder
+    """
+    os.makedirs(store_folder, exist_ok=True)
+    with MesoscaleTimeSeries(path) as time_series:
+        height_indices = time_series.get_height_indices(heights)
+        start_index, stop_index = time_series.get_time_indices(start, stop)
+        number_of_times = stop_index - start_index
+        number_of_points = time_series.get_number_of_points(variables[0])
+        time_series.get_points(variables[0]).to_csv(os.path.join(store_folder, "points.csv"))
+        times = np.lib.format.open_memmap(os.path.join(store_folder, "times.npy"), mode="w+",
+                                          dtype="datetime64[s]", shape=(number_of_times,))
+        stores = {}
+        for variable in variables:
+            has_heights = time_series._height_variable in time_series._dataset.variables[variable].dimensions
+            shape = (number_of_times, len(height_indices) if has_heights else 1, number_of_points)
+            stores[variable] = np.lib.format.open_memmap(os.path.join(store_folder, f"{variable}.npy"), mode="w+",
+                                                         dtype=dtype, shape=shape)
+        offset = 0
+        for chunk_times, chunk in time_series.iter_chunks(variables, heights, start, stop, chunk_size):
+            n = len(chunk_times)
+            times[offset:offset + n] = chunk_times
+            for variable, values in chunk.items():
+                stores[variable][offset:offset + n] = values
+            offset += n
+        for store in [times] + list(stores.values()):
+            store.flush()
+        description = {
+            "source": os.path.abspath(path),
+            "heights": time_series.heights[height_indices].tolist(),
+            "variables": list(variables),
+            "number_of_times": number_of_times,
+            "number_of_points": number_of_points,
+        }
+    del times, stores
+    with open(os.path.join(store_folder, "store.json"), "w") as f:
+        json.dump(description, f, indent=2)
+    return store_folder
+
+
+def read_columnar_store(store_folder):
+    """ Open a store written by write_columnar_store
+    Returns a dict of the json description, times, points (DataFrame) and each variable, memory mapped
+    (times x heights x points), so only the parts used are read
+    """
+    with open(os.path.join(store_folder, "store.json")) as f:
+        store = json.load(f)
+    store["times"] = np.load(os.path.join(store_folder, "times.npy"), mmap_mode="r")
+    store["points"] = pd.read_csv(os.path.join(store_folder, "points.csv"), index_col="point")
+    for variable in store["variables"]:
+        store[variable] = np.load(os.path.join(store_folder, f"{variable}.npy"), mmap_mode="r")
+    return store
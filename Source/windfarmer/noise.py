@@ -0,0 +1,216 @@
+import numpy as np
+
+
+def get_noise_contribution_levels(noise_results, receptor_names=None, turbine_names=None):
+    """ Gather the noise level contributed by each turbine at each receptor into a dense matrix
+    The receptor results are swept once, collecting names and levels into flat lists, and the matrix is filled in one step.
+    Args:
+    noise_results: NoiseResults
+        Noise results of a scenario, e.g. wf.Workbook.CurrentScenario.Noise.Results after wf.Toolbox.CalculateNoise()
+    receptor_names: sequence of str, default: None
+        Receptors to read, in the order of the matrix rows. All receptors, in result order, if None.
+    turbine_names: sequence of str, default: None
+        Turbines to read, in the order of the matrix columns, e.g. to exclude neighbours.
+        All contributing turbines, in order of first appearance, if None.
+    Returns receptor names, turbine names and the matrix of levels in dB, receptors x turbines, NaN where there is no contribution.
+    """
+    receptor_index = None if receptor_names is None else {name: i for i, name in enumerate(receptor_names)}
+    turbine_index = {} if turbine_names is None else {name: i for i, name in enumerate(turbine_names)}
+    add_turbines = turbine_names is None
+    found_receptors = []
+    rows = []
+    columns = []
+    levels = []
+    for result in noise_results.ReceptorResults:
+        receptor_name = result.Name
+        if receptor_index is None:
+            row = len(found_receptors)
+            found_receptors.append(receptor_name)
+        elif receptor_name in receptor_index:
+            row = receptor_index[receptor_name]
+        else:
+            continue
+        for contribution in result.TurbineSourceContibutions:
+            column = turbine_index.get(contribution.Name)
+            if column is None:
+                if not add_turbines:
+                    continue  # e.g. neighbours
+                column = turbine_index[contribution.Name] = len(turbine_index)
+            rows.append(row)
+            columns.append(column)
+            levels.append(contribution.NoiseContribution)
+
+    receptor_names = found_receptors if receptor_names is None else list(receptor_names)
+    turbine_names = list(turbine_index) if turbine_names is None else list(turbine_names)
+    matrix = np.full((len(receptor_names), len(turbine_names)), np.nan)
+    matrix[np.asarray(rows, dtype=int), np.asarray(columns, dtype=int)] = np.asarray(levels, dtype=float)
+    return receptor_names, turbine_names, matrix
+
+
+def to_sound_pressure(levels_db):
+    """ Convert noise levels in dB to (relative) sound pressure, 10^(L/10), with NaN levels as no contribution (0)
+    """
+    return np.nan_to_num(np.power(10.0, 0.1 * np.asarray(levels_db, dtype=float)), nan=0.0)
+
+
+def to_noise_level(sound_pressure):
+    """ Convert summed (relative) sound pressure back to a noise level in dB, 10 log10(p), -inf where p is 0
+    """
+    with np.errstate(divide='ignore'):
+        return 10.0 * np.log10(np.asarray(sound_pressure, dtype=float))
+
+
+def store_mode_sound_pressure(noise_per_mode_from_turbine_for_receptors, sound_pressure, mode_idx, n_modes):
+    """ Store the receptors x turbines sound pressure matrix of one turbine mode in a flat mode x turbine x receptor array
+    The flat array is indexed by mode + n_modes * turbine + n_modes * n_turbines * receptor, as index3D in the noise
+    curtailment design example, so it is a C ordered (receptors, turbines, modes) array.
+    Args:
+    noise_per_mode_from_turbine_for_receptors: numpy array
+        Flat array of size n_modes * n_turbines * n_receptors, modified in place
+    sound_pressure: numpy array
+        Sound pressure from each turbine at each receptor, receptors x turbines
+    mode_idx: int
+        Index of the mode
+    n_modes: int
+        Number of modes
+    """
+    n_receptors, n_turbines = sound_pressure.shape
+    cube = noise_per_mode_from_turbine_for_receptors.reshape(n_receptors, n_turbines, n_modes)
+    cube[:, :, mode_idx] = sound_pressure
+
+
+# ISO 9613-1 atmospheric absorption, dB/km, at 10 C and 70 % relative humidity, of the octave bands 63 Hz to 8 kHz, as
+# in ISO 9613-2 table 2. The 500 Hz value is used for A-weighted overall sound power levels.
+OCTAVE_BAND_CENTRES_HZ = np.array([63, 125, 250, 500, 1000, 2000, 4000, 8000])
+ATMOSPHERIC_ABSORPTION_DB_PER_KM = np.array([0.1, 0.4, 1.0, 1.9, 3.7, 9.7, 32.8, 117.0])
+# typical receptor height for wind farm noise predictions, m
+DEFAULT_RECEPTOR_HEIGHT = 4.0
+
+
+def read_receptors(path, name_column="Name", crs=None):
+    """ Read receptor names and locations from a shapefile (or any file geopandas reads), e.g. Receptors.shp
+    Args:
+    path: str
+        Path of the file
+    name_column: str, default: "Name"
+        Column of the receptor names. Receptors are numbered if None or not in the file.
+    crs: str or pyproj CRS, default: None
+        Coordinate system to transform the receptors to, that of the turbines, e.g. "EPSG:32605". Left in the file's if None.
+    Returns receptor names, and x and y numpy arrays (the centroids of multipoint geometries)
+    """
+    import geopandas as gpd
+
+    frame = gpd.read_file(path)
+    if crs is not None and frame.crs is not None:
+        frame = frame.to_crs(crs)
+    if name_column is not None and name_column in frame.columns:
+        names = [str(name).strip() for name in frame[name_column]]
+    else:
+        names = [f"Receptor {i + 1}" for i in range(len(frame))]
+    centroids = frame.geometry.centroid
+    return names, centroids.x.to_numpy(), centroids.y.to_numpy()
+
+
+def get_propagation_attenuation(distance, source_height, receptor_height, absorption_db_per_km, ground_attenuation=False):
+    """ Simplified ISO 9613-2 attenuation, dB, of geometric divergence, atmospheric absorption and optionally ground
+    Adiv = 20 log10(d) + 11, Aatm = alpha d / 1000 and, if ground_attenuation, the A-weighted ground attenuation of
+    ISO 9613-2 equation 10, Agr = 4.8 - (2 hm / d) (17 + 300 / d), at least 0. Barriers and other effects are left out.
+    Args:
+    distance: numpy array
+        Slant distances from sources to receptors, m, any shape
+    source_height, receptor_height: numpy arrays
+        Heights above ground, m, broadcast to the shape of distance
+    absorption_db_per_km: float or numpy array
+        Atmospheric absorption, of one band, or of bands along a new last axis
+    ground_attenuation: bool, default: False
+        If True, Agr is included
+    Returns the attenuation, dB, of the shape of distance, with a last axis of bands if absorption_db_per_km is an array
+    """
+    distance = np.maximum(distance, 1.0)
+    attenuation = 20.0 * np.log10(distance) + 11.0
+    if ground_attenuation:
+        mean_height = 0.5 * (source_height + receptor_height)
+        attenuation = attenuation + np.maximum(4.8 - (2.0 * mean_height / distance) * (17.0 + 300.0 / distance), 0.0)
+    absorption = np.asarray(absorption_db_per_km, dtype=float)
+    if absorption.ndim == 0:
+        return attenuation + absorption * distance / 1000.0
+    return attenuation[..., None] + absorption * distance[..., None] / 1000.0
+
+
+def estimate_noise_levels(receptor_x, receptor_y, turbine_x, turbine_y, sound_power_levels, hub_heights,
+                          receptor_heights=DEFAULT_RECEPTOR_HEIGHT, receptor_elevations=0.0, turbine_elevations=0.0,
+                          ground_attenuation=False, octave_bands=False, absorption_db_per_km=None):
+    """ Noise level from each turbine at each receptor in each mode, dB, by simplified ISO 9613-2 propagation
+    A pre-screen of noise calculations, e.g. of many layout variants, to verify the finalists with wf.Toolbox.CalculateNoise().
+    Turbine positions can have leading dimensions of layout variants, all computed at once.
+    Args:
+    receptor_x, receptor_y: array like
+        Receptor locations, m, one value per receptor
+    turbine_x, turbine_y: array like
+        Turbine locations, m, (..., turbines), e.g. variants x turbines
+    sound_power_levels: array like
+        Sound power levels, dB(A), turbines x modes, or modes for all turbines, with a last axis of bands if octave_bands
+    hub_heights: float or array like
+        Source heights above ground, m, one value or one per turbine
+    receptor_heights: float or array like, default: 4.0
+        Receptor heights above ground, m
+    receptor_elevations, turbine_elevations: float or array like, default: 0.0
+        Ground elevations, m, for the slant distance
+    ground_attenuation: bool, default: False
+        If True, the A-weighted ground attenuation of ISO 9613-2 equation 10 is included
+    octave_bands: bool, default: False
+        If True, sound power levels have a last axis of the A-weighted levels of the 8 octave bands 63 Hz to 8 kHz,
+        each attenuated with its own absorption, and the bands are summed
+    absorption_db_per_km: float or array like, default: None
+        Atmospheric absorption, of overall levels or of each band. ISO 9613-2 at 10 C and 70 % humidity if None.
+    Returns levels, dB(A), (..., receptors, turbines, modes)
+    """
+    receptor_x = np.asarray(receptor_x, dtype=float)
+    receptor_y = np.asarray(receptor_y, dtype=float)
+    turbine_x = np.asarray(turbine_x, dtype=float)
+    turbine_y = np.asarray(turbine_y, dtype=float)
+    source_z = np.broadcast_to(np.asarray(turbine_elevations, dtype=float) + np.asarray(hub_heights, dtype=float), turbine_x.shape)
+    receptor_z = np.broadcast_to(np.asarray(receptor_elevations, dtype=float) + np.asarray(receptor_heights, dtype=float), receptor_x.shape)
+    # (..., receptors, turbines)
+    dx = turbine_x[..., None, :] - receptor_x[:, None]
+    dy = turbine_y[..., None, :] - receptor_y[:, None]
+    dz = source_z[..., None, :] - receptor_z[:, None]
+    distance = np.sqrt(dx * dx + dy * dy + dz * dz)
+
+    if absorption_db_per_km is None:
+        absorption_db_per_km = ATMOSPHERIC_ABSORPTION_DB_PER_KM if octave_bands else ATMOSPHERIC_ABSORPTION_DB_PER_KM[3]
+    source_height = np.broadcast_to(np.asarray(hub_heights, dtype=float), turbine_x.shape)[..., None, :]
+    receptor_height = np.broadcast_to(np.asarray(receptor_heights, dtype=float), receptor_x.shape)[:, None]
+    attenuation = get_propagation_attenuation(distance, source_height, receptor_height, absorption_db_per_km, ground_attenuation)
+
+    sound_power_levels = np.asarray(sound_power_levels, dtype=float)
+    if octave_bands:
+        # turbines x modes x bands, with (..., receptors, turbines, 1, bands) of attenuation, summed over bands
+        power = sound_power_levels if sound_power_levels.ndim == 3 else sound_power_levels[None, :, :]
+        return to_noise_level(to_sound_pressure(power - attenuation[..., None, :]).sum(axis=-1))
+    power = sound_power_levels if sound_power_levels.ndim == 2 else sound_power_levels[None, :]
+    return power - attenuation[..., None]
+
+
+def estimate_noise_per_mode_from_turbine_for_receptors(*args, **kwargs):
+    """ The flat sound pressure array of the noise curtailment design example, from estimate_noise_levels
+    Takes the arguments of estimate_noise_levels for one layout. The array is indexed by
+    mode + n_modes * turbine + n_modes * n_turbines * receptor, as index3D, as filled in by store_mode_sound_pressure.
+    """
+    return to_sound_pressure(estimate_noise_levels(*args, **kwargs)).ravel()
+
+
+def get_receptor_noise_levels(noise_levels, mode_indices):
+    """ Total noise level at each receptor of a mode for each turbine, e.g. to screen layout variants against a limit
+    Args:
+    noise_levels: numpy array
+        Levels, dB, (..., receptors, turbines, modes), as from estimate_noise_levels
+    mode_indices: int or array like
+        Mode index of each turbine, one for all turbines, or (..., turbines)
+    Returns total levels, dB, (..., receptors)
+    """
+    n_turbines = noise_levels.shape[-2]
+    mode_indices = np.broadcast_to(np.asarray(mode_indices, dtype=np.int64), noise_levels.shape[:-3] + (n_turbines,))
+    index = np.broadcast_to(mode_indices[..., None, :, None], noise_levels.shape[:-1] + (1,))
+    levels = np.take_along_axis(noise_levels, index, axis=-1)[..., 0]
+    return to_noise_level(to_sound_pressure(levels).sum(axis=-1))
@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+from windfarmer.time_series import DEFAULT_MISSING_VALUES
+
+
+def read_wind_series(path, speed_column, direction_column=None, time_column="Date/Time", delimiter="\t",
+                     missing_values=DEFAULT_MISSING_VALUES, dayfirst=True):
+    """ Read the wind speed, and optionally direction, columns of a time series file, e.g. a WindFarmer time series .txt
+    Args:
+    path: str
+        Path of a delimited time series file with a header row
+    speed_column, direction_column: str
+        Wind speed (m/s) and direction (degrees) columns. No directions if direction_column is None.
+    time_column: str, default: "Date/Time"
+        Time stamp column, or None to not read the times
+    delimiter: str, default: tab
+        Column delimiter
+    missing_values: list of str, default: DEFAULT_MISSING_VALUES
+        Values taken as missing, NaN
+    dayfirst: bool, default: True
+        If True, time stamps are day/month/year
+    Returns (times, or None, wind speeds, wind directions, or None), numpy arrays
+    """
+    columns = [c for c in [time_column, speed_column, direction_column] if c is not None]
+    frame = pd.read_csv(path, sep=delimiter, usecols=columns, na_values=missing_values, keep_default_na=True,
+                        low_memory=False)
+    times = None if time_column is None else pd.to_datetime(frame[time_column], dayfirst=dayfirst).to_numpy()
+    speeds = pd.to_numeric(frame[speed_column], errors="coerce").to_numpy(dtype=float)
+    directions = None if direction_column is None else pd.to_numeric(frame[direction_column], errors="coerce").to_numpy(dtype=float)
+    return times, speeds, directions
+
+
+def get_turbines(input_json, include_neighbours=False):
+    """ The (wind farm, turbine) pairs of an AEP input, subject farms only unless include_neighbours
+    """
+    return [(farm, turbine) for farm in input_json["windFarms"] if include_neighbours or not farm.get("isNeighbor", False)
+            for turbine in farm["turbines"]]
+
+
+def get_air_density(input_json, heights_above_sea_level):
+    """ Air density, kg/m3, at heights above sea level, from the referenceAirDensity of an AEP input and its lapse rate
+    """
+    reference = input_json["referenceAirDensity"]
+    heights = np.asarray(heights_above_sea_level, dtype=float)
+    return reference["airDensity_kg_per_m3"] + reference["lapseRate_kg_per_m3_per_m"] * (heights - reference["elevation_m"])
+
+
+def _get_power_curves(turbine_model, operational_mode):
+    """ (air density, wind speeds, power outputs, high wind speed cut-out) of each performance data of an operational mode of
+    a turbine model. The cut-out is the last wind speed of the curve if not given.
+    """
+    curves = []
+    for performance_data in turbine_model["performanceData"]:
+        if performance_data.get("turbineOperationalMode", operational_mode) != operational_mode:
+            continue
+        points = sorted(performance_data["performanceDataPoints"], key=lambda p: p["windSpeed_m_per_s"])
+        curves.append((float(performance_data["airDensity_kg_per_m3"]),
+                       np.array([p["windSpeed_m_per_s"] for p in points], dtype=float),
+                       np.array([p["powerOutput_W"] for p in points], dtype=float),
+                       float(performance_data.get("highSpeedCutOut_m_per_s") or points[-1]["windSpeed_m_per_s"])))
+    if not curves:
+        raise ValueError(f"Turbine model {turbine_model['id']} has no performance data for operational mode {operational_mode}")
+    return curves
+
+
+class PowerTimeSeriesModel:
+    def __init__(self, input_json, operational_mode="normal", include_neighbours=False):
+        """ Power time series of the turbines of an AEP input, from a wind speed (and direction) time series at the mast
+        of its wind climate.
+        Each turbine sees the mast wind speed times its flowModel speed-up, interpolated over the reference directions (or
+        averaged over them without directions). The power curve of the performance data of its turbine model nearest the
+        air density at its hub, from referenceAirDensity, is used with the wind speed scaled by
+        (hub air density / curve air density) ^ (1/3), as for pitch regulated turbines in IEC 61400-12-1. Power is held at the
+        last point of the curve up to the highSpeedCutOut_m_per_s of the performance data, which applies to the hub wind speed.
+        Args:
+        input_json: dict
+            WindFarmer API AEP input
+        operational_mode: str, default: "normal"
+            turbineOperationalMode of the performance data to use
+        include_neighbours: bool, default: False
+            If True, neighbouring wind farm turbines are included
+        """
+        turbines = get_turbines(input_json, include_neighbours)
+        models = {m["id"]: m for m in input_json["turbineModels"]}
+        self.turbine_names = [f'{farm["name"]} {turbine["name"]}' for farm, turbine in turbines]
+        hub_heights = np.array([models[t["turbineModelId"]]["hubHeight_m"] for _, t in turbines], dtype=float)
+        terrain_heights = np.array([t["location"].get("terrainHeightAboveSeaLevel_m", 0.0) for _, t in turbines], dtype=float)
+        self.air_densities = get_air_density(input_json, terrain_heights + hub_heights)
+
+        # one power curve per turbine model and performance data, and the turbines using each
+        self._curves = []
+        curve_index = {}
+        self._curve_of_turbine = np.empty(len(turbines), dtype=np.int64)
+        self._density_factors = np.empty(len(turbines))
+        curves_of_model = {}
+        for i, (_, turbine) in enumerate(turbines):
+            model_id = turbine["turbineModelId"]
+            if model_id not in curves_of_model:
+                curves_of_model[model_id] = _get_power_curves(models[model_id], operational_mode)
+            curves = curves_of_model[model_id]
+            nearest = int(np.argmin([abs(density - self.air_densities[i]) for density, _, _, _ in curves]))
+            key = (model_id, nearest)
+            if key not in curve_index:
+                curve_index[key] = len(self._curves)
+                self._curves.append(curves[nearest][1:])
+            self._curve_of_turbine[i] = curve_index[key]
+            self._density_factors[i] = (self.air_densities[i] / curves[nearest][0]) ** (1.0 / 3.0)
+
+        self._reference_directions, self._speed_ups = self._get_speed_ups(input_json, turbines)
+
+    @staticmethod
+    def _get_speed_ups(input_json, turbines):
+        """ Reference directions, and the speed-ups of each turbine at them (turbines x directions), ones without a flow model
+        Speed-ups are found by id "<wind farm> <turbine>", or else at the nearest location.
+        """
+        flow_model = input_json.get("flowModel")
+        if not flow_model or not flow_model.get("speedsUps"):
+            return np.zeros(1), np.ones((len(turbines), 1))
+        directions = np.asarray(flow_model["referenceDirections_degrees"], dtype=float)
+        rows = flow_model["speedsUps"]
+        by_id = {row["id"]: row for row in rows}
+        locations = np.array([(row["easting_m"], row["northing_m"]) for row in rows], dtype=float)
+        speed_ups = np.empty((len(turbines), len(directions)))
+        for i, (farm, turbine) in enumerate(turbines):
+            row = by_id.get(f'{farm["name"]} {turbine["name"]}')
+            if row is None:
+                distance = np.hypot(locations[:, 0] - turbine["location"]["easting_m"], locations[:, 1] - turbine["location"]["northing_m"])
+                row = rows[int(np.argmin(distance))]
+            speed_ups[i] = row["speedUps"]
+        return directions, speed_ups
+
+    def _get_speed_up_factors(self, wind_directions):
+        """ Speed-ups of each turbine at each direction, times x turbines, linear between the reference directions """
+        if wind_directions is None or self._speed_ups.shape[1] == 1:
+            return self._speed_ups.mean(axis=1)[None, :]
+        directions = self._reference_directions
+        order = np.argsort(directions % 360.0)
+        periodic = np.concatenate([directions[order] % 360.0, [directions[order][0] % 360.0 + 360.0]])
+        speed_ups = np.concatenate([self._speed_ups[:, order], self._speed_ups[:, order[:1]]], axis=1)
+        wind_directions = np.asarray(wind_directions, dtype=float) % 360.0
+        wind_directions = np.where(wind_directions < periodic[0], wind_directions + 360.0, wind_directions)
+        position = np.interp(wind_directions, periodic, np.arange(len(periodic)))
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, len(periodic) - 1)
+        weight = (position - lower)[:, None]
+        return speed_ups[:, lower].T * (1.0 - weight) + speed_ups[:, upper].T * weight
+
+    def get_power(self, wind_speeds, wind_directions=None, chunk_size=20_000, dtype=np.float32, out=None):
+        """ Power of each turbine at each time, W, processed chunk_size times at a time
+        Args:
+        wind_speeds: array like
+            Wind speeds at the mast, m/s. NaN (missing) gives NaN power.
+        wind_directions: array like, default: None
+            Wind directions, degrees. Speed-ups are averaged over directions if None.
+        chunk_size: int, default: 20000
+            Number of times processed at a time, bounding the memory of intermediate arrays
+        dtype: numpy dtype, default: np.float32
+            Type of the power array
+        out: numpy array, default: None
+            Array of times x turbines to write into, e.g. a numpy memmap for very long series
+        Returns the array of power, times x turbines, in the order of turbine_names
+        """
+        wind_speeds = np.asarray(wind_speeds, dtype=float)
+        if out is None:
+            out = np.empty((len(wind_speeds), len(self.turbine_names)), dtype=dtype)
+        turbines_of_curve = [np.flatnonzero(self._curve_of_turbine == c) for c in range(len(self._curves))]
+        for start in range(0, len(wind_speeds), chunk_size):
+            stop = min(start + chunk_size, len(wind_speeds))
+            directions = None if wind_directions is None else np.asarray(wind_directions[start:stop], dtype=float)
+            # hub wind speed at each turbine, times x turbines, and the equivalent wind speed of its power curve
+            hub_speeds = wind_speeds[start:stop, None] * self._get_speed_up_factors(directions)
+            speeds = hub_speeds * self._density_factors[None, :]
+            for (curve_speeds, curve_power, cut_out), columns in zip(self._curves, turbines_of_curve):
+                # one np.interp over all times and turbines of a power curve
+                chunk_speeds = speeds[:, columns]
+                power = np.interp(chunk_speeds.ravel(), curve_speeds, curve_power, left=0.0, right=curve_power[-1])
+                power = np.where(hub_speeds[:, columns].ravel() > cut_out, 0.0, power)
+                power = np.where(np.isnan(chunk_speeds.ravel()), np.nan, power)
+                out[start:stop, columns] = power.reshape(chunk_speeds.shape)
+        return out
+
+
+def to_hourly(times, power, chunk_size=20_000, out=None):
+    """ Mean power of each hour, of a time series finer than hourly, e.g. 10 minute
+    The times are sorted, so each hour is a run of consecutive rows, summed with one np.add.reduceat per chunk of about
+    chunk_size times. Only a chunk is copied at a time, so power can be a numpy memmap, e.g. the out of get_power.
+    Args:
+    times: array like of numpy datetime64
+        Times of the power, in order
+    power: numpy array
+        Power, times x turbines
+    chunk_size: int, default: 20000
+        Number of times processed at a time, bounding the memory of intermediate arrays
+    out: numpy array, default: None
+        Array of hours x turbines to write the mean power into, float64 if None
+    Returns (hours, mean power of each hour, hours x turbines), ignoring missing (NaN) power
+    """
+    hours = np.asarray(times, dtype="datetime64[h]")
+    if len(hours) == 0:
+        return hours, np.empty((0, power.shape[1])) if out is None else out[:0]
+    if np.any(hours[1:] < hours[:-1]):
+        raise ValueError("The times aren't in order")
+    # first row of each hour
+    starts = np.flatnonzero(np.concatenate([[True], hours[1:] != hours[:-1]]))
+    if out is None:
+        out = np.empty((len(starts), power.shape[1]))
+    bounds = np.append(starts, len(hours))
+    first = 0
+    while first < len(starts):
+        # whole hours of about chunk_size times, at least one
+        last = max(first + 1, int(np.searchsorted(starts, starts[first] + chunk_size)))
+        chunk = np.asarray(power[bounds[first]:bounds[last]], dtype=float)
+        valid = ~np.isnan(chunk)
+        offsets = starts[first:last] - bounds[first]
+        sums = np.add.reduceat(np.where(valid, chunk, 0.0), offsets, axis=0)
+        counts = np.add.reduceat(valid, offsets, axis=0, dtype=np.int64)
+        with np.errstate(invalid="ignore"):
+            out[first:last] = sums / counts
+        first = last
+    return hours[starts], out
@@ -0,0 +1,226 @@
+import struct
+import numpy as np
+
+# TIFF tags and GeoTIFF keys read to memory map uncompressed GeoTIFFs
+TIFF_TYPES = {1: "B", 2: "s", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i", 11: "f", 12: "d", 16: "Q"}
+SAMPLE_FORMATS = {(1, 8): "u1", (1, 16): "u2", (1, 32): "u4", (2, 8): "i1", (2, 16): "i2", (2, 32): "i4",
+                  (3, 32): "f4", (3, 64): "f8"}
+RASTER_PIXEL_IS_POINT = 2
+
+
+def _read_tiff_tags(path):
+    """ Byte order and the tags of the first image of a classic TIFF file, or None for other files, e.g. BigTIFF """
+    with open(path, "rb") as f:
+        header = f.read(8)
+        if header[:4] not in (b"II*\x00", b"MM\x00*"):
+            return None
+        order = "<" if header[:2] == b"II" else ">"
+        f.seek(struct.unpack(order + "I", header[4:8])[0])
+        number_of_tags = struct.unpack(order + "H", f.read(2))[0]
+        entries = f.read(12 * number_of_tags)
+        tags = {}
+        for i in range(number_of_tags):
+            tag, tag_type, count = struct.unpack(order + "HHI", entries[12 * i:12 * i + 8])
+            if tag_type not in TIFF_TYPES:
+                continue
+            code = TIFF_TYPES[tag_type]
+            size = struct.calcsize(code) * count
+            if size <= 4:
+                data = entries[12 * i + 8:12 * i + 8 + size]
+            else:
+                f.seek(struct.unpack(order + "I", entries[12 * i + 8:12 * i + 12])[0])
+                data = f.read(size)
+            tags[tag] = data.rstrip(b"\x00").decode("latin-1") if code == "s" else struct.unpack(order + code * count, data)
+    return order, tags
+
+
+def _get_memory_map_layout(path):
+    """ Offset, shape, dtype, transform and nodata of a single band GeoTIFF stored uncompressed in consecutive strips,
+    which can be memory mapped as one array, or None
+    """
+    read = _read_tiff_tags(path)
+    if read is None:
+        return None
+    order, tags = read
+    width, height = tags[256][0], tags[257][0]
+    bits = tags.get(258, (1,))
+    sample_format = tags.get(339, (1,))[0]
+    if tags.get(259, (1,))[0] != 1 or tags.get(277, (1,))[0] != 1 or len(bits) != 1 or 322 in tags \
+            or (sample_format, bits[0]) not in SAMPLE_FORMATS or 33550 not in tags or 33922 not in tags:
+        return None  # compressed, several bands, tiled or not georeferenced by scale and tie point
+    dtype = np.dtype(order + SAMPLE_FORMATS[(sample_format, bits[0])])
+    offsets, counts = np.array(tags[273]), np.array(tags[279])
+    if counts.sum() != width * height * dtype.itemsize or np.any(offsets[1:] != offsets[:-1] + counts[:-1]):
+        return None
+
+    scale_x, scale_y = tags[33550][:2]
+    tie_i, tie_j, _, tie_x, tie_y = tags[33922][:5]
+    keys = tags.get(34735, ())
+    pixel_is_point = any(keys[k] == 1025 and keys[k + 3] == RASTER_PIXEL_IS_POINT for k in range(4, len(keys) - 3, 4))
+    # transform of the top left corner of the top left pixel, as (x0, cell width, y0, -cell height)
+    shift = 0.5 if pixel_is_point else 0.0
+    transform = (tie_x - (tie_i + shift) * scale_x, scale_x, tie_y + (tie_j + shift) * scale_y, -scale_y)
+    nodata = float(tags[42113]) if 42113 in tags else None
+    return int(offsets[0]), (height, width), dtype, transform, nodata
+
+
+class Raster:
+    def __init__(self, path, band=1, max_cached_blocks=256):
+        """ A raster, e.g. a forestry canopy height or elevation GeoTIFF, to sample at many points while reading only the
+        pixels needed
+        Uncompressed single band GeoTIFFs in consecutive strips are memory mapped, so sampling only pages in the rows
+        touched. Other rasters are opened with rasterio and read a block (tile or strip) at a time, caching the blocks
+        read, so e.g. a cloud optimised GeoTIFF is only read around the points.
+        Args:
+        path: str
+            Path of the raster
+        band: int, default: 1
+            Band to sample, from 1
+        max_cached_blocks: int, default: 256
+            Number of rasterio blocks kept in memory, between calls of sample
+        """
+        self.path = path
+        self.band = band
+        self.max_cached_blocks = max_cached_blocks
+        self._dataset = None
+        self._array = None
+        self._blocks = {}
+        layout = _get_memory_map_layout(path) if band == 1 else None
+        if layout is not None:
+            offset, shape, dtype, self.transform, self.nodata = layout
+            self._array = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+            self.height, self.width = shape
+        else:
+            import rasterio
+
+            self._dataset = rasterio.open(path)
+            t = self._dataset.transform
+            if t.b != 0.0 or t.d != 0.0:
+                raise ValueError(f"{path}: rotated rasters aren't supported")
+            self.transform = (t.c, t.a, t.f, t.e)
+            self.nodata = self._dataset.nodatavals[band - 1]
+            self.height, self.width = self._dataset.height, self._dataset.width
+            self._block_height, self._block_width = self._dataset.block_shapes[band - 1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+        self._array = None
+        self._blocks = {}
+
+    @property
+    def bounds(self):
+        """ (xmin, ymin, xmax, ymax) of the raster """
+        x0, dx, y0, dy = self.transform
+        xs = (x0, x0 + dx * self.width)
+        ys = (y0, y0 + dy * self.height)
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def get_pixel_coordinates(self, x, y):
+        """ Fractional (row, column) of points, pixel centres at whole numbers """
+        x0, dx, y0, dy = self.transform
+        return (np.asarray(y, dtype=float) - y0) / dy - 0.5, (np.asarray(x, dtype=float) - x0) / dx - 0.5
+
+    def _read_block(self, block_row, block_column):
+        """ A block of the rasterio dataset, from the cache if read before """
+        key = (block_row, block_column)
+        block = self._blocks.get(key)
+        if block is None:
+            from rasterio.windows import Window
+
+            row_off, col_off = block_row * self._block_height, block_column * self._block_width
+            window = Window(col_off, row_off, min(self._block_width, self.width - col_off),
+                            min(self._block_height, self.height - row_off))
+            block = self._dataset.read(self.band, window=window)
+            if len(self._blocks) >= self.max_cached_blocks:
+                self._blocks.pop(next(iter(self._blocks)))  # oldest first
+            self._blocks[key] = block
+        return block
+
+    def _read_pixels(self, rows, columns):
+        """ Values of pixels at whole (row, column) inside the raster, as float with nodata as NaN """
+        if self._array is not None:
+            values = self._array[rows, columns].astype(float)
+        else:
+            values = np.empty(len(rows))
+            block_rows, block_columns = rows // self._block_height, columns // self._block_width
+            block_index = block_rows * ((self.width + self._block_width - 1) // self._block_width) + block_columns
+            order = np.argsort(block_index, kind="stable")
+            starts = np.flatnonzero(np.diff(block_index[order], prepend=-1))
+            for start, stop in zip(starts, np.append(starts[1:], len(order))):
+                points = order[start:stop]
+                block = self._read_block(block_rows[points[0]], block_columns[points[0]])
+                values[points] = block[rows[points] % self._block_height, columns[points] % self._block_width]
+        if self.nodata is not None:
+            values[values == self.nodata] = np.nan
+        return values
+
+    def sample(self, x, y, method="nearest"):
+        """ Values of the raster at points, NaN outside it or at nodata
+        Args:
+        x, y: array like
+            Coordinates of the points, in the coordinate system of the raster, any shape, e.g. layouts x turbines
+        method: str, default: "nearest"
+            "nearest" pixel, or "bilinear" between the four nearest pixel centres (NaN if a pixel with any weight is nodata)
+        Returns a numpy array of the shape of x
+        Nodata is returned as NaN, not 0. In the forestry canopy height grids nodata means no canopy, so callers wanting a
+        height of 0 there need to replace NaN themselves, e.g. np.nan_to_num(values).
+        """
+        x = np.asarray(x, dtype=float)
+        rows, columns = self.get_pixel_coordinates(x.ravel(), np.asarray(y, dtype=float).ravel())
+        values = np.full(rows.shape, np.nan)
+        if method == "nearest":
+            rows, columns = np.floor(rows + 0.5), np.floor(columns + 0.5)
+            inside = (rows >= 0) & (rows < self.height) & (columns >= 0) & (columns < self.width)
+            values[inside] = self._read_pixels(rows[inside].astype(np.int64), columns[inside].astype(np.int64))
+        elif method == "bilinear":
+            # points within half a pixel of the edge take the edge pixels
+            inside = (rows >= -0.5) & (rows <= self.height - 0.5) & (columns >= -0.5) & (columns <= self.width - 0.5)
+            rows = np.clip(rows[inside], 0.0, self.height - 1.0)
+            columns = np.clip(columns[inside], 0.0, self.width - 1.0)
+            # snap points a rounding error from a pixel centre onto it, so the neighbours get no weight
+            rows = np.where(np.abs(rows - np.rint(rows)) < 1e-6, np.rint(rows), rows)
+            columns = np.where(np.abs(columns - np.rint(columns)) < 1e-6, np.rint(columns), columns)
+            row0 = np.minimum(np.floor(rows).astype(np.int64), max(self.height - 2, 0))
+            column0 = np.minimum(np.floor(columns).astype(np.int64), max(self.width - 2, 0))
+            row1 = np.minimum(row0 + 1, self.height - 1)
+            column1 = np.minimum(column0 + 1, self.width - 1)
+            wr = rows - row0
+            wc = columns - column0
+            corners = self._read_pixels(np.concatenate([row0, row0, row1, row1]),
+                                        np.concatenate([column0, column1, column0, column1])).reshape(4, -1)
+            weights = np.stack([(1 - wr) * (1 - wc), (1 - wr) * wc, wr * (1 - wc), wr * wc])
+            # corners with no weight, e.g. the neighbours of a point exactly at a pixel centre, don't make it NaN
+            used = weights > 0
+            interpolated = np.where(used, corners, 0.0) * weights
+            values[inside] = np.where((used & np.isnan(corners)).any(axis=0), np.nan, interpolated.sum(axis=0))
+        else:
+            raise ValueError(f"Unknown method {method}, use nearest or bilinear")
+        return values.reshape(x.shape)
+
+
+def sample_rasters(paths, x, y, method="nearest"):
+    """ Sample several rasters of the same area at the same points, e.g. the canopy heights of each forestry year
+    Args:
+    paths: dict or list of str
+        Raster paths, by name, e.g. {0: "ForestryYear0.tif", 2: "ForestryYear2.tif", 5: "ForestryYear5.tif"}
+    x, y: array like
+        Coordinates of the points, any shape, e.g. layouts x turbines
+    method: str, default: "nearest"
+        "nearest" or "bilinear", as for Raster.sample
+    Returns the sampled values, rasters x the shape of x, in the order of paths, NaN at nodata, e.g. no forestry canopy
+    """
+    paths = list(paths.values()) if isinstance(paths, dict) else list(paths)
+    x = np.asarray(x, dtype=float)
+    values = np.empty((len(paths),) + x.shape)
+    for i, path in enumerate(paths):
+        with Raster(path) as raster:
+            values[i] = raster.sample(x, y, method)
+    return values
@@ -0,0 +1,333 @@
+import math
+import numpy as np
+
+# WAsP resource grid (.wrg) and resource file (.rsf) records: a 10 character name, then x, y, elevation, height, all sector
+# Weibull A and k, power density and number of sectors, then per sector the frequency (0.1 %), A (0.1 m/s) and k (0.01).
+# The records are nominally fixed width, but the columns shift between producers (e.g. a character in the New European
+# Wind Atlas demo grids), so the sector columns are read at fixed widths from the end of each record, and the leading
+# numbers are split on whitespace, falling back to the nominal columns where they run into each other.
+NAME_WIDTH = 10
+RECORD_COLUMNS = ["x", "y", "z", "height", "weibull_a", "weibull_k", "power_density", "number_of_sectors"]
+# nominal column widths, for records whose numbers run into each other
+RECORD_WIDTHS = [10, 10, 8, 5, 5, 6, 15, 3]
+SECTOR_WIDTHS = [4, 4, 5]
+SECTOR_SCALES = {"sector_frequency": 1000.0, "sector_a": 10.0, "sector_k": 100.0}
+
+
+class ResourceGrid:
+    def __init__(self, names, x, y, z, height, weibull_a, weibull_k, power_density,
+                 sector_frequency, sector_a, sector_k, grid_header=None):
+        """ Weibull wind resource at a set of points, e.g. read from a WAsP .wrg or .rsf file with read_wrg or read_rsf
+        Args:
+        names, x, y, z, height, weibull_a, weibull_k, power_density: numpy arrays
+            Point names, coordinates and elevation in m, height above ground in m, all sector Weibull A in m/s and k,
+            and power density in W/m2, one value per point
+        sector_frequency, sector_a, sector_k: numpy arrays
+            Sector frequency (fraction), Weibull A in m/s and k, points x sectors
+        grid_header: tuple, default: None
+            (nx, ny, xmin, ymin, cell size) of a .wrg grid. Lattice of an .rsf is detected from the points if None.
+        """
+        self.names = names
+        self.x = x
+        self.y = y
+        self.z = z
+        self.height = height
+        self.weibull_a = weibull_a
+        self.weibull_k = weibull_k
+        self.power_density = power_density
+        self.sector_frequency = sector_frequency
+        self.sector_a = sector_a
+        self.sector_k = sector_k
+        self.grid_header = grid_header
+        self._lattice = None
+        self._tree = None
+
+    @property
+    def number_of_points(self):
+        return len(self.x)
+
+    @property
+    def number_of_sectors(self):
+        return self.sector_frequency.shape[1]
+
+    def _get_lattice(self):
+        """ Spatial index of points on a regular lattice: (xmin, ymin, cell size, ny x nx array of point index, -1 if missing)
+        None if the points aren't on a regular lattice, e.g. an .rsf of turbine positions.
+        """
+        if self._lattice is not None:
+            return self._lattice or None
+        if self.grid_header is not None:
+            nx, ny, xmin, ymin, cell_size = self.grid_header
+        else:
+            xs = np.unique(self.x)
+            ys = np.unique(self.y)
+            steps = np.concatenate([np.diff(xs), np.diff(ys)])
+            cell_size = steps.min() if len(steps) else 0.0
+            nx = len(xs)
+            ny = len(ys)
+            xmin = xs[0]
+            ymin = ys[0]
+            if cell_size <= 0 or nx * ny > 4 * self.number_of_points:
+                self._lattice = False
+                return None
+        ix = (self.x - xmin) / cell_size
+        iy = (self.y - ymin) / cell_size
+        on_lattice = np.allclose(ix, np.rint(ix), atol=1e-3) and np.allclose(iy, np.rint(iy), atol=1e-3)
+        ix = np.rint(ix).astype(np.int64)
+        iy = np.rint(iy).astype(np.int64)
+        if not on_lattice or ix.min() < 0 or iy.min() < 0 or ix.max() >= nx or iy.max() >= ny:
+            self._lattice = False
+            return None
+        index = np.full((int(ny), int(nx)), -1, dtype=np.int64)
+        index[iy, ix] = np.arange(self.number_of_points)
+        self._lattice = (float(xmin), float(ymin), float(cell_size), index)
+        return self._lattice
+
+    def _get_nearest_scattered(self, x, y, chunk_elements=20_000_000):
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            cKDTree = None
+        if cKDTree is not None:
+            if self._tree is None:
+                self._tree = cKDTree(np.column_stack([self.x, self.y]))
+            return self._tree.query(np.column_stack([x, y]))[1]
+        # no scipy: brute force, in chunks of query points to bound the distance matrix size
+        nearest = np.empty(len(x), dtype=np.int64)
+        chunk = max(1, chunk_elements // self.number_of_points)
+        for start in range(0, len(x), chunk):
+            dx = x[start:start + chunk, None] - self.x[None, :]
+            dy = y[start:start + chunk, None] - self.y[None, :]
+            nearest[start:start + chunk] = np.argmin(dx * dx + dy * dy, axis=1)
+        return nearest
+
+    def get_nearest_index(self, x, y):
+        """ Index of the nearest point to each position, -1 more than half a cell outside a lattice grid
+        A grid of one row or column, e.g. the single point .wrg of a mast, is a degenerate lattice, so along that axis every
+        position takes its one point, however far away.
+        Args:
+        x, y: array like
+            Positions, e.g. turbine eastings and northings, in the coordinate system of the grid
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        lattice = self._get_lattice()
+        if lattice is None:
+            return self._get_nearest_scattered(x, y)
+        xmin, ymin, cell_size, index = lattice
+        ny, nx = index.shape
+        ix = np.zeros(x.shape, dtype=np.int64) if nx == 1 else np.rint((x - xmin) / cell_size).astype(np.int64)
+        iy = np.zeros(y.shape, dtype=np.int64) if ny == 1 else np.rint((y - ymin) / cell_size).astype(np.int64)
+        inside = (ix >= 0) & (iy >= 0) & (ix < index.shape[1]) & (iy < index.shape[0])
+        nearest = np.full(len(x), -1, dtype=np.int64)
+        nearest[inside] = index[iy[inside], ix[inside]]
+        return nearest
+
+    def lookup(self, x, y, method="nearest"):
+        """ Resource at many positions at once, e.g. thousands of turbine locations of candidate layouts
+        Args:
+        x, y: array like
+            Positions, in the coordinate system of the grid
+        method: str, default: "nearest"
+            "nearest" point, or "bilinear" interpolation between the 4 surrounding grid points (lattice grids of at least
+            2 x 2 points only)
+        Returns a dict of numpy arrays: z, weibull_a, weibull_k, power_density (one value per position) and sector_frequency,
+        sector_a, sector_k (positions x sectors). NaN for positions outside the grid, or with a missing surrounding grid point.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if method == "nearest":
+            indices = self.get_nearest_index(x, y)[:, None]
+            weights = np.ones(indices.shape)
+        elif method == "bilinear":
+            lattice = self._get_lattice()
+            if lattice is None:
+                raise ValueError("Bilinear lookup needs points on a regular grid")
+            xmin, ymin, cell_size, index = lattice
+            if min(index.shape) < 2:
+                raise ValueError(f"Bilinear lookup needs a grid of at least 2 x 2 points, not {index.shape[1]} x {index.shape[0]}, "
+                                 "use the nearest point")
+            fx = (x - xmin) / cell_size
+            fy = (y - ymin) / cell_size
+            # positions exactly on the last row or column use the cell before it, positions past it are outside
+            ix = np.where(fx == index.shape[1] - 1, index.shape[1] - 2, np.floor(fx)).astype(np.int64)
+            iy = np.where(fy == index.shape[0] - 1, index.shape[0] - 2, np.floor(fy)).astype(np.int64)
+            wx = fx - ix
+            wy = fy - iy
+            inside = (ix >= 0) & (iy >= 0) & (ix + 1 < index.shape[1]) & (iy + 1 < index.shape[0])
+            indices = np.full((len(x), 4), -1, dtype=np.int64)
+            indices[inside] = index[iy[inside, None] + np.array([0, 0, 1, 1]), ix[inside, None] + np.array([0, 1, 0, 1])]
+            weights = np.column_stack([(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy])
+        else:
+            raise ValueError(f"Unknown lookup method: {method}")
+
+        missing = (indices < 0).any(axis=1)
+        safe = np.where(indices < 0, 0, indices)
+        result = {}
+        for name in ("z", "weibull_a", "weibull_k", "power_density"):
+            values = (getattr(self, name)[safe] * weights).sum(axis=1)
+            result[name] = np.where(missing, np.nan, values)
+        for name in SECTOR_SCALES:
+            values = (getattr(self, name)[safe] * weights[:, :, None]).sum(axis=1)
+            result[name] = np.where(missing[:, None], np.nan, values)
+        return result
+
+
+def get_mean_wind_speed(sector_frequency, sector_a, sector_k):
+    """ Mean wind speed of sectorwise Weibull distributions, sum over sectors of f A Gamma(1 + 1/k)
+    Args:
+    sector_frequency, sector_a, sector_k: numpy arrays
+        Positions x sectors, e.g. from ResourceGrid.lookup
+    """
+    gamma = np.vectorize(math.gamma, otypes=[float])
+    sector_k = np.asarray(sector_k, dtype=float)
+    valid = sector_k > 0
+    sector_mean = np.where(valid, np.asarray(sector_a) * gamma(1.0 + 1.0 / np.where(valid, sector_k, 1.0)), 0.0)
+    return (np.asarray(sector_frequency) * sector_mean).sum(axis=-1)
+
+
+def _get_number_of_sectors(line, path):
+    tokens = line[NAME_WIDTH:].split()
+    number_of_sectors = (len(tokens) - len(RECORD_COLUMNS)) // 3
+    if number_of_sectors > 0 and len(tokens) == len(RECORD_COLUMNS) + 3 * number_of_sectors \
+            and float(tokens[len(RECORD_COLUMNS) - 1]) == number_of_sectors:
+        return number_of_sectors
+    try:
+        # numbers running into each other, at the nominal column
+        return int(line[NAME_WIDTH + sum(RECORD_WIDTHS[:-1]):NAME_WIDTH + sum(RECORD_WIDTHS)])
+    except ValueError:
+        raise ValueError(f"{path}: no number of sectors in the records") from None
+
+
+def _parse_integer_columns(characters, widths):
+    """ Parse right aligned integer columns of a (..., sum(widths)) uint8 array of characters with digit arithmetic,
+    much faster than converting text. None if there is anything but digits and spaces, or a column ends in a space.
+    """
+    digits = characters - np.uint8(ord("0"))  # spaces wrap round to large values
+    is_digit = digits < 10
+    if not (is_digit | (characters == ord(" "))).all():
+        return None
+    digits *= is_digit
+    values = np.zeros(characters.shape[:-1] + (len(widths),), dtype=np.int32)
+    start = 0
+    for i, w in enumerate(widths):
+        if not is_digit[..., start + w - 1].all():
+            return None
+        for j in range(start, start + w):
+            values[..., i] *= 10
+            values[..., i] += digits[..., j]
+        start += w
+    return values
+
+
+def _parse_numbers(texts, count, widths, path):
+    """ Parse count numbers from each text, split by whitespace, or at the nominal column widths if they run together """
+    try:
+        values = np.fromstring(b" ".join(texts), dtype=np.float64, sep=" ")
+    except ValueError:
+        values = np.empty(0)
+    if len(values) == count * len(texts):
+        return values.reshape(len(texts), count)
+    width = sum(widths)
+    characters = np.frombuffer(b"".join(t.ljust(width)[:width] for t in texts), dtype=np.uint8).reshape(len(texts), width)
+    values = np.empty((len(texts), len(widths)))
+    start = 0
+    try:
+        for i, w in enumerate(widths):
+            values[:, i] = np.ascontiguousarray(characters[:, start:start + w]).view(f"S{w}")[:, 0].astype(np.float64)
+            start += w
+    except ValueError:
+        raise ValueError(f"{path}: records aren't whitespace separated or at the WAsP fixed width columns") from None
+    return values
+
+
+def _parse_records(lines, path):
+    """ Parse a chunk of records, lines of bytes, into a dict of arrays """
+    lines = [line.rstrip(b"\r\n") for line in lines]
+    number_of_sectors = _get_number_of_sectors(lines[0], path)
+    sector_width = sum(SECTOR_WIDTHS) * number_of_sectors
+    names = np.frombuffer(b"".join(line[:NAME_WIDTH].ljust(NAME_WIDTH) for line in lines), dtype=f"S{NAME_WIDTH}")
+    records = {"names": np.char.strip(names.astype(f"U{NAME_WIDTH}"))}
+
+    # the sectors are the last characters of each record, integers at fixed widths
+    sectors = None
+    if all(len(line) >= NAME_WIDTH + sector_width for line in lines):
+        characters = np.frombuffer(b"".join(line[-sector_width:] for line in lines), dtype=np.uint8)
+        sectors = _parse_integer_columns(characters.reshape(len(lines), number_of_sectors, sum(SECTOR_WIDTHS)), SECTOR_WIDTHS)
+    if sectors is None:
+        widths = RECORD_WIDTHS + SECTOR_WIDTHS * number_of_sectors
+        values = _parse_numbers([line[NAME_WIDTH:] for line in lines], len(widths), widths, path)
+        sectors = values[:, len(RECORD_WIDTHS):].reshape(len(lines), number_of_sectors, 3)
+    else:
+        values = _parse_numbers([line[NAME_WIDTH:-sector_width] for line in lines], len(RECORD_WIDTHS), RECORD_WIDTHS, path)
+
+    for i, name in enumerate(RECORD_COLUMNS[:-1]):
+        records[name] = values[:, i]
+    for i, (name, scale) in enumerate(SECTOR_SCALES.items()):
+        records[name] = sectors[:, :, i] / scale
+    return records
+
+
+def _read_records(path, header_lines, dtype, chunk_bytes):
+    """ Read the records of a .wrg or .rsf file into arrays, in one pass over the file
+    The file is read chunk_bytes at a time, and each chunk parsed into arrays, so the text of a national scale grid
+    is never held in memory at once. Sector arrays are stored as dtype.
+    """
+    chunks = []
+    with open(path, "rb") as f:
+        header = [f.readline().decode() for _ in range(header_lines)]
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            lines = [line for line in lines if line.strip()]
+            if lines:
+                records = _parse_records(lines, path)
+                for name in SECTOR_SCALES:
+                    records[name] = records[name].astype(dtype)
+                chunks.append(records)
+    if not chunks:
+        raise ValueError(f"{path}: no records")
+    records = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    return header, records
+
+
+def read_wrg(path, dtype=np.float32, chunk_bytes=16 * 2**20):
+    """ Read a WAsP resource grid (.wrg) file
+    Args:
+    path: str
+        Path of the .wrg file
+    dtype: numpy dtype, default: np.float32
+        Type of the sector frequency, A and k arrays, points x sectors. float32 halves the memory of national scale grids.
+    chunk_bytes: int, default: 16 MB
+        Size of the text read and parsed at a time
+    Returns a ResourceGrid
+    """
+    header, output = _read_records(path, 1, dtype, chunk_bytes)
+    nx, ny, xmin, ymin, cell_size = header[0].split()[:5]
+    return ResourceGrid(**output, grid_header=(int(nx), int(ny), float(xmin), float(ymin), float(cell_size)))
+
+
+def read_rsf(path, dtype=np.float32, chunk_bytes=16 * 2**20):
+    """ Read a WAsP resource file (.rsf), the resource at a list of points, e.g. turbine positions or a grid
+    Args:
+    path: str
+        Path of the .rsf file
+    dtype: numpy dtype, default: np.float32
+        Type of the sector frequency, A and k arrays, points x sectors
+    chunk_bytes: int, default: 16 MB
+        Size of the text read and parsed at a time
+    Returns a ResourceGrid
+    """
+    _, output = _read_records(path, 0, dtype, chunk_bytes)
+    return ResourceGrid(**output)
+
+
+def read_resource_file(path, **kwargs):
+    """ Read a .wrg or .rsf file, by its extension
+    """
+    if path.lower().endswith(".wrg"):
+        return read_wrg(path, **kwargs)
+    if path.lower().endswith(".rsf"):
+        return read_rsf(path, **kwargs)
+    raise ValueError(f"Not a .wrg or .rsf file: {path}")
@@ -1,5 +1,7 @@
 import os
 import sys
+import numpy as np
+import pandas as pd
 import pythonnet
 import clr_loader
 
@@ -68,4 +70,85 @@ class Sdk:
     def Toolbox(self):
         """ The toolbox
         """
-        return self._Toolbox
\ No newline at end of file
+        return self._Toolbox
+
+    def get_turbine_yields(self, scenario, variants=("Gross", "Full"), farm_names=None, turbine_names=None, divisor=1e6, as_dataframe=True):
+        """ Read per turbine yields of an energy calculation result, for several yield variants, in one pass
+        Each variant result is fetched once, and the turbines are enumerated once, rather than per turbine and variant.
+        Args:
+        scenario: Scenario
+            The result of Toolbox.CalculateEnergy()
+        variants: sequence of str, default: ("Gross", "Full")
+            Names of the yield variants to read, as used by TurbineTotalYields.GetVariantResult
+        farm_names: sequence of str, default: None
+            Only read turbines of these wind farms. All farms, including neighbours, if None.
+        turbine_names: sequence of str, default: None
+            Only read these turbines, and return them in this order, with NaN for names not found. All turbines if None.
+        divisor: float, default: 1e6
+            Yields are divided by this, the default converts to MWh/yr
+        as_dataframe: bool, default: True
+            If True return a DataFrame indexed by turbine name, with a Farm column, one column per variant and,
+            if Gross is read, an efficiency column (variant / Gross) for each other variant.
+            If False return the list of turbine names and a numpy array of yields, turbines x variants.
+        """
+        farm_filter = None if farm_names is None else set(farm_names)
+        farms = []
+        turbines = []
+        names = []
+        for farm in scenario.WindFarms:
+            if farm_filter is not None and farm.Name not in farm_filter:
+                continue
+            for turbine in farm.Turbines:
+                farms.append(farm.Name)
+                turbines.append(turbine)
+                names.append(turbine.Name)
+
+        if turbine_names is not None:
+            # set based lookup of the requested order, rather than a list membership test per turbine
+            position = {name: i for i, name in enumerate(turbine_names)}
+            selected = [(position[name], turbine) for name, turbine in zip(names, turbines) if name in position]
+            rows = np.array([i for i, _ in selected], dtype=int)
+            turbines = [turbine for _, turbine in selected]
+            farm_of = dict(zip(names, farms))
+            names = list(turbine_names)
+            farms = [farm_of.get(name) for name in names]
+            values = np.full((len(names), len(variants)), np.nan)
+        else:
+            rows = np.arange(len(turbines))
+            values = np.empty((len(turbines), len(variants)))
+
+        for j, variant in enumerate(variants):
+            get_value_for_turbine = scenario.TurbineTotalYields.GetVariantResult(variant).GetValueForTurbine
+            values[rows, j] = np.fromiter((get_value_for_turbine(t).Value for t in turbines), dtype=float, count=len(turbines))
+        values /= divisor
+
+        if not as_dataframe:
+            return names, values
+        df = pd.DataFrame(values, index=pd.Index(names, name="Turbine"), columns=list(variants))
+        df.insert(0, "Farm", farms)
+        if "Gross" in variants:
+            for variant in variants:
+                if variant != "Gross":
+                    df[f"{variant} efficiency"] = df[variant] / df["Gross"]
+        return df
+
+    def get_farm_yields(self, scenario, variants=("Gross", "Full"), farm_names=None, divisor=1e6):
+        """ Read per wind farm yields of an energy calculation result, for several yield variants
+        Args:
+        scenario: Scenario
+            The result of Toolbox.CalculateEnergy()
+        variants: sequence of str, default: ("Gross", "Full")
+            Names of the yield variants to read, as used by FarmTotalYields.GetVariantResult
+        farm_names: sequence of str, default: None
+            Only read these wind farms, all if None.
+        divisor: float, default: 1e6
+            Yields are divided by this, the default converts to MWh/yr
+        Returns a DataFrame indexed by farm name with one column per variant.
+        """
+        farm_filter = None if farm_names is None else set(farm_names)
+        farms = [f for f in scenario.WindFarms if farm_filter is None or f.Name in farm_filter]
+        values = np.empty((len(farms), len(variants)))
+        for j, variant in enumerate(variants):
+            get_value_for_farm = scenario.FarmTotalYields.GetVariantResult(variant).GetValueForFarm
+            values[:, j] = np.fromiter((get_value_for_farm(f).Value for f in farms), dtype=float, count=len(farms))
+        return pd.DataFrame(values / divisor, index=pd.Index([f.Name for f in farms], name="Farm"), columns=list(variants))
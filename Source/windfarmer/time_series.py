@@ -0,0 +1,198 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from windfarmer.wind_climate import get_speed_bin_centres, make_wind_climate
+
+# the wind speed bins of the AEP API examples, 0-0.5, 0.5-1.5, ... 48.5-49.5 m/s
+DEFAULT_WIND_SPEED_BIN_UPPER_LIMITS = np.arange(0.5, 50.0, 1.0)
+# padding values of WindFarmer time series files, and blanks
+DEFAULT_MISSING_VALUES = ["9999", "9999.0", "9999.0000", "99999", "-9999", "-999", ""]
+
+
+def _get_climate_columns(climate):
+    """ The speed, direction and speed standard deviation columns of a climate given as a column name or a dict """
+    if isinstance(climate, str):
+        return climate, None, None
+    return climate["speed"], climate.get("direction"), climate.get("speed_std")
+
+
+def get_bin_indices(speeds, directions, upper_limits, number_of_sectors, direction_for_first_bin_centre):
+    """ Flat index, sector x number of speed bins + speed bin, of each valid record, and the mask of the valid records
+    Records are valid with a wind speed from 0 to the last bin upper limit (faster is taken as a bad value, e.g.
+    padding, rather than binned) and, if directions are given, a direction. Without directions all are in sector 0.
+    Args:
+    speeds, directions: numpy arrays
+        Wind speeds in m/s and directions in degrees, any shape, or None for no directions
+    upper_limits: numpy array
+        Upper limits of the wind speed bins, the first starting at 0
+    number_of_sectors: int
+        Number of direction sectors
+    direction_for_first_bin_centre: float
+        Centre of the first direction sector, degrees
+    Returns (flat index of the valid records, valid mask of the shape of speeds)
+    """
+    valid = np.isfinite(speeds) & (speeds >= 0) & (speeds <= upper_limits[-1])
+    if directions is not None:
+        valid &= np.isfinite(directions)
+    speed_bin = np.searchsorted(upper_limits, speeds[valid], side="left")
+    if directions is None:
+        return speed_bin, valid
+    width = 360.0 / number_of_sectors
+    sector = np.floor(((directions[valid] - direction_for_first_bin_centre + 0.5 * width) % 360.0) / width).astype(np.int64)
+    sector = np.minimum(sector, number_of_sectors - 1)
+    return sector * len(upper_limits) + speed_bin, valid
+
+
+def _accumulate(table, speeds, directions, speed_stds, upper_limits, number_of_sectors, direction_for_first_bin_centre):
+    """ Add the records of a chunk into the counts of a frequency table, sectors x speed bins, with bincount """
+    flat, valid = get_bin_indices(speeds, directions, upper_limits, number_of_sectors, direction_for_first_bin_centre)
+    table["records"] += len(speeds)
+    table["valid_records"] += int(valid.sum())
+    speeds = speeds[valid]
+    size = table["counts"].size
+    table["counts"] += np.bincount(flat, minlength=size).reshape(table["counts"].shape)
+    if speed_stds is not None:
+        turbulence_intensity = speed_stds[valid] / np.where(speeds > 0, speeds, np.nan)
+        has_turbulence = np.isfinite(turbulence_intensity)
+        table["turbulence_counts"] += np.bincount(flat[has_turbulence], minlength=size).reshape(table["counts"].shape)
+        table["turbulence_sums"] += np.bincount(flat[has_turbulence], weights=turbulence_intensity[has_turbulence],
+                                                minlength=size).reshape(table["counts"].shape)
+
+
+def make_frequency_table(number_of_sectors, wind_speed_bin_upper_limits, direction_for_first_bin_centre,
+                         with_turbulence=False, counts=None, records=0, valid_records=0):
+    """ An empty frequency table, or one of counts (sectors x speed bins) already found
+    """
+    upper_limits = np.asarray(wind_speed_bin_upper_limits, dtype=float)
+    shape = (number_of_sectors, len(upper_limits))
+    table = {
+        "counts": np.zeros(shape, dtype=np.int64) if counts is None else counts,
+        "records": records,
+        "valid_records": valid_records,
+        "wind_speed_bin_upper_limits": upper_limits,
+        "direction_for_first_bin_centre": direction_for_first_bin_centre,
+    }
+    if with_turbulence:
+        table["turbulence_sums"] = np.zeros(shape)
+        table["turbulence_counts"] = np.zeros(shape, dtype=np.int64)
+    return table
+
+
+def build_frequency_tables(path, climates, wind_speed_bin_upper_limits=DEFAULT_WIND_SPEED_BIN_UPPER_LIMITS,
+                           number_of_sectors=12, direction_for_first_bin_centre=0.0, chunk_size=500_000,
+                           delimiter="\t", missing_values=DEFAULT_MISSING_VALUES):
+    """ Count the records of a time series file in direction sector x wind speed bins, streaming it in chunks
+    Only the columns used are parsed, and memory stays constant however long the record. Time stamps aren't parsed.
+    Args:
+    path: str
+        Path of a delimited time series file with a header row, e.g. Date/Time and value columns
+    climates: dict
+        Frequency tables to build in the one pass over the file, e.g. one per height, by name. Each is a wind speed column
+        name, or a dict of "speed" and optionally "direction" and "speed_std" column names. Without a direction column,
+        all records are in one sector. With a speed standard deviation column, the mean turbulence intensity is also
+        found for each bin.
+    wind_speed_bin_upper_limits: array like, default: 0.5, 1.5, ... 49.5 m/s
+        Upper limits of the wind speed bins, the first starting at 0. Faster records aren't valid.
+    number_of_sectors: int, default: 12
+        Number of direction sectors
+    direction_for_first_bin_centre: float, default: 0.0
+        Centre of the first direction sector, degrees
+    chunk_size: int, default: 500000
+        Number of rows parsed at a time
+    delimiter: str, default: tab
+        Column delimiter
+    missing_values: list of str, default: DEFAULT_MISSING_VALUES
+        Values taken as missing
+    Returns a dict, by climate name, of frequency tables: dicts of counts (sectors x speed bins), records, valid_records,
+    the binning and, with a speed standard deviation column, turbulence_sums and turbulence_counts
+    """
+    upper_limits = np.asarray(wind_speed_bin_upper_limits, dtype=float)
+    columns = {name: _get_climate_columns(climate) for name, climate in climates.items()}
+    used_columns = sorted({c for cols in columns.values() for c in cols if c is not None})
+
+    tables = {name: make_frequency_table(number_of_sectors if direction is not None else 1, upper_limits,
+                                         direction_for_first_bin_centre, speed_std is not None)
+              for name, (_, direction, speed_std) in columns.items()}
+
+    reader = pd.read_csv(path, sep=delimiter, usecols=used_columns, chunksize=chunk_size,
+                         na_values=missing_values, keep_default_na=True, low_memory=False)
+    for chunk in reader:
+        values = {c: pd.to_numeric(chunk[c], errors="coerce").to_numpy(dtype=float) for c in used_columns}
+        for name, (speed, direction, speed_std) in columns.items():
+            _accumulate(tables[name], values[speed], None if direction is None else values[direction],
+                        None if speed_std is None else values[speed_std], upper_limits, tables[name]["counts"].shape[0],
+                        direction_for_first_bin_centre)
+    return tables
+
+
+def _build_frequency_tables_in_worker(args):
+    path, climates, kwargs = args
+    return build_frequency_tables(path, climates, **kwargs)
+
+
+def build_frequency_tables_of_files(files, processes=None, **kwargs):
+    """ Build the frequency tables of many time series files in parallel
+    Args:
+    files: dict
+        climates, as for build_frequency_tables, by file path
+    processes: int, default: None
+        Number of worker processes, one per CPU if None, or 0 to build them in this process
+    kwargs:
+        Passed to build_frequency_tables
+    Returns a dict, by file path, of the frequency tables of each file
+    """
+    jobs = [(path, climates, kwargs) for path, climates in files.items()]
+    if processes == 0 or len(jobs) <= 1:
+        results = [_build_frequency_tables_in_worker(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_build_frequency_tables_in_worker, jobs))
+    return dict(zip(files, results))
+
+
+def merge_frequency_tables(tables):
+    """ Add up frequency tables with the same binning, e.g. of consecutive files of one record
+    """
+    merged = {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in tables[0].items()}
+    for table in tables[1:]:
+        for key in ["counts", "records", "valid_records", "turbulence_sums", "turbulence_counts"]:
+            if key in merged:
+                merged[key] = merged[key] + table[key]
+    return merged
+
+
+def get_turbulence_intensity(table):
+    """ Mean turbulence intensity of each bin of a frequency table, sectors x speed bins, None if not found
+    Bins without records take the value of the nearest speed bin of the sector with records, or of all sectors.
+    """
+    if "turbulence_sums" not in table:
+        return None
+    with np.errstate(invalid="ignore", divide="ignore"):
+        turbulence_intensity = table["turbulence_sums"] / table["turbulence_counts"]
+        all_sectors = table["turbulence_sums"].sum(axis=0) / table["turbulence_counts"].sum(axis=0)
+    speeds = get_speed_bin_centres(table["wind_speed_bin_upper_limits"])
+    fallback = all_sectors if np.isfinite(all_sectors).any() else np.zeros_like(all_sectors)
+    has_fallback = np.isfinite(fallback)
+    fallback = np.interp(speeds, speeds[has_fallback], fallback[has_fallback]) if has_fallback.any() else fallback
+    for i, row in enumerate(turbulence_intensity):
+        found = np.isfinite(row)
+        turbulence_intensity[i] = np.interp(speeds, speeds[found], row[found]) if found.any() else fallback
+    return turbulence_intensity
+
+
+def to_wind_climate(table, wind_climate_id, easting, northing, height_above_ground, terrain_height_above_sea_level=0.0):
+    """ Make a windClimates block of a WindFarmer API AEP input from a frequency table
+    Args:
+    table: dict
+        A frequency table, as from build_frequency_tables
+    wind_climate_id: str
+        Id of the wind climate
+    easting, northing, height_above_ground, terrain_height_above_sea_level: float
+        Location of the mast and height of the measurement, m
+    Returns the windClimates block, a dict
+    """
+    if table["valid_records"] == 0:
+        raise ValueError(f"No valid records for wind climate {wind_climate_id}")
+    return make_wind_climate(wind_climate_id, easting, northing, terrain_height_above_sea_level, height_above_ground,
+                             table["direction_for_first_bin_centre"], table["wind_speed_bin_upper_limits"],
+                             table["counts"], get_turbulence_intensity(table))
@@ -0,0 +1,213 @@
+import os
+import glob
+import numpy as np
+
+
+def _parse_numbers(lines):
+    """ Parse whitespace separated numbers of lines with the same number of values into a 2D array, in one step """
+    return np.array(" ".join(lines).split(), dtype=float).reshape(len(lines), -1)
+
+
+def read_tab(path):
+    """ Read a WAsP observed wind climate (.tab) frequency table
+    Args:
+    path: str
+        Path of the .tab file
+    Returns a dict of title, easting_m, northing_m, height_m, number_of_sectors, direction_offset_degrees,
+    wind_speed_bin_upper_limits (m/s), sector_frequency (fractions) and frequency (speed bins x sectors, fraction of each sector)
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    easting, northing, height = (float(v) for v in lines[1].split()[:3])
+    number_of_sectors, speed_factor, direction_offset = lines[2].split()[:3]
+    number_of_sectors = int(number_of_sectors)
+    sector_frequency = np.array(lines[3].split()[:number_of_sectors], dtype=float)
+    table = _parse_numbers(lines[4:])
+    if table.shape[1] != number_of_sectors + 1:
+        raise ValueError(f"{path}: {table.shape[1] - 1} frequency columns, expected {number_of_sectors}")
+    return {
+        "title": lines[0],
+        "easting_m": easting,
+        "northing_m": northing,
+        "height_m": height,
+        "number_of_sectors": number_of_sectors,
+        "direction_offset_degrees": float(direction_offset),
+        "wind_speed_bin_upper_limits": table[:, 0] * float(speed_factor),
+        "sector_frequency": sector_frequency / sector_frequency.sum(),
+        "frequency": table[:, 1:] / 1000.0,
+    }
+
+
+def read_wti(path):
+    """ Read a turbulence intensity (.wti) file, as written by MCP+ / Windographer
+    Args:
+    path: str
+        Path of the .wti file
+    Returns a dict of directions (degrees, sector centres), wind_speeds (m/s, bin centres), turbulence_intensity and,
+    if in the file, turbulence_intensity_sigma (wind speeds x directions, fractions)
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    number_of_sectors = int(lines[1].split()[0])
+    # blocks of consecutive data rows, each after a commented header row of the directions
+    blocks = []
+    directions = None
+    rows = []
+    for line in lines[2:]:
+        if line.startswith("#"):
+            if rows:
+                blocks.append(rows)
+                rows = []
+            values = line[1:].split()
+            if directions is None and len(values) == number_of_sectors:
+                try:
+                    directions = np.array(values, dtype=float)
+                except ValueError:
+                    pass
+        else:
+            rows.append(line)
+    if rows:
+        blocks.append(rows)
+    if not blocks:
+        raise ValueError(f"{path}: no turbulence intensity table")
+    if directions is None:
+        directions = np.arange(number_of_sectors) * 360.0 / number_of_sectors
+    tables = [_parse_numbers(block) for block in blocks[:2]]
+    result = {
+        "directions": directions,
+        "wind_speeds": tables[0][:, 0],
+        "turbulence_intensity": tables[0][:, 1:] / 100.0,
+    }
+    if len(tables) > 1:
+        result["turbulence_intensity_sigma"] = tables[1][:, 1:]
+    return result
+
+
+def get_speed_bin_centres(upper_limits):
+    """ Centres of wind speed bins from their upper limits, the first bin starting at 0 m/s
+    """
+    upper_limits = np.asarray(upper_limits, dtype=float)
+    lower_limits = np.concatenate([[0.0], upper_limits[:-1]])
+    return 0.5 * (lower_limits + upper_limits)
+
+
+def interpolate_turbulence_intensity(wti, wind_speeds, directions):
+    """ Turbulence intensity of a .wti table at other wind speeds and directions, e.g. the bins of a .tab file
+    Linear in wind speed, constant beyond the table, and periodic linear in direction.
+    Args:
+    wti: dict
+        As from read_wti
+    wind_speeds: array like
+        Wind speeds, m/s
+    directions: array like
+        Directions, degrees
+    Returns an array of directions x wind speeds, as turbulenceIntensity of windClimates
+    """
+    table = wti["turbulence_intensity"]
+    # all directions at once: interpolate the flat index of the speeds in the table, then the table along it
+    speed_position = np.interp(wind_speeds, wti["wind_speeds"], np.arange(len(wti["wind_speeds"])))
+    lower = np.floor(speed_position).astype(int)
+    upper = np.minimum(lower + 1, len(wti["wind_speeds"]) - 1)
+    weight = speed_position - lower
+    at_speeds = table[lower, :] * (1 - weight)[:, None] + table[upper, :] * weight[:, None]  # speeds x table directions
+
+    table_directions = np.asarray(wti["directions"], dtype=float)
+    order = np.argsort(table_directions % 360.0)
+    periodic_directions = np.concatenate([table_directions[order] % 360.0, [table_directions[order][0] % 360.0 + 360.0]])
+    periodic_values = np.concatenate([at_speeds[:, order], at_speeds[:, order[:1]]], axis=1)
+    directions = np.asarray(directions, dtype=float) % 360.0
+    directions = np.where(directions < periodic_directions[0], directions + 360.0, directions)
+    position = np.interp(directions, periodic_directions, np.arange(len(periodic_directions)))
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, len(periodic_directions) - 1)
+    weight = position - lower
+    return (periodic_values[:, lower] * (1 - weight) + periodic_values[:, upper] * weight).T
+
+
+def make_wind_climate(wind_climate_id, easting, northing, terrain_height_above_sea_level, height_above_ground,
+                      direction_for_first_bin_centre, wind_speed_bin_upper_limits, probability, turbulence_intensity=None):
+    """ Make a windClimates block of a WindFarmer API AEP input
+    Args:
+    probability: numpy array
+        Joint probability of each direction sector and wind speed bin, sectors x speed bins, normalised here
+    turbulence_intensity: numpy array, default: None
+        Sectors x speed bins. Left out if None.
+    Returns the windClimates block, a dict
+    """
+    probability = np.asarray(probability, dtype=float)
+    wind_climate = {
+        "id": wind_climate_id,
+        "location": {
+            "easting_m": float(easting),
+            "northing_m": float(northing),
+            "terrainHeightAboveSeaLevel_m": float(terrain_height_above_sea_level),
+        },
+        "heightAboveGround_m": float(height_above_ground),
+        "numberOfDirectionSectors": probability.shape[0],
+        "directionForFirstBinCentre_degrees": float(direction_for_first_bin_centre),
+        "windSpeedBinUpperLimits_m_per_s": np.asarray(wind_speed_bin_upper_limits, dtype=float).tolist(),
+        "probabilityDistribution": (probability / probability.sum()).tolist(),
+    }
+    if turbulence_intensity is not None:
+        wind_climate["turbulenceIntensity"] = np.asarray(turbulence_intensity, dtype=float).tolist()
+    return wind_climate
+
+
+def to_wind_climate(tab, wti=None, wind_climate_id=None, terrain_height_above_sea_level=0.0):
+    """ Make a windClimates block of a WindFarmer API AEP input from a .tab table, and optionally a .wti table
+    Args:
+    tab: dict or str
+        As from read_tab, or the path of a .tab file
+    wti: dict or str, default: None
+        As from read_wti, or the path of a .wti file, for the turbulenceIntensity. Left out if None.
+    wind_climate_id: str, default: None
+        Id of the wind climate. The .tab file name if None and tab is a path, else its title.
+    terrain_height_above_sea_level: float, default: 0.0
+        Elevation of the mast, not in .tab files
+    Returns the windClimates block, a dict
+    """
+    if isinstance(tab, str):
+        if wind_climate_id is None:
+            wind_climate_id = os.path.splitext(os.path.basename(tab))[0]
+        tab = read_tab(tab)
+    if isinstance(wti, str):
+        wti = read_wti(wti)
+    number_of_sectors = tab["number_of_sectors"]
+    # joint probability of each direction sector and wind speed bin, sectors x speed bins
+    probability = tab["sector_frequency"][:, None] * tab["frequency"].T
+    turbulence_intensity = None
+    if wti is not None:
+        directions = tab["direction_offset_degrees"] + np.arange(number_of_sectors) * 360.0 / number_of_sectors
+        speeds = get_speed_bin_centres(tab["wind_speed_bin_upper_limits"])
+        turbulence_intensity = interpolate_turbulence_intensity(wti, speeds, directions)
+    return make_wind_climate(wind_climate_id if wind_climate_id is not None else tab["title"],
+                             tab["easting_m"], tab["northing_m"], terrain_height_above_sea_level, tab["height_m"],
+                             tab["direction_offset_degrees"], tab["wind_speed_bin_upper_limits"], probability,
+                             turbulence_intensity)
+
+
+def convert_directory(folder, wti_files=None, terrain_heights=None):
+    """ Make windClimates blocks of all the .tab files in a folder
+    Args:
+    folder: str
+        Folder of .tab files, and .wti files of the same name
+    wti_files: dict, default: None
+        .wti file name (in the folder) of each .tab file name, where they aren't the same name. Use None to leave out
+        the turbulence intensity of a .tab file.
+    terrain_heights: dict, default: None
+        Mast elevation, m above sea level, of each .tab file name. 0 where not given.
+    Returns a list of windClimates blocks, with ids of the .tab file names, sorted
+    """
+    wti_files = wti_files or {}
+    terrain_heights = terrain_heights or {}
+    wind_climates = []
+    for tab_path in sorted(glob.glob(os.path.join(folder, "*.tab"))):
+        name = os.path.splitext(os.path.basename(tab_path))[0]
+        if name in wti_files:
+            wti_path = None if wti_files[name] is None else os.path.join(folder, wti_files[name])
+        else:
+            wti_path = os.path.join(folder, name + ".wti")
+            if not os.path.exists(wti_path):
+                wti_path = None
+        wind_climates.append(to_wind_climate(tab_path, wti_path, name, terrain_heights.get(name, 0.0)))
+    return wind_climates